@@ -150,9 +150,9 @@ export default function ResourceManagementPage() {
             const idToken = tokens.idToken;
             if (!idToken) throw new Error('No ID token. Please log in again.');
 
-            // Build update payload: url array contains the thumbnailLink
+            // Build update payload: address the item by its fileId (works for audio and video too)
             const payload = {
-                url: [item.thumbnailLink!],
+                fileIds: [item.id],
                 operation: editOperation,
                 tags: [{ name: editTagName.trim().toLowerCase(), count: editTagCount }],
             };
@@ -8,7 +8,13 @@ import {useAuthTokens, Tokens} from '@/hooks/useAuthTokens';
 import {useCurrentUser} from '@/hooks/useCurrentUser';
 import Navbar from '@/components/Navbar';
 
-const MAX_FILE_SIZE = 2 * 1024 * 1024; // 2MB
+const MAX_FILE_SIZE = 100 * 1024 * 1024; // 100MB
+// Larger files go to S3 first so they stay clear of the API and Lambda payload limits
+const DIRECT_UPLOAD_LIMIT = 4 * 1024 * 1024; // 4MB
+// Uploaded media is tagged as a job; its status is polled until the matches are ready
+const JOB_POLL_INTERVAL = 2000; // ms
+// longer than the server's JOB_STALE_SECONDS, after which a cut-off job reports failed
+const JOB_MAX_WAIT = 20 * 60 * 1000; // ms
 const SUPPORTED_EXTS: Record<string, string> = {
     '.aac': 'audio/aac',
     '.mp3': 'audio/mpeg',
@@ -122,7 +128,7 @@ export default function SearchPage() {
             return;
         }
         if (f.size > MAX_FILE_SIZE) {
-            setError('Max size 2MB');
+            setError('Max size 100MB');
             setFile(null);
             return;
         }
@@ -191,24 +197,40 @@ export default function SearchPage() {
         if (!file) return setError('Select a file');
         setLoading(true);
         try {
-            const reader = new FileReader();
-            reader.onload = async () => {
-                const token = tokens.idToken;
-                if (!token) throw new Error('Missing token');
-                const dataUrl = reader.result as string;
-                const base64 = dataUrl.split(',')[1];
-                const ext = '.' + file.name.split('.').pop()!.toLowerCase();
-                const contentType = SUPPORTED_EXTS[ext];
-                const resp = await fetch(`${API_BASE}/query-by-file`, {
+            const token = tokens.idToken;
+            if (!token) throw new Error('Missing token');
+            const ext = '.' + file.name.split('.').pop()!.toLowerCase();
+            const contentType = SUPPORTED_EXTS[ext];
+            let resp: Response;
+            if (file.size <= DIRECT_UPLOAD_LIMIT) {
+                // Raw bytes; API Gateway base64-encodes them once
+                resp = await fetch(`${API_BASE}/query-by-file`, {
+                    method: 'POST',
+                    headers: {'Content-Type': contentType, Authorization: `Bearer ${token}`},
+                    body: file
+                });
+            } else {
+                const urlResp = await fetch(`${API_BASE}/query-by-file/upload-url`, {
                     method: 'POST',
-                    headers: { 'Content-Type': contentType, Authorization: `Bearer ${token}` },
-                    body: base64
+                    headers: {'Content-Type': 'application/json', Authorization: `Bearer ${token}`},
+                    body: JSON.stringify({contentType})
                 });
-                if (!resp.ok) throw new Error(`HTTP ${resp.status}`);
-                const j: { results: ApiItem[] } = await resp.json();
-                splitResults(j.results);
-            };
-            reader.readAsDataURL(file);
+                if (!urlResp.ok) throw new Error(`HTTP ${urlResp.status}`);
+                const {key, uploadUrl}: { key: string, uploadUrl: string } = await urlResp.json();
+                const put = await fetch(uploadUrl, {method: 'PUT', headers: {'Content-Type': contentType}, body: file});
+                if (!put.ok) throw new Error(`Upload failed: HTTP ${put.status}`);
+                const submit = await fetch(`${API_BASE}/query-by-file`, {
+                    method: 'POST',
+                    headers: {'Content-Type': 'application/json', Authorization: `Bearer ${token}`},
+                    body: JSON.stringify({s3Key: key, contentType, async: true})
+                });
+                if (!submit.ok) throw new Error(`HTTP ${submit.status}`);
+                const {jobId}: { jobId: string } = await submit.json();
+                resp = await pollJob(jobId, token);
+            }
+            if (!resp.ok) throw new Error(`HTTP ${resp.status}`);
+            const j: { results: ApiItem[] } = await resp.json();
+            splitResults(j.results);
         } catch (err: any) {
             console.error(err);
             setError(err.message);
@@ -218,6 +240,22 @@ export default function SearchPage() {
         }
     };
 
+    // poll an asynchronous query-by-file job until it is done or failed
+    const pollJob = async (jobId: string, token: string): Promise<Response> => {
+        const deadline = Date.now() + JOB_MAX_WAIT;
+        while (Date.now() < deadline) {
+            const resp = await fetch(`${API_BASE}/query-by-file/${jobId}`, {
+                headers: {Authorization: `Bearer ${token}`}
+            });
+            if (!resp.ok) return resp;
+            const job: { status: string, error?: string } = await resp.clone().json();
+            if (job.status === 'done') return resp;
+            if (job.status === 'failed') throw new Error(job.error || 'Tagging failed');
+            await new Promise(resolve => setTimeout(resolve, JOB_POLL_INTERVAL));
+        }
+        throw new Error('Tagging is taking too long, please try again later');
+    };
+
     // split items into tabs
     const splitResults = (items: ApiItem[]) => {
         const imgs: ApiItem[] = [];
@@ -307,7 +345,7 @@ export default function SearchPage() {
                                                                                          className="text-gray-600 mr-2"/><span
                                 className="text-gray-800">{file.name}</span></div>}
                             <p className="mt-1 text-sm text-gray-600">Supported: {Object.keys(SUPPORTED_EXTS).join(', ')},
-                                max 2MB</p>
+                                max 100MB</p>
                         </div>
                         {error && <div className="text-red-600 font-medium">{error}</div>}
                         <button type="submit" disabled={loading}
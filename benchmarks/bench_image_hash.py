@@ -0,0 +1,102 @@
+"""
+Micro-benchmark of the query-by-file near-duplicate lookup
+(lambdas/query/image_hash.py) at up to millions of stored image hashes.
+
+Reports the writer's dumps() time, the artifact size, the reader's loads()
+time, and nearest() latency per threshold for near-duplicate queries (the
+stored hash with a few bits flipped) and for misses (random hashes). It also
+times a linear Hamming scan as the baseline.
+
+    python benchmarks/bench_image_hash.py --sizes 100000,1000000 --queries 500
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "lambdas", "query"))
+
+from image_hash import ImageHashIndex  # noqa: E402
+
+def make_hashes(n, seed):
+    rng = random.Random(seed)
+    return {f"{i:08d}-{rng.getrandbits(32):08x}": rng.getrandbits(64) for i in range(n)}
+
+def flip_bits(rng, value, bits):
+    for bit in rng.sample(range(64), bits):
+        value ^= 1 << bit
+    return value
+
+def timed_ms(fn, inputs):
+    latencies = []
+    for arg in inputs:
+        start = time.perf_counter()
+        fn(arg)
+        latencies.append((time.perf_counter() - start) * 1000)
+    latencies.sort()
+    return {
+        "p50_ms": round(latencies[len(latencies) // 2], 3),
+        "p95_ms": round(latencies[int(len(latencies) * 0.95) - 1], 3),
+        "mean_ms": round(statistics.mean(latencies), 3),
+    }
+
+def linear_nearest(items, value, max_distance):
+    best = None
+    for file_id, stored in items:
+        distance = bin(value ^ stored).count("1")
+        if distance <= max_distance and (best is None or (distance, file_id) < best):
+            best = (distance, file_id)
+    return best
+
+def run_size(n, thresholds, query_count, baseline_queries, seed):
+    rng = random.Random(seed + 1)
+    hashes = make_hashes(n, seed)
+    row = {"size": n}
+
+    start = time.perf_counter()
+    data = ImageHashIndex(hashes).dumps()
+    row["dumps_s"] = round(time.perf_counter() - start, 2)
+    row["artifact_mb"] = round(len(data) / 1e6, 1)
+
+    start = time.perf_counter()
+    index = ImageHashIndex.loads(data)
+    row["loads_s"] = round(time.perf_counter() - start, 2)
+
+    stored = rng.sample(sorted(hashes.items()), query_count)
+    for threshold in thresholds:
+        # Near-duplicates sit at half the threshold, like a re-encoded copy
+        near = [flip_bits(rng, value, threshold // 2) for _, value in stored]
+        found = sum(1 for (file_id, _), q in zip(stored, near) if (index.nearest(q, threshold) or ("",))[0] == file_id)
+        row[f"d{threshold}_hit"] = timed_ms(lambda q: index.nearest(q, threshold), near)
+        row[f"d{threshold}_hit"]["recall"] = round(found / query_count, 4)
+        row[f"d{threshold}_miss"] = timed_ms(lambda q: index.nearest(q, threshold), [rng.getrandbits(64) for _ in range(query_count)])
+
+    items = list(hashes.items())
+    row["linear_scan"] = timed_ms(
+        lambda q: linear_nearest(items, q, thresholds[0]), [rng.getrandbits(64) for _ in range(baseline_queries)]
+    )
+    print(f"[{n}] loads={row['loads_s']}s d{thresholds[0]} hit p50={row[f'd{thresholds[0]}_hit']['p50_ms']}ms "
+          f"linear p50={row['linear_scan']['p50_ms']}ms", file=sys.stderr)
+    return row
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="100000,1000000")
+    parser.add_argument("--thresholds", default="4,6,10")
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--baseline-queries", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    thresholds = [int(t) for t in args.thresholds.split(",")]
+    results = [
+        run_size(int(n), thresholds, args.queries, args.baseline_queries, args.seed)
+        for n in args.sizes.split(",")
+    ]
+    print(json.dumps({"config": vars(args), "results": results}, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""
+Per-page CPU cost of turning a 1MB-ish Scan page into matchable records:
+boto3's TypeDeserializer (what the resource API does) vs media_records.decode_page.
+
+    python benchmarks/bench_media_records.py [--items 5000] [--repeat 5]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "lambdas", "shared"))
+
+from corpus import generate_corpus
+from media_records import decode_page
+
+def to_wire(value):
+    if isinstance(value, str):
+        return {"S": value}
+    if isinstance(value, dict):
+        return {"M": {k: to_wire(v) for k, v in value.items()}}
+    if isinstance(value, list):
+        return {"L": [to_wire(v) for v in value]}
+    return {"N": str(value)}
+
+def wire_page(size, seed=42):
+    return [{k: to_wire(v) for k, v in item.items()} for item in generate_corpus(size, seed=seed)]
+
+def deserializer_page(raw_items):
+    from boto3.dynamodb.types import TypeDeserializer
+    deserializer = TypeDeserializer()
+    items = [{k: deserializer.deserialize(v) for k, v in raw.items()} for raw in raw_items]
+    # What the old matchers then built per item
+    return [{t["name"].lower(): int(t["count"]) for t in item.get("tags", [])} for item in items]
+
+def timed(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--items", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    page = wire_page(args.items)
+    fast = timed(lambda: decode_page(page), args.repeat)
+    print(f"decode_page       {args.items:>7} items  {fast:8.2f} ms")
+    try:
+        slow = timed(lambda: deserializer_page(page), args.repeat)
+    except ImportError:
+        print("TypeDeserializer  skipped (boto3 not installed)")
+        return
+    print(f"TypeDeserializer  {args.items:>7} items  {slow:8.2f} ms  ({slow / fast:.1f}x)")
+
+if __name__ == "__main__":
+    main()
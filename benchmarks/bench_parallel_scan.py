@@ -0,0 +1,63 @@
+"""
+Sequential scan vs parallel_scan against the in-memory DynamoDB stand-in.
+
+    python benchmarks/bench_parallel_scan.py [--sizes 10000,100000,1000000] [--page-latency 0.02]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "lambdas", "shared"))
+
+from fake_dynamodb import FakeDynamoDBClient
+from parallel_scan import choose_segment_count, parallel_scan
+
+SPECIES = ["crow", "pigeon", "sparrow", "kingfisher", "owl", "myna", "peacock", "eagle"]
+
+def make_item(i):
+    return {
+        "fileId": f"file-{i:07d}",
+        "type": "image",
+        "tags": [
+            {"name": SPECIES[i % len(SPECIES)], "count": 1 + i % 3},
+            {"name": SPECIES[(i * 7) % len(SPECIES)], "count": 1},
+        ],
+    }
+
+def match_item(item):
+    return any(t["name"] == "crow" and t["count"] >= 2 for t in item["tags"])
+
+def sequential_scan(client, table_name):
+    kwargs = {"TableName": table_name}
+    while True:
+        resp = client.scan(**kwargs)
+        yield resp["Items"]
+        if "LastEvaluatedKey" not in resp:
+            return
+        kwargs["ExclusiveStartKey"] = resp["LastEvaluatedKey"]
+
+def run(label, pages):
+    start = time.perf_counter()
+    scanned = matched = 0
+    for page in pages:
+        scanned += len(page)
+        matched += sum(1 for item in page if match_item(item))
+    elapsed = time.perf_counter() - start
+    print(f"  {label:<22} {elapsed * 1000:10.1f} ms  scanned={scanned} matched={matched}")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="10000,100000,1000000")
+    parser.add_argument("--page-latency", type=float, default=0.02)
+    args = parser.parse_args()
+
+    for size in [int(s) for s in args.sizes.split(",")]:
+        client = FakeDynamoDBClient("BirdMediaTags", size, make_item, page_latency=args.page_latency)
+        segments = choose_segment_count(size * client.item_size_bytes)
+        print(f"{size} items (auto TotalSegments={segments})")
+        run("sequential", sequential_scan(client, "BirdMediaTags"))
+        run("parallel", parallel_scan(client, "BirdMediaTags", total_segments=segments))
+
+if __name__ == "__main__":
+    main()
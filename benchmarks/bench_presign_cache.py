@@ -0,0 +1,67 @@
+"""
+Presigned URL signing throughput with and without PresignedUrlCache.
+
+Signing is done locally by botocore, so dummy credentials are enough:
+
+    python benchmarks/bench_presign_cache.py [--keys 5000] [--rounds 5]
+
+Each round signs the same set of keys, the way repeated searches for a popular
+species re-sign the same objects.
+"""
+import argparse
+import os
+import sys
+import time
+
+import boto3
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "lambdas", "query"))
+
+from presign_cache import PresignedUrlCache
+
+BUCKET = "birdtagbucket-bench"
+
+def sign_uncached(s3_client, keys):
+    for key in keys:
+        s3_client.generate_presigned_url(
+            ClientMethod="get_object",
+            Params={"Bucket": BUCKET, "Key": key},
+            ExpiresIn=3600
+        )
+
+def sign_cached(cache, keys):
+    for key in keys:
+        cache.get_url(BUCKET, key)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--keys", type=int, default=5000)
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+
+    s3_client = boto3.client(
+        "s3",
+        region_name="us-east-1",
+        aws_access_key_id="AKIDEXAMPLE",
+        aws_secret_access_key="wJalrXUtnFEMI/K7MDENG+bPxRfiCYEXAMPLEKEY"
+    )
+    keys = [f"images/{i:08d}.jpg" for i in range(args.keys)]
+    cache = PresignedUrlCache(s3_client, max_entries=args.keys)
+    signs = args.keys * args.rounds
+
+    start = time.perf_counter()
+    for _ in range(args.rounds):
+        sign_uncached(s3_client, keys)
+    uncached = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(args.rounds):
+        sign_cached(cache, keys)
+    cached = time.perf_counter() - start
+
+    print(f"{signs} URLs ({args.keys} keys x {args.rounds} rounds)")
+    print(f"  uncached {signs / uncached:12.0f} URLs/s")
+    print(f"  cached   {signs / cached:12.0f} URLs/s  {cache.stats()}")
+
+if __name__ == "__main__":
+    main()
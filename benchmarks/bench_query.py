@@ -0,0 +1,276 @@
+"""
+End-to-end benchmark of lambdas/query/query.py against a local AWS stand-in.
+
+Generates a synthetic corpus (benchmarks/corpus.py), loads it into moto's
+in-process DynamoDB and S3 together with the species index table and bitmap
+index, then times lambda_handler for /query, /find and /find-full-image under
+each read path:
+
+  scan    - species index and bitmap disabled (parallel/paged table scan)
+  index   - BirdSpeciesIndex lookups + BatchGetItem
+  bitmap  - S3 bitmap index + BatchGetItem
+  cached  - bitmap path with the warm result cache enabled
+
+The report is JSON with p50/p95 latency, DynamoDB items read and response
+bytes per request, so runs can be diffed to catch regressions:
+
+    pip install -r benchmarks/requirements.txt
+    python benchmarks/bench_query.py --sizes 1000,10000 --requests 50 --out report.json
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+
+import boto3
+from moto import mock_aws
+
+from corpus import generate_corpus, sample_species
+
+QUERY_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "lambdas", "query")
+# Packaged next to the query code in the Lambda zip
+SHARED_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "lambdas", "shared")
+QUERY_MODULES = [
+    "query", "media_records", "parallel_scan", "presign_cache", "result_cache", "s3_object_loader", "scan_planner",
+    "species_bitmap", "species_stats", "species_vocabulary", "tag_stats", "top_k",
+]
+
+REGION       = "us-east-1"
+TABLE_NAME   = "BirdMediaTags"
+INDEX_TABLE  = "BirdSpeciesIndex"
+META_TABLE   = "BirdQueryMeta"
+BUCKET_NAME  = "birdtagbucket-bench"
+BITMAP_KEY   = "indexes/species_bitmap.bin"
+SCENARIOS    = ["scan", "index", "bitmap", "cached"]
+
+class ReadMeter:
+    """
+    Counts DynamoDB items read and response bytes via botocore's after-call event.
+    """
+
+    def __init__(self):
+        self.items = 0
+        self.bytes = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, http_response=None, parsed=None, **kwargs):
+        parsed = parsed or {}
+        items = parsed.get("ScannedCount")
+        if items is None:
+            items = sum(len(v) for v in parsed.get("Responses", {}).values()) or len(parsed.get("Items", []))
+            if "Item" in parsed:
+                items += 1
+        with self._lock:
+            self.items += items
+            self.bytes += len(getattr(http_response, "content", b"") or b"")
+
+    def take(self):
+        with self._lock:
+            values = (self.items, self.bytes)
+            self.items = self.bytes = 0
+        return values
+
+def _set_environment():
+    os.environ.update({
+        "AWS_ACCESS_KEY_ID": "testing",
+        "AWS_SECRET_ACCESS_KEY": "testing",
+        "AWS_DEFAULT_REGION": REGION,
+        "REGION": REGION,
+        "TABLE_NAME": TABLE_NAME,
+        "BUCKET_NAME": BUCKET_NAME,
+        "SPECIES_INDEX_TABLE": INDEX_TABLE,
+        "QUERY_META_TABLE": META_TABLE,
+        "BITMAP_INDEX_BUCKET": BUCKET_NAME,
+        "BITMAP_INDEX_KEY": BITMAP_KEY,
+    })
+
+def _create_resources():
+    dynamodb = boto3.resource("dynamodb", region_name=REGION)
+    dynamodb.create_table(
+        TableName=TABLE_NAME,
+        AttributeDefinitions=[{"AttributeName": "fileId", "AttributeType": "S"}],
+        KeySchema=[{"AttributeName": "fileId", "KeyType": "HASH"}],
+        BillingMode="PAY_PER_REQUEST",
+    )
+    dynamodb.create_table(
+        TableName=INDEX_TABLE,
+        AttributeDefinitions=[
+            {"AttributeName": "species", "AttributeType": "S"},
+            {"AttributeName": "countKey", "AttributeType": "S"},
+        ],
+        KeySchema=[
+            {"AttributeName": "species", "KeyType": "HASH"},
+            {"AttributeName": "countKey", "KeyType": "RANGE"},
+        ],
+        BillingMode="PAY_PER_REQUEST",
+    )
+    dynamodb.create_table(
+        TableName=META_TABLE,
+        AttributeDefinitions=[{"AttributeName": "name", "AttributeType": "S"}],
+        KeySchema=[{"AttributeName": "name", "KeyType": "HASH"}],
+        BillingMode="PAY_PER_REQUEST",
+    )
+    boto3.client("s3", region_name=REGION).create_bucket(Bucket=BUCKET_NAME)
+    return dynamodb
+
+def _load_corpus(dynamodb, size, seed):
+    sys.path[:0] = [QUERY_DIR, SHARED_DIR]
+    from species_bitmap import SpeciesBitmapIndex
+
+    bitmap = SpeciesBitmapIndex()
+    images = []
+    with dynamodb.Table(TABLE_NAME).batch_writer() as items, dynamodb.Table(INDEX_TABLE).batch_writer() as index:
+        for item in generate_corpus(size, seed=seed, bucket=BUCKET_NAME):
+            items.put_item(Item=item)
+            tag_map = {t["name"]: int(t["count"]) for t in item["tags"]}
+            for name, count in tag_map.items():
+                index.put_item(Item={
+                    "species": name,
+                    "countKey": f"{count:06d}#{item['fileId']}",
+                    "fileId": item["fileId"],
+                    "count": count,
+                })
+            bitmap.set_tags(item["fileId"], {}, tag_map)
+            if "thumbnailKey" in item:
+                images.append(item["thumbnailKey"])
+
+    dynamodb.Table(META_TABLE).put_item(Item={"name": "tagGeneration", "generation": 1})
+    boto3.client("s3", region_name=REGION).put_object(Bucket=BUCKET_NAME, Key=BITMAP_KEY, Body=bitmap.dumps())
+    return images
+
+def _import_query():
+    # Fresh module state (caches, clients) for every corpus
+    for name in QUERY_MODULES:
+        sys.modules.pop(name, None)
+    if QUERY_DIR not in sys.path:
+        sys.path[:0] = [QUERY_DIR, SHARED_DIR]
+    import query
+    return query
+
+def _configure(query, scenario):
+    from presign_cache import PresignedUrlCache
+    from result_cache import QueryResultCache
+    from s3_object_loader import S3ObjectLoader
+    from species_bitmap import SpeciesBitmapIndex
+
+    query.url_cache     = PresignedUrlCache(query.s3_client)
+    query.result_cache  = QueryResultCache()
+    query.index_table   = query.dynamodb.Table(INDEX_TABLE) if scenario == "index" else None
+    query.meta_table    = query.dynamodb.Table(META_TABLE) if scenario == "cached" else None
+    query.bitmap_loader = (
+        S3ObjectLoader(query.s3_client, BUCKET_NAME, BITMAP_KEY, SpeciesBitmapIndex.loads)
+        if scenario in ("bitmap", "cached") else None
+    )
+
+def _event(path, body):
+    return {
+        "rawPath": path,
+        "requestContext": {"http": {"method": "POST", "path": path}},
+        "body": json.dumps(body),
+    }
+
+def _requests(operation, rng, count, thumbnails, s3_client):
+    for _ in range(count):
+        if operation == "query":
+            species = sample_species(rng, rng.randint(1, 3))
+            yield _event("/query", {"species": [{"name": s, "count": rng.randint(1, 2)} for s in species]})
+        elif operation == "find":
+            species = sample_species(rng, rng.randint(1, 3))
+            yield _event("/find", {"species": [{"name": s} for s in species]})
+        else:
+            thumb_url = s3_client.generate_presigned_url(
+                ClientMethod="get_object",
+                Params={"Bucket": BUCKET_NAME, "Key": rng.choice(thumbnails)},
+                ExpiresIn=3600
+            )
+            yield _event("/find-full-image", {"thumbnailUrl": thumb_url})
+
+def _percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+def run_size(size, scenarios, operations, request_count, seed):
+    rows = []
+    with mock_aws():
+        dynamodb = _create_resources()
+        load_start = time.perf_counter()
+        thumbnails = _load_corpus(dynamodb, size, seed)
+        print(f"[{size}] corpus loaded in {time.perf_counter() - load_start:.1f}s", file=sys.stderr)
+
+        query = _import_query()
+        meter = ReadMeter()
+        for client in (query.dynamodb_client, query.dynamodb.meta.client):
+            client.meta.events.register("after-call.dynamodb", meter)
+
+        for scenario in scenarios:
+            _configure(query, scenario)
+            for operation in operations:
+                rng = random.Random(f"{seed}-{operation}")
+                latencies, items_read, bytes_read, results = [], [], [], []
+                for event in _requests(operation, rng, request_count, thumbnails, query.s3_client):
+                    meter.take()
+                    start = time.perf_counter()
+                    with contextlib.redirect_stdout(io.StringIO()):
+                        resp = query.lambda_handler(event, None)
+                    latencies.append((time.perf_counter() - start) * 1000)
+                    n_items, n_bytes = meter.take()
+                    items_read.append(n_items)
+                    bytes_read.append(n_bytes)
+                    body = json.loads(resp["body"])
+                    results.append(len(body.get("results", [])) if "results" in body else int(resp["statusCode"] == 200))
+
+                row = {
+                    "size": size,
+                    "scenario": scenario,
+                    "operation": operation,
+                    "requests": request_count,
+                    "p50_ms": round(_percentile(latencies, 50), 2),
+                    "p95_ms": round(_percentile(latencies, 95), 2),
+                    "mean_ms": round(statistics.mean(latencies), 2),
+                    "items_read_per_request": round(statistics.mean(items_read), 1),
+                    "bytes_read_per_request": round(statistics.mean(bytes_read)),
+                    "results_per_request": round(statistics.mean(results), 1),
+                }
+                rows.append(row)
+                print(f"[{size}] {scenario:<6} {operation:<10} p50={row['p50_ms']}ms p95={row['p95_ms']}ms", file=sys.stderr)
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="1000,10000")
+    parser.add_argument("--requests", type=int, default=30)
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--operations", default="query,find,full-image")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--out", help="write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    _set_environment()
+    report = {
+        "config": {
+            "sizes": [int(s) for s in args.sizes.split(",")],
+            "requests": args.requests,
+            "seed": args.seed,
+        },
+        "results": [],
+    }
+    for size in report["config"]["sizes"]:
+        report["results"].extend(run_size(
+            size, args.scenarios.split(","), args.operations.split(","), args.requests, args.seed
+        ))
+
+    output = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+"""
+End-to-end latency of lambdas/query/queryByFile.py in its two deployment modes:
+
+  invoke     - tagging Lambda, then query Lambda, each through lambda_client.invoke
+  inprocess  - tag_bytes and query.run_query in the queryByFile process
+  cached     - inprocess, with the same file answered from the inference cache LRU
+
+Model inference is not what is measured, so the tagger is a stand-in that
+sleeps --tagger-ms and returns species from the corpus vocabulary; both modes
+use the same stand-in. Each Lambda invoke costs --invoke-ms of round trip plus,
+with probability --cold-start-rate, --cold-start-ms. Everything else (payload
+(de)serialization, the /query read path on moto's DynamoDB) runs for real.
+
+    pip install -r benchmarks/requirements.txt
+    python benchmarks/bench_query_by_file.py --size 5000 --requests 30 --file-kb 512
+"""
+import argparse
+import base64
+import contextlib
+import io
+import json
+import random
+import statistics
+import sys
+import time
+import types
+
+from moto import mock_aws
+
+from bench_query import _configure, _create_resources, _import_query, _load_corpus, _percentile, _set_environment
+from corpus import sample_species
+
+MODES = ["invoke", "inprocess", "cached"]
+TAG_FUNCTION   = "visualFileQuery"
+QUERY_FUNCTION = "birdtagquery"
+
+def make_tagger(tagger_ms, seed):
+    """
+    Module with the query taggers' interface (lambda_handler, decode_body, tag_bytes).
+    """
+    rng = random.Random(seed)
+    tagger = types.ModuleType("visual_query_tagging")
+
+    def decode_body(event):
+        return base64.b64decode(base64.b64decode(event["body"]).decode())
+
+    def tag_bytes(data, content_type):
+        time.sleep(tagger_ms / 1000)
+        species = sample_species(rng, rng.randint(1, 2))
+        return {"mediaType": "image", "tags": [{"name": s, "count": 1} for s in species]}
+
+    def lambda_handler(event, context):
+        result = tag_bytes(decode_body(event), event["headers"]["Content-Type"])
+        return {"statusCode": 200, "headers": {"Content-Type": "application/json"}, "body": json.dumps(result)}
+
+    tagger.decode_body = decode_body
+    tagger.tag_bytes = tag_bytes
+    tagger.lambda_handler = lambda_handler
+    return tagger
+
+class FakeLambdaClient:
+    """
+    lambda_client.invoke that runs the handler in this process after a simulated round trip.
+    """
+
+    def __init__(self, handlers, invoke_ms, cold_start_ms, cold_start_rate, seed):
+        self.handlers = handlers
+        self.invoke_ms = invoke_ms
+        self.cold_start_ms = cold_start_ms
+        self.cold_start_rate = cold_start_rate
+        self.rng = random.Random(seed)
+        self.invokes = 0
+
+    def invoke(self, FunctionName, InvocationType, Payload):
+        self.invokes += 1
+        delay = self.invoke_ms
+        if self.rng.random() < self.cold_start_rate:
+            delay += self.cold_start_ms
+        time.sleep(delay / 1000)
+        result = self.handlers[FunctionName](json.loads(Payload), None)
+        return {"StatusCode": 200, "Payload": io.BytesIO(json.dumps(result).encode())}
+
+def _event(file_bytes):
+    # Same double encoding the web client + API Gateway produce
+    return {
+        "rawPath": "/query-by-file",
+        "requestContext": {"http": {"method": "POST", "path": "/query-by-file"}},
+        "headers": {"Content-Type": "image/jpeg"},
+        "isBase64Encoded": True,
+        "body": base64.b64encode(base64.b64encode(file_bytes)).decode(),
+    }
+
+def run(args):
+    rows = []
+    with mock_aws():
+        dynamodb = _create_resources()
+        _load_corpus(dynamodb, args.size, args.seed)
+        query = _import_query()
+
+        sys.modules.pop("queryByFile", None)
+        import queryByFile
+        from inference_cache import InferenceCache
+
+        file_bytes = random.Random(args.seed).randbytes(args.file_kb * 1024)
+        for mode in args.modes.split(","):
+            # Fresh caches per mode
+            _configure(query, args.scenario)
+            tagger = make_tagger(args.tagger_ms, args.seed)
+            client = FakeLambdaClient(
+                {TAG_FUNCTION: tagger.lambda_handler, QUERY_FUNCTION: query.lambda_handler},
+                args.invoke_ms, args.cold_start_ms, args.cold_start_rate, args.seed
+            )
+            queryByFile.lambda_client = client
+            queryByFile.QUERY_BY_FILE_MODE = "inprocess" if mode == "cached" else mode
+            # Every request sends the same file; only "cached" may reuse its tags
+            queryByFile.inference_cache = InferenceCache(None, None, max_entries=512 if mode == "cached" else 0)
+            queryByFile.VISUAL_TAG_FUNCTION = TAG_FUNCTION
+            queryByFile.QUERY_FUNCTION = QUERY_FUNCTION
+            queryByFile._local_taggers = {queryByFile.VISUAL_TAGGER_MODULE: tagger}
+
+            latencies, statuses = [], []
+            for _ in range(args.requests):
+                event = _event(file_bytes)
+                start = time.perf_counter()
+                with contextlib.redirect_stdout(io.StringIO()):
+                    resp = queryByFile.lambda_handler(event, None)
+                latencies.append((time.perf_counter() - start) * 1000)
+                statuses.append(resp["statusCode"])
+
+            row = {
+                "mode": mode,
+                "requests": args.requests,
+                "ok": statuses.count(200),
+                "p50_ms": round(_percentile(latencies, 50), 2),
+                "p95_ms": round(_percentile(latencies, 95), 2),
+                "mean_ms": round(statistics.mean(latencies), 2),
+                "invokes_per_request": round(client.invokes / args.requests, 2),
+            }
+            rows.append(row)
+            print(f"{mode:<10} p50={row['p50_ms']}ms p95={row['p95_ms']}ms", file=sys.stderr)
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", type=int, default=5000)
+    parser.add_argument("--requests", type=int, default=30)
+    parser.add_argument("--modes", default=",".join(MODES))
+    parser.add_argument("--scenario", default="index", help="query read path, as in bench_query.py")
+    parser.add_argument("--file-kb", type=int, default=512)
+    parser.add_argument("--tagger-ms", type=float, default=200)
+    parser.add_argument("--invoke-ms", type=float, default=30)
+    parser.add_argument("--cold-start-ms", type=float, default=1500)
+    parser.add_argument("--cold-start-rate", type=float, default=0.05)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--out", help="write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    _set_environment()
+    report = {"config": vars(args), "results": run(args)}
+
+    output = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Species bitmap index vs the per-item scan matcher of handle_query, for AND/OR
+filters over 1-10 species.
+
+    python benchmarks/bench_species_bitmap.py [--items 100000] [--repeat 5]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "lambdas", "query"))
+
+from species_bitmap import SpeciesBitmapIndex
+
+SPECIES = [f"species{i:02d}" for i in range(40)]
+
+def make_corpus(n, seed=7):
+    rng = random.Random(seed)
+    weights = [1 / (rank + 1) for rank in range(len(SPECIES))]  # Zipf-like skew
+    items = []
+    for i in range(n):
+        names = set(rng.choices(SPECIES, weights=weights, k=rng.randint(1, 4)))
+        items.append({
+            "fileId": f"file-{i:07d}",
+            "tags": [{"name": name, "count": rng.randint(1, 5)} for name in names],
+        })
+    return items
+
+def scan_match_all(items, filters):
+    def match_item(item):
+        item_tags = { t["name"].lower(): int(t["count"]) for t in item.get("tags", []) }
+        for name, cnt in filters:
+            if name not in item_tags or item_tags[name] < cnt:
+                return False
+        return True
+    return {item["fileId"] for item in items if match_item(item)}
+
+def scan_match_any(items, names):
+    names = set(names)
+    return {item["fileId"] for item in items if any(t["name"] in names for t in item["tags"])}
+
+def timed(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000, result
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--items", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    items = make_corpus(args.items)
+    index = SpeciesBitmapIndex()
+    for item in items:
+        index.set_tags(item["fileId"], {}, {t["name"]: t["count"] for t in item["tags"]})
+    print(f"{args.items} items, serialized index {len(index.dumps()) / 1024:.1f} KiB")
+    print(f"{'species':>7} {'op':>4} {'scan ms':>10} {'bitmap ms':>10} {'matches':>8}")
+
+    for k in range(1, 11):
+        filters = [(SPECIES[j], 1) for j in range(k)]
+        names = [name for name, _ in filters]
+
+        scan_ms, expected = timed(lambda: scan_match_all(items, filters), args.repeat)
+        bitmap_ms, got = timed(lambda: index.to_file_ids(index.match_all(filters)), args.repeat)
+        assert got == expected
+        print(f"{k:>7} {'AND':>4} {scan_ms:10.2f} {bitmap_ms:10.3f} {len(got):>8}")
+
+        scan_ms, expected = timed(lambda: scan_match_any(items, names), args.repeat)
+        bitmap_ms, got = timed(lambda: index.to_file_ids(index.match_any(names)), args.repeat)
+        assert got == expected
+        print(f"{k:>7} {'OR':>4} {scan_ms:10.2f} {bitmap_ms:10.3f} {len(got):>8}")
+
+if __name__ == "__main__":
+    main()
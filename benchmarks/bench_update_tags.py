@@ -0,0 +1,222 @@
+"""
+Bulk tag edit through /update-tags (lambdas/data_management/data_management.py),
+before and after direct fileId addressing:
+
+  before  - the previous handler: one parallel scan filtered on thumbnailKey
+            per URL, then UpdateItem, species index and /stats writes per item
+  urls    - handle_update_tags with the same thumbnail URLs, resolved by
+            BatchGetItem and written in bulk
+  fileIds - handle_update_tags with the fileIds themselves: no reads at all,
+            one SET tags.#s / REMOVE tags.#s UpdateItem per item
+
+The table is an in-memory stand-in that charges --request-ms per call and
+--page-ms per 1 MB scan page, so the numbers reflect round trips and pages
+read rather than DynamoDB's service-side work.
+
+    pip install -r benchmarks/requirements.txt
+    python benchmarks/bench_update_tags.py --size 50000 --edit 500
+"""
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+import urllib.parse
+
+LAMBDAS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "lambdas")
+sys.path[:0] = [os.path.join(LAMBDAS_DIR, "data_management"), os.path.join(LAMBDAS_DIR, "shared")]
+
+import data_management  # noqa: E402
+from media_records import decode_tag_counts  # noqa: E402
+from parallel_scan import parallel_scan  # noqa: E402
+
+from corpus import VOCABULARY  # noqa: E402
+
+TABLE_NAME = "BirdMediaTags"
+BUCKET_URL = "https://birdtagbucket-bench.s3.us-east-1.amazonaws.com/"
+ITEM_SIZE_BYTES = 300
+PAGE_LIMIT_BYTES = 1024 * 1024
+
+class FakeDynamoDBClient:
+    """
+    The DynamoDB client calls /update-tags makes, on a dict of wire-format items.
+    """
+
+    def __init__(self, items, request_ms, page_ms):
+        self.items = items
+        self.order = sorted(items)
+        self.request_s = request_ms / 1000
+        self.page_s = page_ms / 1000
+        self.calls = {}
+        self.pages = 0
+        self._lock = threading.Lock()
+
+    def _count(self, op):
+        with self._lock:
+            self.calls[op] = self.calls.get(op, 0) + 1
+
+    def describe_table(self, TableName):
+        return {"Table": {"TableName": TableName, "TableSizeBytes": len(self.items) * ITEM_SIZE_BYTES}}
+
+    def scan(self, TableName, Segment=0, TotalSegments=1, ExclusiveStartKey=None,
+             FilterExpression=None, ExpressionAttributeValues=None, **kwargs):
+        self._count("scan")
+        with self._lock:
+            self.pages += 1
+        time.sleep(self.page_s)
+        # Both handlers filter on thumbnailKey / key equality; any value may match
+        values = {v["S"] for v in (ExpressionAttributeValues or {}).values()}
+        per_page = PAGE_LIMIT_BYTES // ITEM_SIZE_BYTES
+        start = ExclusiveStartKey["ordinal"] + TotalSegments if ExclusiveStartKey else Segment
+        ordinals = range(start, len(self.order), TotalSegments)[:per_page]
+        matched = [
+            item for item in (self.items[self.order[i]] for i in ordinals)
+            if item["thumbnailKey"]["S"] in values or item["key"]["S"] in values
+        ]
+        resp = {"Items": matched}
+        if ordinals and ordinals[-1] + TotalSegments < len(self.order):
+            resp["LastEvaluatedKey"] = {"ordinal": ordinals[-1]}
+        return resp
+
+    def batch_get_item(self, RequestItems):
+        self._count("batch_get_item")
+        time.sleep(self.request_s)
+        (table, request), = RequestItems.items()
+        found = [self.items[k["fileId"]["S"]] for k in request["Keys"] if k["fileId"]["S"] in self.items]
+        return {"Responses": {table: found}}
+
+    def update_item(self, TableName, Key, UpdateExpression="", ExpressionAttributeNames=None,
+                    ExpressionAttributeValues=None, ReturnValues=None, **kwargs):
+        self._count("update_item")
+        time.sleep(self.request_s)
+        if TableName != TABLE_NAME:
+            return {}
+        item = self.items[Key["fileId"]["S"]]
+        names, values = ExpressionAttributeNames or {}, ExpressionAttributeValues or {}
+        if ":newtags" in values:
+            # The previous handler's whole-list write
+            item["tags"] = values[":newtags"]
+            return {}
+        old = dict(item, tags={"M": dict(item["tags"]["M"])})
+        for ref, value in re.findall(r"#tg\.(#s\d+)(?: = (:c\d+))?", UpdateExpression):
+            if value:
+                item["tags"]["M"][names[ref]] = values[value]
+            else:
+                item["tags"]["M"].pop(names[ref], None)
+        return {"Attributes": old} if ReturnValues == "ALL_OLD" else {}
+
+    def batch_write_item(self, RequestItems):
+        self._count("batch_write_item")
+        time.sleep(self.request_s)
+        return {}
+
+def make_items(size, seed):
+    rng = random.Random(seed)
+    items = {}
+    for i in range(size):
+        file_id = f"{i:08d}-{rng.getrandbits(48):012x}"
+        tags = rng.sample(VOCABULARY, rng.randint(1, 3))
+        items[file_id] = {
+            "fileId": {"S": file_id},
+            "type": {"S": "image"},
+            "key": {"S": f"images/{file_id}.jpg"},
+            "thumbnailKey": {"S": f"thumbnails/{file_id}_thumb.jpeg"},
+            "tags": {"M": {t: {"N": str(rng.randint(1, 3))} for t in tags}},
+        }
+    return items
+
+def legacy_update_tags(client, url_list, operation, tags):
+    """
+    The handler before fileId addressing, kept here as the baseline.
+    """
+    updated = 0
+    for url in url_list:
+        object_key = urllib.parse.urlparse(url).path.lstrip("/")
+        items = [
+            item
+            for page in parallel_scan(
+                client, TABLE_NAME,
+                FilterExpression="thumbnailKey = :tk",
+                ExpressionAttributeValues={":tk": {"S": object_key}}
+            )
+            for item in page
+        ]
+        for item in items:
+            file_id = item["fileId"]["S"]
+            old_tag_map = decode_tag_counts(item)
+            new_tag_map = dict(old_tag_map)
+            for t in tags:
+                if operation == "add":
+                    new_tag_map[t["name"]] = t["count"]
+                else:
+                    new_tag_map.pop(t["name"], None)
+            client.update_item(
+                TableName=TABLE_NAME,
+                Key={"fileId": {"S": file_id}},
+                UpdateExpression="SET #tg = :newtags",
+                ExpressionAttributeNames={"#tg": "tags"},
+                ExpressionAttributeValues={":newtags": {"L": [
+                    {"M": {"name": {"S": nm}, "count": {"N": str(ct)}}} for nm, ct in new_tag_map.items()
+                ]}}
+            )
+            client.batch_write_item(RequestItems={})               # species index diff
+            client.update_item(TableName="BirdTagStats", Key={})    # /stats ADD
+            updated += 1
+    return updated
+
+def run(label, client, fn):
+    start = time.perf_counter()
+    updated = fn()
+    elapsed = time.perf_counter() - start
+    row = {
+        "mode": label,
+        "seconds": round(elapsed, 3),
+        "updated": updated,
+        "scanPages": client.pages,
+        "calls": dict(sorted(client.calls.items())),
+    }
+    print(f"  {label:<8} {elapsed:8.2f} s  updated={updated} pages={client.pages} calls={row['calls']}", file=sys.stderr)
+    return row
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", type=int, default=50000)
+    parser.add_argument("--edit", type=int, default=500)
+    parser.add_argument("--request-ms", type=float, default=5)
+    parser.add_argument("--page-ms", type=float, default=20)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    items = make_items(args.size, args.seed)
+    targets = random.Random(args.seed + 1).sample(sorted(items), args.edit)
+    urls = [BUCKET_URL + items[fid]["thumbnailKey"]["S"] for fid in targets]
+    tags = [{"name": "crow", "count": 2}]
+
+    def handler(body):
+        def call():
+            resp = data_management.handle_update_tags({"body": json.dumps(body)})
+            assert resp["statusCode"] == 200, resp["body"]
+            return len(json.loads(resp["body"])["updated_items"])
+        return call
+
+    results = []
+    for operation in ("add", "remove"):
+        print(f"{args.edit} of {args.size} items, {operation} {tags[0]['name']}", file=sys.stderr)
+        modes = [
+            ("before", lambda c: lambda: legacy_update_tags(c, urls, operation, tags)),
+            ("urls", lambda c: handler({"url": urls, "operation": operation, "tags": tags})),
+            ("fileIds", lambda c: handler({"fileIds": targets, "operation": operation, "tags": tags})),
+        ]
+        for mode, make_fn in modes:
+            # Every mode starts from the same tags, so each one really writes
+            client = FakeDynamoDBClient(make_items(args.size, args.seed), args.request_ms, args.page_ms)
+            data_management.dynamodb_client = client
+            results.append(dict(run(mode, client, make_fn(client)), operation=operation))
+
+    print(json.dumps({"config": vars(args), "results": results}, indent=2))
+
+if __name__ == "__main__":
+    main()
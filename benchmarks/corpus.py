@@ -0,0 +1,77 @@
+"""
+Synthetic BirdMediaTags corpus with realistic skew.
+
+Species popularity follows a Zipf distribution over VOCABULARY (a few common
+birds dominate, most are rare). Tags per file and per-tag counts are
+geometric, and media types follow the upload mix we see in practice.
+"""
+import random
+import uuid
+from decimal import Decimal
+
+VOCABULARY = [
+    "crow", "pigeon", "sparrow", "myna", "magpie", "kingfisher", "owl", "eagle",
+    "heron", "parrot", "peacock", "cockatoo", "kookaburra", "rosella", "lorikeet",
+    "galah", "ibis", "pelican", "swan", "duck", "gull", "tern", "cormorant",
+    "egret", "wren", "finch", "robin", "thrush", "swallow", "kestrel", "falcon",
+    "hawk", "woodpecker", "honeyeater", "wattlebird", "currawong", "butcherbird",
+    "fantail", "pardalote", "emu",
+]
+
+MEDIA_MIX = [("image", 0.70), ("video", 0.15), ("audio", 0.15)]
+FORMATS = {"image": ["jpg", "png"], "video": ["mp4", "avi"], "audio": ["mp3", "wav"]}
+FOLDERS = {"image": "images", "video": "videos", "audio": "audios"}
+
+def zipf_weights(n, s=1.1):
+    return [1.0 / (rank + 1) ** s for rank in range(n)]
+
+def _geometric(rng, p, cap):
+    k = 1
+    while k < cap and rng.random() > p:
+        k += 1
+    return k
+
+def generate_corpus(size, seed=42, zipf_s=1.1, bucket="birdtagbucket-bench"):
+    """
+    Yield `size` items shaped like BirdMediaTags records read through boto3.resource.
+    """
+    rng = random.Random(seed)
+    weights = zipf_weights(len(VOCABULARY), zipf_s)
+    media_types = [m for m, _ in MEDIA_MIX]
+    media_weights = [w for _, w in MEDIA_MIX]
+
+    for _ in range(size):
+        file_id = str(uuid.UUID(int=rng.getrandbits(128), version=4))
+        media_type = rng.choices(media_types, weights=media_weights)[0]
+        fmt = rng.choice(FORMATS[media_type])
+
+        n_species = _geometric(rng, 0.55, 5)
+        names = set()
+        while len(names) < n_species:
+            names.add(rng.choices(VOCABULARY, weights=weights)[0])
+        # Audio (BirdNET) reports presence; images and videos count individuals
+        max_count = 1 if media_type == "audio" else 10
+        tags = [{"name": name, "count": Decimal(_geometric(rng, 0.6, max_count))} for name in sorted(names)]
+
+        item = {
+            "fileId": file_id,
+            "key": f"{FOLDERS[media_type]}/{file_id}.{fmt}",
+            "bucket": bucket,
+            "size": Decimal(rng.randint(20_000, 5_000_000)),
+            "type": media_type,
+            "format": fmt,
+            "tags": tags,
+        }
+        if media_type == "image":
+            item["thumbnailKey"] = f"thumbnails/{file_id}_thumb.jpeg"
+        yield item
+
+def sample_species(rng, k, zipf_s=1.1):
+    """
+    k distinct species drawn with the same skew as the corpus, like real searches.
+    """
+    weights = zipf_weights(len(VOCABULARY), zipf_s)
+    names = set()
+    while len(names) < k:
+        names.add(rng.choices(VOCABULARY, weights=weights)[0])
+    return sorted(names)
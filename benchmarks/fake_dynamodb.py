@@ -0,0 +1,40 @@
+"""
+In-memory stand-in for the parts of the DynamoDB client API the Lambdas use,
+so the read paths can be benchmarked without AWS or DynamoDB Local.
+
+Items are generated on demand from their ordinal by `item_factory`, which keeps
+1M-item tables cheap to hold in memory.
+"""
+import time
+
+PAGE_LIMIT_BYTES = 1024 * 1024  # DynamoDB returns at most 1 MB per scan page
+
+class FakeDynamoDBClient:
+    def __init__(self, table_name, item_count, item_factory, item_size_bytes=300, page_latency=0.02):
+        self.table_name = table_name
+        self.item_count = item_count
+        self.item_factory = item_factory
+        self.item_size_bytes = item_size_bytes
+        self.page_latency = page_latency  # simulated network + service time per request
+        self.scan_calls = 0
+
+    def describe_table(self, TableName):
+        return {"Table": {
+            "TableName": TableName,
+            "ItemCount": self.item_count,
+            "TableSizeBytes": self.item_count * self.item_size_bytes,
+        }}
+
+    def scan(self, TableName, Segment=0, TotalSegments=1, ExclusiveStartKey=None, **kwargs):
+        self.scan_calls += 1
+        time.sleep(self.page_latency)
+
+        per_page = max(1, PAGE_LIMIT_BYTES // self.item_size_bytes)
+        start = ExclusiveStartKey["ordinal"] + TotalSegments if ExclusiveStartKey else Segment
+        ordinals = range(start, self.item_count, TotalSegments)[:per_page]
+        items = [self.item_factory(i) for i in ordinals]
+
+        resp = {"Items": items, "Count": len(items), "ScannedCount": len(items)}
+        if ordinals and ordinals[-1] + TotalSegments < self.item_count:
+            resp["LastEvaluatedKey"] = {"ordinal": ordinals[-1]}
+        return resp
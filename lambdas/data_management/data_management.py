@@ -1,12 +1,26 @@
 import os
 import json
+import posixpath
 import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
 import boto3
 from botocore.exceptions import ClientError
+from media_records import decode_item, decode_tag_counts
+from parallel_scan import parallel_scan
+from tag_migration import migrate_item
+from tag_stats import apply_stats_delta, stats_delta
+from tagging_records import TAG_GENERATION_KEY, species_index_changes
 
 TABLE_NAME = os.environ.get("TABLE_NAME", "BirdMediaTags")
 BUCKET_NAME = os.environ.get("BUCKET_NAME", "birdtagbucket-assfdas")
 REGION     = os.environ.get("REGION", "us-east-1")
+SPECIES_INDEX_TABLE = os.environ.get("SPECIES_INDEX_TABLE", "BirdSpeciesIndex")
+QUERY_META_TABLE = os.environ.get("QUERY_META_TABLE", "BirdQueryMeta")
+TAG_STATS_TABLE = os.environ.get("TAG_STATS_TABLE", "BirdTagStats")
+# Concurrent UpdateItem calls when applying a bulk tag edit
+UPDATE_WORKERS = int(os.environ.get("UPDATE_WORKERS", "16"))
+# Tries per item; a list-shaped item is migrated to a tags map between tries
+MAX_UPDATE_ATTEMPTS = 3
 
 dynamodb_client = boto3.client("dynamodb", region_name=REGION)
 s3_client = boto3.client("s3", region_name=REGION)
@@ -16,6 +30,7 @@ def lambda_handler(event, context):
     Entry point for Lambda.
     Expects POST /update-tags with a JSON body:
     {
+      "fileIds": ["0b5c...", ...],   # and/or "url"
       "url": [
         "https://birdtagbucket-assfdas.s3.us-east-1.amazonaws.com/thumbnails/image1-thumb.png",
         "https://birdtagbucket-assfdas.s3.us-east-1.amazonaws.com/thumbnails/image60-thumb.png",
@@ -51,97 +66,47 @@ def lambda_handler(event, context):
 def handle_update_tags(event):
     """
     Processes bulk add/remove tag requests against items in DynamoDB.
+    Items are addressed by "fileIds" and/or by "url" (file or thumbnail URLs,
+    resolved with BatchGetItem). Each item gets one write-only UpdateItem that
+    SETs or REMOVEs the requested species in its tags map.
     """
     try:
         body = json.loads(event.get("body", "{}"))
         url_list   = body.get("url", [])
+        file_ids   = body.get("fileIds", [])
         operation  = body.get("operation", "").lower()
         tag_list   = body.get("tags", [])
 
-        if not isinstance(url_list, list) or len(url_list) == 0:
-            return _response(400, {"message": "\"url\" must be a non-empty list"})
+        if not isinstance(url_list, list) or not isinstance(file_ids, list) or not (url_list or file_ids):
+            return _response(400, {"message": "\"url\" or \"fileIds\" must be a non-empty list"})
+        if not all(isinstance(fid, str) and fid for fid in file_ids):
+            return _response(400, {"message": "\"fileIds\" must be non-empty strings"})
         if operation not in ("add", "remove"):
             return _response(400, {"message": "\"operation\" must be \"add\" or \"remove\""})
         if not isinstance(tag_list, list) or len(tag_list) == 0:
             return _response(400, {"message": "\"tags\" must be a non-empty list"})
 
-        normalized_tags = []
+        # { species: count }; a species named twice keeps its last count
+        requested_tags = {}
         for t in tag_list:
             name = t.get("name", "").strip().lower()
             count = int(t.get("count", 0))
             if not name or count < 1:
                 return _response(400, {"message": "Each tag requires a non-empty \"name\" and count >= 1"})
-            normalized_tags.append({"name": name, "count": count})
+            requested_tags[name] = count
 
-        updated_items = []
+        # URL: https://birdtagbucket-assfdas.s3.us-east-1.amazonaws.com/thumbnails/xxx_thumb.jpeg
+        object_keys = [urllib.parse.urlparse(url).path.lstrip("/") for url in url_list]
+        target_ids, not_found = _resolve_file_ids(file_ids, object_keys)
 
-        for url in url_list:
-            # URL: https://birdtagbucket-assfdas.s3.us-east-1.amazonaws.com/thumbnails/xxx_thumb.
-            parsed = urllib.parse.urlparse(url)
-            object_key = parsed.path.lstrip("/")  # "thumbnails/xxx_thumb.png"
-
-            resp = dynamodb_client.scan(
-                TableName=TABLE_NAME,
-                FilterExpression = "thumbnailKey = :tk",
-                ExpressionAttributeValues = {
-                    ":tk": {"S": object_key}
-                }
-            )
-            items = resp.get("Items", [])
-            if not items:
-                continue
-
-            for item in items:
-                item_id = item["fileId"]["S"]
-
-                existing_tag_map = {}
-                for t_elt in item.get("tags", {}).get("L", []):
-                    m = t_elt.get("M", {})
-                    name = m.get("name", {}).get("S", "").lower()
-                    cnt = int(m.get("count", {}).get("N", "0"))
-                    if name:
-                        existing_tag_map[name] = cnt
-
-                if operation == "add":
-                    for t in normalized_tags:
-                        nm = t["name"]
-                        ct = t["count"]
-                        existing_tag_map[nm] = ct
-                else:  # operation == "remove"
-                    for t in normalized_tags:
-                        nm = t["name"]
-                        if nm in existing_tag_map:
-                            del existing_tag_map[nm]
-
-                new_dynamodb_tags = {"L": []}
-                for nm, ct in existing_tag_map.items():
-                    new_dynamodb_tags["L"].append({
-                        "M": {
-                            "name": {"S": nm},
-                            "count": {"N": str(ct)}
-                        }
-                    })
-
-                dynamodb_client.update_item(
-                    TableName=TABLE_NAME,
-                    Key={ "fileId": {"S": item_id} },
-                    UpdateExpression="SET #tg = :newtags",
-                    ExpressionAttributeNames={"#tg": "tags"},
-                    ExpressionAttributeValues={":newtags": new_dynamodb_tags}
-                )
-
-                updated_items_entry = {
-                    "fileId": item_id,
-                    "tags": [
-                        {"name": nm, "count": existing_tag_map[nm]}
-                        for nm in existing_tag_map
-                    ]
-                }
-                updated_items.append(updated_items_entry)
+        updated_items, missing = _apply_tag_edits(target_ids, operation, requested_tags)
+        if updated_items:
+            _bump_tag_generation()
 
         return _response(200, {
             "message": "Tags updated successfully",
-            "updated_items": updated_items
+            "updated_items": updated_items,
+            "not_found": missing + not_found
         })
 
     except ClientError as e:
@@ -149,6 +114,170 @@ def handle_update_tags(event):
     except Exception as e:
         return _response(500, {"message": "Internal error", "error": str(e)})
 
+def _resolve_file_ids(file_ids, object_keys):
+    """
+    fileIds of the items addressed by fileId or by object key (the file's
+    "key" or its "thumbnailKey"). Returns (fileIds, the keys that matched nothing).
+    fileIds are taken as given; the update itself finds out whether they exist.
+
+    Uploads are stored as "<folder>/<fileId>.<ext>" with thumbnails at
+    "thumbnails/<fileId>_thumb.jpeg", so a key names its fileId. Those ids are
+    fetched in one BatchGetItem round and a key counts only if the item really
+    has it; keys of items named some other way fall back to one filtered scan.
+    """
+    ids = dict.fromkeys(file_ids)
+    key_ids = {key: _file_id_from_key(key) for key in dict.fromkeys(object_keys) if key}
+    by_id = _batch_get_items(list(dict.fromkeys(key_ids.values())))
+
+    unresolved = []
+    for key, fid in key_ids.items():
+        item = by_id.get(fid)
+        if item is not None and key in (item.get("key", {}).get("S"), item.get("thumbnailKey", {}).get("S")):
+            ids[fid] = None
+        else:
+            unresolved.append(key)
+
+    found_keys = set()
+    for item in _scan_by_keys(unresolved):
+        ids[item["fileId"]["S"]] = None
+        found_keys.update(attr["S"] for attr in (item.get("key"), item.get("thumbnailKey")) if attr)
+
+    return list(ids), [key for key in unresolved if key not in found_keys]
+
+def _file_id_from_key(object_key):
+    # "images/<fileId>.jpg" / "thumbnails/<fileId>_thumb.jpeg" -> fileId
+    name = posixpath.splitext(posixpath.basename(object_key))[0]
+    return name[:-len("_thumb")] if name.endswith("_thumb") else name
+
+def _batch_get_items(file_ids):
+    """
+    { fileId: raw item (fileId, key, thumbnailKey) } for the given fileIds with
+    BatchGetItem (100 keys per call). Ids that don't exist in the table are left out.
+    """
+    by_id = {}
+    for i in range(0, len(file_ids), 100):
+        request = {TABLE_NAME: {
+            "Keys": [{"fileId": {"S": fid}} for fid in file_ids[i:i + 100]],
+            "ProjectionExpression": "fileId, #k, thumbnailKey",
+            "ExpressionAttributeNames": {"#k": "key"}
+        }}
+        while request:
+            resp = dynamodb_client.batch_get_item(RequestItems=request)
+            for item in resp.get("Responses", {}).get(TABLE_NAME, []):
+                by_id[item["fileId"]["S"]] = item
+            request = resp.get("UnprocessedKeys") or None
+    return by_id
+
+def _scan_by_keys(object_keys):
+    """
+    Raw items whose "key" or "thumbnailKey" is one of object_keys.
+    One parallel scan per 100 keys (the limit of an IN list).
+    """
+    for i in range(0, len(object_keys), 100):
+        chunk = object_keys[i:i + 100]
+        values = {f":k{j}": {"S": key} for j, key in enumerate(chunk)}
+        in_list = ", ".join(values)
+        for page in parallel_scan(
+            dynamodb_client,
+            TABLE_NAME,
+            ProjectionExpression="fileId, #k, thumbnailKey",
+            FilterExpression=f"thumbnailKey IN ({in_list}) OR #k IN ({in_list})",
+            ExpressionAttributeNames={"#k": "key"},
+            ExpressionAttributeValues=values
+        ):
+            yield from page
+
+def _apply_tag_edits(file_ids, operation, requested_tags):
+    """
+    Apply an add/remove of requested_tags ({ species: count }) to every file:
+    the item updates run concurrently, species index changes go out in shared
+    BatchWriteItem calls and the /stats counters get one combined ADD.
+    Returns (updated_items for the response, fileIds that don't exist).
+    """
+    if not file_ids:
+        return [], []
+
+    def write(file_id):
+        return file_id, _mutate_tags(file_id, operation, requested_tags)
+
+    with ThreadPoolExecutor(max_workers=max(1, min(UPDATE_WORKERS, len(file_ids)))) as pool:
+        results = list(pool.map(write, file_ids))
+
+    updated_items, missing = [], []
+    index_requests = []
+    stats = {}
+    for file_id, old_item in results:
+        if old_item is None:
+            missing.append(file_id)
+            continue
+        # The update was atomic, so the old item plus the edit is exactly what is stored now
+        old_tag_map = decode_tag_counts(old_item)
+        new_tag_map = dict(old_tag_map)
+        for name, count in requested_tags.items():
+            if operation == "add":
+                new_tag_map[name] = count
+            else:
+                new_tag_map.pop(name, None)
+        updated_items.append({
+            "fileId": file_id,
+            "tags": [{"name": nm, "count": ct} for nm, ct in new_tag_map.items()]
+        })
+        if new_tag_map == old_tag_map:
+            continue
+        index_requests.extend(_species_index_requests(file_id, old_tag_map, new_tag_map))
+        if TAG_STATS_TABLE:
+            for attr, n in stats_delta(old_item.get("type", {}).get("S"), old_tag_map, new_tag_map).items():
+                stats[attr] = stats.get(attr, 0) + n
+
+    _write_species_index(index_requests)
+    stats = {attr: n for attr, n in stats.items() if n}
+    if stats:
+        apply_stats_delta(dynamodb_client, TAG_STATS_TABLE, stats)
+    return updated_items, missing
+
+def _mutate_tags(file_id, operation, requested_tags):
+    """
+    SET (add) or REMOVE (remove) each requested species in the item's tags
+    map, in one UpdateItem without reading the item first. Concurrent edits
+    and tagging writes of other species are left alone.
+    Returns the item as it was before the update, or None if there is no such file.
+    Items whose tags are still a list (or missing) fail the attribute_type
+    condition; they are migrated to a map and the update is tried again.
+    """
+    names = {"#tg": "tags"}
+    values = {":map": {"S": "M"}}
+    paths = []
+    for i, (name, count) in enumerate(requested_tags.items()):
+        names[f"#s{i}"] = name
+        if operation == "add":
+            values[f":c{i}"] = {"N": str(count)}
+            paths.append(f"#tg.#s{i} = :c{i}")
+        else:
+            paths.append(f"#tg.#s{i}")
+    expression = ("SET " if operation == "add" else "REMOVE ") + ", ".join(paths)
+
+    for _ in range(MAX_UPDATE_ATTEMPTS):
+        try:
+            resp = dynamodb_client.update_item(
+                TableName=TABLE_NAME,
+                Key={"fileId": {"S": file_id}},
+                UpdateExpression=expression,
+                ConditionExpression="attribute_type(#tg, :map)",
+                ExpressionAttributeNames=names,
+                ExpressionAttributeValues=values,
+                ReturnValues="ALL_OLD",
+                ReturnValuesOnConditionCheckFailure="ALL_OLD"
+            )
+            return resp.get("Attributes", {})
+        except ClientError as e:
+            if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+                raise
+            item = e.response.get("Item")
+            if not item:
+                return None
+            migrate_item(dynamodb_client, TABLE_NAME, item)
+    raise RuntimeError(f"Could not update tags of {file_id} after {MAX_UPDATE_ATTEMPTS} attempts")
+
 def handle_delete_resource(event):
     """
     Processes the delete request:
@@ -175,37 +304,45 @@ def handle_delete_resource(event):
             return _response(400, {"message": "Invalid URL format"})
 
         # 2. Scan DynamoDB for item where "key" equals this object_key
-        scan_resp = dynamodb_client.scan(
-            TableName=TABLE_NAME,
-            FilterExpression="#k = :k",
-            ExpressionAttributeNames={"#k": "key"},
-            ExpressionAttributeValues={":k": {"S": object_key}}
-        )
-        items = scan_resp.get("Items", [])
+        items = [
+            item
+            for page in parallel_scan(
+                dynamodb_client,
+                TABLE_NAME,
+                FilterExpression="#k = :k",
+                ExpressionAttributeNames={"#k": "key"},
+                ExpressionAttributeValues={":k": {"S": object_key}}
+            )
+            for item in page
+        ]
         if not items:
             return _response(404, {"message": "Resource not found in DynamoDB"})
 
         # 3. Delete every match
         deleted_records = []
+        error_response = None
         for item in items:
-            item_id    = item["fileId"]["S"]
-            item_type  = item.get("type", {}).get("S", "")
-            thumb_key  = item.get("thumbnailKey", {}).get("S", "")
+            record     = decode_item(item)
+            item_id    = record.file_id
+            item_type  = record.media_type
+            thumb_key  = record.thumbnail_key
 
             # 3.1. Delete main object from S3
             try:
                 s3_client.delete_object(Bucket=BUCKET_NAME, Key=object_key)
             except ClientError as e:
                 if e.response["Error"]["Code"] != "NoSuchKey":
-                    return _response(500, {"message": "Failed to delete S3 object", "error": str(e)})
+                    error_response = _response(500, {"message": "Failed to delete S3 object", "error": str(e)})
+                    break
 
             # 3.2. If this item is an image and has a thumbnailKey, delete thumbnail
-            if item_type.lower() == "image" and thumb_key:
+            if item_type == "image" and thumb_key:
                 try:
                     s3_client.delete_object(Bucket=BUCKET_NAME, Key=thumb_key)
                 except ClientError as e:
                     if e.response["Error"]["Code"] != "NoSuchKey":
-                        return _response(500, {"message": "Failed to delete thumbnail", "error": str(e)})
+                        error_response = _response(500, {"message": "Failed to delete thumbnail", "error": str(e)})
+                        break
 
             # 3.3. Delete item from DynamoDB by primary key "id"
             try:
@@ -214,10 +351,32 @@ def handle_delete_resource(event):
                     Key={"fileId": {"S": item_id}}
                 )
             except ClientError as e:
-                return _response(500, {"message": "Failed to delete DynamoDB record", "error": str(e)})
-
+                error_response = _response(500, {"message": "Failed to delete DynamoDB record", "error": str(e)})
+                break
             deleted_records.append(item_id)
 
+            # 3.4. The record is gone; a failed index or counter update is logged, not
+            # reported as a failed delete (query re-checks drop stale index entries,
+            # the daily stats reconcile fixes the counters)
+            try:
+                _sync_species_index(item_id, record.counts, {})
+            except Exception as e:
+                print(f"Species index update for deleted {item_id} failed: {e}")
+            try:
+                _update_tag_stats(item_type, record.counts, {}, file_removed=True)
+            except Exception as e:
+                print(f"Tag stats update for deleted {item_id} failed: {e}")
+
+        # Cached query results may list anything deleted so far, even if a later delete failed
+        if deleted_records:
+            try:
+                _bump_tag_generation()
+            except Exception as e:
+                print(f"Could not bump tag generation: {e}")
+
+        if error_response is not None:
+            return error_response
+
         return _response(200, {
             "message": "Deleted resource successfully",
             "deleted_ids": deleted_records
@@ -228,6 +387,68 @@ def handle_delete_resource(event):
     except Exception as e:
         return _response(500, {"message": "Internal error", "error": str(e)})
 
+def _sync_species_index(file_id, old_tag_map, new_tag_map):
+    """
+    Apply the difference between two { name: count } maps to the species index table.
+    """
+    _write_species_index(_species_index_requests(file_id, old_tag_map, new_tag_map))
+
+def _species_index_requests(file_id, old_tag_map, new_tag_map):
+    """
+    BatchWriteItem requests for the difference between two { name: count } maps
+    (tagging_records.species_index_changes in wire format).
+    """
+    if not SPECIES_INDEX_TABLE:
+        return []
+
+    deletes, puts = species_index_changes(file_id, old_tag_map, new_tag_map)
+    requests = [
+        {"DeleteRequest": {"Key": {"species": {"S": key["species"]}, "countKey": {"S": key["countKey"]}}}}
+        for key in deletes
+    ]
+    requests.extend(
+        {"PutRequest": {"Item": {
+            "species": {"S": item["species"]},
+            "countKey": {"S": item["countKey"]},
+            "fileId": {"S": item["fileId"]},
+            "count": {"N": str(item["count"])}
+        }}}
+        for item in puts
+    )
+    return requests
+
+def _write_species_index(requests):
+    # BatchWriteItem takes at most 25 requests per call
+    for i in range(0, len(requests), 25):
+        pending = {SPECIES_INDEX_TABLE: requests[i:i + 25]}
+        while pending:
+            resp = dynamodb_client.batch_write_item(RequestItems=pending)
+            pending = resp.get("UnprocessedItems") or None
+
+def _update_tag_stats(media_type, old_tag_map, new_tag_map, file_removed=False):
+    """
+    ADD the change of one file's tags to the /stats counters.
+    """
+    if not TAG_STATS_TABLE:
+        return
+    delta = stats_delta(media_type, old_tag_map, new_tag_map, file_removed=file_removed)
+    if delta:
+        apply_stats_delta(dynamodb_client, TAG_STATS_TABLE, delta)
+
+def _bump_tag_generation():
+    """
+    Increment the tag-write generation so warm query containers drop cached results.
+    """
+    if not QUERY_META_TABLE:
+        return
+    dynamodb_client.update_item(
+        TableName=QUERY_META_TABLE,
+        Key={"name": {"S": TAG_GENERATION_KEY}},
+        UpdateExpression="ADD #g :one",
+        ExpressionAttributeNames={"#g": "generation"},
+        ExpressionAttributeValues={":one": {"N": "1"}}
+    )
+
 def _response(status_code, body_obj):
     return {
         "statusCode": status_code,
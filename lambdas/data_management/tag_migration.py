@@ -0,0 +1,150 @@
+import os
+import sys
+import json
+import boto3
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timezone
+from botocore.exceptions import ClientError
+from media_records import decode_tag_counts
+from parallel_scan import parallel_scan
+
+TABLE_NAME  = os.environ.get("TABLE_NAME", "BirdMediaTags")
+BUCKET_NAME = os.environ.get("BUCKET_NAME", "birdtagbucket-assfdas")
+REGION      = os.environ.get("REGION", "us-east-1")
+# Concurrent conditional writes per scan page
+MIGRATION_WORKERS = int(os.environ.get("MIGRATION_WORKERS", "16"))
+
+dynamodb_client = boto3.client("dynamodb", region_name=REGION)
+s3_client       = boto3.client("s3", region_name=REGION)
+
+def lambda_handler(event, context):
+    """
+    Converts list-shaped "tags" attributes ([{name, count}, ...]) to the
+    species -> count map that /update-tags edits with SET tags.#s / REMOVE tags.#s.
+    Items without a tags attribute get an empty map.
+
+    Every write is conditional on the item still holding the scanned value,
+    so tags changed while the migration runs are never overwritten; such
+    items are counted as "skipped" and picked up by a second run.
+    With { "dryRun": true } the items are only counted.
+    With { "backfillUploadedAt": true } it runs backfill_uploaded_at instead.
+    Also runnable by hand: python tag_migration.py [--dry-run] [--backfill-uploaded-at]
+    """
+    dry_run = bool((event or {}).get("dryRun"))
+    if (event or {}).get("backfillUploadedAt"):
+        return backfill_uploaded_at(dry_run)
+    counts = {"scanned": 0, "migrated": 0, "skipped": 0}
+
+    with ThreadPoolExecutor(max_workers=MIGRATION_WORKERS) as pool:
+        for page in parallel_scan(
+            dynamodb_client,
+            TABLE_NAME,
+            ProjectionExpression="fileId, #tg",
+            FilterExpression="attribute_not_exists(#tg) OR attribute_type(#tg, :list)",
+            ExpressionAttributeNames={"#tg": "tags"},
+            ExpressionAttributeValues={":list": {"S": "L"}}
+        ):
+            counts["scanned"] += len(page)
+            if dry_run:
+                continue
+            for migrated in pool.map(lambda raw: migrate_item(dynamodb_client, TABLE_NAME, raw), page):
+                counts["migrated" if migrated else "skipped"] += 1
+
+    print(f"Tag migration{' (dry run)' if dry_run else ''}: {counts}")
+    return {"statusCode": 200, "body": json.dumps(counts)}
+
+def tags_map(raw):
+    """
+    Wire-format tags map ({"M": {species: {"N": count}}}) for a raw item of either shape.
+    Names are normalized, as everywhere the map is read or written.
+    """
+    return {"M": {species: {"N": str(count)} for species, count in decode_tag_counts(raw).items()}}
+
+def migrate_item(client, table_name, raw):
+    """
+    Rewrite one item's list-shaped (or missing) tags as a map.
+    Returns False if the item changed since `raw` was read, or no longer exists.
+    """
+    old = raw.get("tags")
+    kwargs = {"ExpressionAttributeValues": {":map": tags_map(raw)}}
+    if old is None:
+        kwargs["ConditionExpression"] = "attribute_exists(fileId) AND attribute_not_exists(#tg)"
+    else:
+        kwargs["ConditionExpression"] = "#tg = :old"
+        kwargs["ExpressionAttributeValues"][":old"] = old
+    try:
+        client.update_item(
+            TableName=table_name,
+            Key={"fileId": raw["fileId"]},
+            UpdateExpression="SET #tg = :map",
+            ExpressionAttributeNames={"#tg": "tags"},
+            **kwargs
+        )
+        return True
+    except ClientError as e:
+        if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+            raise
+        return False
+
+def backfill_uploaded_at(dry_run=False):
+    """
+    Give records written before uploadedAt existed the LastModified time of
+    their S3 object, so they enter the (type, uploadedAt) GSI and time-window
+    queries. Writes are conditional on uploadedAt still being absent; records
+    whose object is gone are counted as "unresolved" and left alone.
+    """
+    counts = {"scanned": 0, "backfilled": 0, "skipped": 0, "unresolved": 0}
+
+    with ThreadPoolExecutor(max_workers=MIGRATION_WORKERS) as pool:
+        for page in parallel_scan(
+            dynamodb_client,
+            TABLE_NAME,
+            ProjectionExpression="fileId, #k, #b",
+            FilterExpression="attribute_not_exists(#u)",
+            ExpressionAttributeNames={"#k": "key", "#b": "bucket", "#u": "uploadedAt"}
+        ):
+            counts["scanned"] += len(page)
+            if dry_run:
+                continue
+            for outcome in pool.map(lambda raw: backfill_item(dynamodb_client, s3_client, TABLE_NAME, raw), page):
+                counts[outcome] += 1
+
+    print(f"uploadedAt backfill{' (dry run)' if dry_run else ''}: {counts}")
+    return {"statusCode": 200, "body": json.dumps(counts)}
+
+def backfill_item(client, s3, table_name, raw):
+    """
+    SET one record's uploadedAt from its object's LastModified.
+    Returns "backfilled", "skipped" (uploadedAt appeared meanwhile, or the
+    record is gone) or "unresolved" (no S3 object to date it by).
+    """
+    key = raw.get("key", {}).get("S")
+    if not key:
+        return "unresolved"
+    try:
+        head = s3.head_object(Bucket=raw.get("bucket", {}).get("S") or BUCKET_NAME, Key=key)
+    except ClientError as e:
+        if e.response["Error"]["Code"] not in ("404", "NoSuchKey", "403"):
+            raise
+        return "unresolved"
+    # Same format lambda_upload writes: millisecond precision, UTC, "Z"
+    modified = head["LastModified"].astimezone(timezone.utc)
+    uploaded_at = modified.strftime("%Y-%m-%dT%H:%M:%S.") + f"{modified.microsecond // 1000:03d}Z"
+    try:
+        client.update_item(
+            TableName=table_name,
+            Key={"fileId": raw["fileId"]},
+            UpdateExpression="SET #u = :u",
+            ConditionExpression="attribute_exists(fileId) AND attribute_not_exists(#u)",
+            ExpressionAttributeNames={"#u": "uploadedAt"},
+            ExpressionAttributeValues={":u": {"S": uploaded_at}}
+        )
+        return "backfilled"
+    except ClientError as e:
+        if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+            raise
+        return "skipped"
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    lambda_handler({"dryRun": "--dry-run" in args, "backfillUploadedAt": "--backfill-uploaded-at" in args}, None)
@@ -13,6 +13,18 @@ lambda_client = boto3.client('lambda')
 TABLE_NAME = os.environ['TABLE_NAME']
 THUMBNAIL_FOLDER = 'thumbnails/'
 
+def dhash(image):
+    """
+    64-bit difference hash (16 hex chars) of a BGR image, used by query-by-file
+    to recognise near-duplicates. Must stay identical to query/image_hash.py's dhash.
+    """
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    small = cv2.resize(gray, (9, 8), interpolation=cv2.INTER_AREA)
+    value = 0
+    for bit in (small[:, 1:] > small[:, :-1]).flatten():
+        value = value << 1 | int(bit)
+    return f"{value:016x}"
+
 def lambda_handler(event, context):
     try:
         print("Event received:", event)
@@ -26,12 +38,15 @@ def lambda_handler(event, context):
             return {'statusCode': 200, 'body': 'Not an image.'}
 
         file_id = key.split('/')[-1].split('.')[0]
+        # S3 event time, e.g. "2025-05-01T10:00:00.123Z"; same format lambda_upload stores
+        uploaded_at = record.get('eventTime')
 
         download_path = f"/tmp/{uuid.uuid4()}.jpg"
         s3.download_file(bucket, key, download_path)
 
         image = cv2.imread(download_path)
         thumbnail = cv2.resize(image, (128, 128))
+        image_hash = dhash(image)
 
         thumbnail_filename = f"{file_id}_thumb.jpeg"
         thumbnail_path = f"/tmp/{thumbnail_filename}"
@@ -41,11 +56,19 @@ def lambda_handler(event, context):
         s3.upload_file(thumbnail_path, bucket, thumbnail_key, ExtraArgs={'ContentType': 'image/jpeg'})
 
         table = dynamodb.Table(TABLE_NAME)
-        table.update_item(
+        update_expression = 'SET thumbnailKey = :thumb, dHash = :dh'
+        expression_values = {':thumb': thumbnail_key, ':dh': image_hash}
+        if uploaded_at:
+            update_expression += ', uploadedAt = if_not_exists(uploadedAt, :up)'
+            expression_values[':up'] = uploaded_at
+        updated = table.update_item(
             Key={'fileId': file_id},
-            UpdateExpression='SET thumbnailKey = :thumb',
-            ExpressionAttributeValues={':thumb': thumbnail_key}
+            UpdateExpression=update_expression,
+            ExpressionAttributeValues=expression_values,
+            ReturnValues='ALL_NEW'
         )
+        # Prefer the timestamp lambda_upload already stored
+        uploaded_at = updated.get('Attributes', {}).get('uploadedAt', uploaded_at)
 
         file_size = os.path.getsize(download_path)
         lambda_payload = {
@@ -55,7 +78,9 @@ def lambda_handler(event, context):
             "size": file_size,
             "type": "image",
             "format": key.lower().split('.')[-1],
-            "thumbnailKey": thumbnail_key
+            "thumbnailKey": thumbnail_key,
+            "uploadedAt": uploaded_at,
+            "dHash": image_hash
         }
 
         lambda_client.invoke(
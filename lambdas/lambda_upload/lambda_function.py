@@ -4,6 +4,7 @@ import uuid
 import mimetypes
 import base64
 import json
+from datetime import datetime, timezone
 
 s3 = boto3.client('s3', region_name="ap-southeast-2")
 dynamodb = boto3.resource('dynamodb')
@@ -11,6 +12,8 @@ lambda_client = boto3.client('lambda')
 
 BUCKET_NAME = os.environ['BUCKET_NAME']
 TABLE_NAME = os.environ['TABLE_NAME']
+# /stats counters; the file counts are ADDed here because this is where a file's record is created
+TAG_STATS_TABLE = os.environ.get('TAG_STATS_TABLE', 'BirdTagStats')
 
 def lambda_handler(event, context):
     try:
@@ -23,6 +26,9 @@ def lambda_handler(event, context):
         decoded = base64.b64decode(encoded)
 
         file_id = str(uuid.uuid4())
+        # UTC, millisecond precision; sorts lexicographically in time order (GSI sort key)
+        now = datetime.now(timezone.utc)
+        uploaded_at = now.strftime("%Y-%m-%dT%H:%M:%S.") + f"{now.microsecond // 1000:03d}Z"
         ext = os.path.splitext(file_name)[-1] or mimetypes.guess_extension(content_type) or ''
         ext = ext.replace(".", "")
         mime_type_main = content_type.split('/')[0]
@@ -55,9 +61,19 @@ def lambda_handler(event, context):
             'thumbnailKey': thumbnail_key,
             'type': mime_type_main,
             'format': ext,
-            'tags': []  # will be updated later
+            'uploadedAt': uploaded_at,
+            'tags': {}  # species -> count, filled in by the tagging Lambdas
         })
 
+        if TAG_STATS_TABLE:
+            # Counter names match lambdas/shared/tag_stats.py; the tagging Lambdas only add detections
+            dynamodb.Table(TAG_STATS_TABLE).update_item(
+                Key={'stat': 'totals'},
+                UpdateExpression='ADD #f :one, #ft :one',
+                ExpressionAttributeNames={'#f': 'files', '#ft': f'files#{mime_type_main}'},
+                ExpressionAttributeValues={':one': 1}
+            )
+
         lambda_payload = {
             "bucket": BUCKET_NAME,
             "key": key,
@@ -65,7 +81,8 @@ def lambda_handler(event, context):
             "size": len(decoded),
             "type": mime_type_main,
             "format": ext,
-            "thumbnailKey": thumbnail_key
+            "thumbnailKey": thumbnail_key,
+            "uploadedAt": uploaded_at
         }
 
         # Conditionally invoke the correct Lambda
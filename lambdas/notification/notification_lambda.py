@@ -62,6 +62,9 @@ def lambda_handler(event, context):
         file_id = message_data.get('file_id', 'N/A')
         media_type = message_data.get('media_type', 'N/A')
         raw_tags  = message_data.get('tags', [])
+        # Tagging Lambdas publish the stored species -> count map; older messages carry [{name, count}, ...]
+        if isinstance(raw_tags, dict):
+            raw_tags = [{'name': name, 'count': count} for name, count in raw_tags.items()]
 
         tags_html_list_items = []
         tags_text_list_items = []
@@ -0,0 +1,28 @@
+#!/bin/sh
+# Deployment zip of a zip-packaged Lambda (query, data_management) with the
+# modules in lambdas/shared copied in next to its handlers:
+#   lambdas/package_zip.sh query build/query.zip
+#   lambdas/package_zip.sh data_management build/data_management.zip
+set -e
+
+LAMBDAS_DIR=$(cd "$(dirname "$0")" && pwd)
+SOURCE_DIR="$LAMBDAS_DIR/$1"
+if [ -z "$1" ] || [ ! -d "$SOURCE_DIR" ] || [ -z "$2" ]; then
+    echo "usage: $0 <lambda dir under lambdas/> <output zip>" >&2
+    exit 1
+fi
+OUTPUT=$(mkdir -p "$(dirname "$2")" && cd "$(dirname "$2")" && pwd)/$(basename "$2")
+
+BUILD_DIR=$(mktemp -d)
+trap 'rm -rf "$BUILD_DIR"' EXIT
+
+cp "$SOURCE_DIR"/*.py "$LAMBDAS_DIR"/shared/*.py "$BUILD_DIR"/
+if [ -f "$SOURCE_DIR/requirements.txt" ]; then
+    # Binary wheels for the Lambda runtime (python3.12, x86_64)
+    pip install --quiet -r "$SOURCE_DIR/requirements.txt" -t "$BUILD_DIR" \
+        --platform manylinux2014_x86_64 --python-version 3.12 --only-binary=:all:
+fi
+
+rm -f "$OUTPUT"
+(cd "$BUILD_DIR" && zip -qr "$OUTPUT" .)
+echo "Wrote $OUTPUT"
@@ -0,0 +1,204 @@
+import os
+import time
+import uuid
+import zlib
+import boto3
+from botocore.exceptions import ClientError
+from image_hash import ImageHashIndex, format_hash, parse_hash
+from media_records import decode_tag_counts
+from parallel_scan import parallel_scan
+from species_bitmap import SpeciesBitmapIndex, dumps_changes, loads_changes
+from species_vocabulary import merge_vocabulary
+
+TABLE_NAME          = os.environ.get("TABLE_NAME", "BirdMediaTags")
+BITMAP_INDEX_BUCKET = os.environ.get("BITMAP_INDEX_BUCKET", os.environ.get("BUCKET_NAME", "birdtagbucket-assfdas"))
+BITMAP_INDEX_KEY    = os.environ.get("BITMAP_INDEX_KEY", "indexes/species_bitmap.bin")
+REGION              = os.environ.get("REGION", "us-east-1")
+VOCABULARY_BUCKET   = os.environ.get("VOCABULARY_BUCKET", BITMAP_INDEX_BUCKET)
+VOCABULARY_KEY      = os.environ.get("VOCABULARY_KEY", "indexes/species_vocabulary.txt.z")
+# Perceptual hashes of stored images (query-by-file near-duplicates), kept in the same bucket
+IMAGE_HASH_KEY      = os.environ.get("IMAGE_HASH_KEY", "indexes/image_hashes.bin")
+# Stream batches never rewrite an index: each writes its changes as a new, immutable
+# delta object under these prefixes, and { "compact": true }, run on a schedule,
+# folds the deltas into the indexes in one rewrite each
+BITMAP_DELTA_PREFIX     = os.environ.get("BITMAP_DELTA_PREFIX", "indexes/species_bitmap.deltas/")
+IMAGE_HASH_DELTA_PREFIX = os.environ.get("IMAGE_HASH_DELTA_PREFIX", "indexes/image_hashes.deltas/")
+# Deltas younger than this are left for the next compaction, so one whose PUT
+# is still in flight can't be overtaken by a later-named one
+DELTA_SETTLE_SECONDS = int(os.environ.get("DELTA_SETTLE_SECONDS", "60"))
+# Object metadata on each index: the last delta key folded into it
+APPLIED_THROUGH     = "applied-through"
+MAX_SAVE_ATTEMPTS   = 5
+
+dynamodb_client = boto3.client("dynamodb", region_name=REGION)
+s3_client       = boto3.client("s3", region_name=REGION)
+
+def lambda_handler(event, context):
+    """
+    Keeps the species bitmap index (and the image hash index) in S3 up to date.
+    - Invoked by the BirdMediaTags DynamoDB stream (NEW_AND_OLD_IMAGES): writes
+      the batch's tag and dHash changes as delta objects. Batches never touch
+      the indexes themselves, so concurrent shards don't race each other.
+    - Invoked with { "compact": true } (scheduled): applies the settled deltas,
+      in order, to each index with one conditional rewrite, then deletes them.
+    - Invoked with { "rebuild": true }: rebuilds both indexes from a full parallel scan.
+    Tag names not yet in the species vocabulary (/species/suggest) are added to it.
+    The query Lambda overlays the not yet compacted bitmap deltas on the index.
+    """
+    if event.get("compact"):
+        applied = _compact(BITMAP_INDEX_KEY, BITMAP_DELTA_PREFIX, SpeciesBitmapIndex, _apply_tag_changes)
+        applied_hashes = 0
+        if IMAGE_HASH_KEY:
+            applied_hashes = _compact(IMAGE_HASH_KEY, IMAGE_HASH_DELTA_PREFIX, ImageHashIndex, _apply_hash_changes)
+        return {"statusCode": 200, "body": f"Applied {applied} tag deltas, {applied_hashes} image hash deltas"}
+
+    if event.get("rebuild"):
+        # Deltas queued so far are covered by the scan; later ones still apply on top
+        covered = {prefix: _delta_keys(prefix) for prefix in (BITMAP_DELTA_PREFIX, IMAGE_HASH_DELTA_PREFIX)}
+        index = SpeciesBitmapIndex()
+        hashes = ImageHashIndex()
+        for page in parallel_scan(dynamodb_client, TABLE_NAME, ProjectionExpression="fileId, tags, dHash"):
+            for item in page:
+                index.set_tags(item["fileId"]["S"], {}, decode_tag_counts(item))
+                hashes.set(item["fileId"]["S"], parse_hash(item.get("dHash", {}).get("S")))
+        _save(index, None, force=True, applied_through=max(covered[BITMAP_DELTA_PREFIX], default=""))
+        _delete_keys(covered[BITMAP_DELTA_PREFIX])
+        if IMAGE_HASH_KEY:
+            _save(hashes, None, force=True, key=IMAGE_HASH_KEY,
+                  applied_through=max(covered[IMAGE_HASH_DELTA_PREFIX], default=""))
+            _delete_keys(covered[IMAGE_HASH_DELTA_PREFIX])
+        _update_vocabulary(index.thresholds.keys())
+        return {"statusCode": 200, "body": f"Rebuilt bitmap index with {len(index.file_ids)} files, {len(hashes)} image hashes"}
+
+    changes, hash_changes = [], []
+    for record in event.get("Records", []):
+        images = record.get("dynamodb", {})
+        old_image = images.get("OldImage", {})
+        new_image = images.get("NewImage", {})
+        file_id = (new_image or old_image).get("fileId", {}).get("S")
+        if file_id:
+            old_tags, new_tags = decode_tag_counts(old_image), decode_tag_counts(new_image)
+            if old_tags != new_tags:
+                changes.append((file_id, old_tags, new_tags))
+            old_hash = old_image.get("dHash", {}).get("S")
+            new_hash = new_image.get("dHash", {}).get("S")
+            if old_hash != new_hash:
+                hash_changes.append((file_id, parse_hash(new_hash)))
+
+    if changes:
+        _put_delta(BITMAP_DELTA_PREFIX, dumps_changes(changes))
+        _update_vocabulary({name for _, _, new_tags in changes for name in new_tags})
+    if hash_changes and IMAGE_HASH_KEY:
+        _put_delta(IMAGE_HASH_DELTA_PREFIX, _dumps_hash_changes(hash_changes))
+    return {"statusCode": 200, "body": f"Queued {len(changes)} tag changes, {len(hash_changes)} image hash changes"}
+
+def _apply_tag_changes(index, data):
+    for file_id, old_tags, new_tags in loads_changes(data):
+        index.set_tags(file_id, old_tags, new_tags)
+
+def _apply_hash_changes(hashes, data):
+    for line in zlib.decompress(data).decode().splitlines():
+        file_id, _, value = line.partition(" ")
+        hashes.set(file_id, parse_hash(value) if value != "-" else None)
+
+def _dumps_hash_changes(hash_changes):
+    # "<fileId> <hex dHash or ->" per line; "-" removes the fileId's hash
+    lines = (f"{fid} {format_hash(value) if value is not None else '-'}" for fid, value in hash_changes)
+    return zlib.compress("\n".join(lines).encode(), 6)
+
+def _put_delta(prefix, body):
+    # Time-ordered, unique name: no two writers ever touch the same object
+    key = f"{prefix}{time.time_ns():020d}-{uuid.uuid4().hex}"
+    s3_client.put_object(Bucket=BITMAP_INDEX_BUCKET, Key=key, Body=body, ContentType="application/octet-stream")
+
+def _delta_keys(prefix):
+    keys = []
+    paginator = s3_client.get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=BITMAP_INDEX_BUCKET, Prefix=prefix):
+        keys.extend(obj["Key"] for obj in page.get("Contents", []))
+    return sorted(keys)
+
+def _delete_keys(keys):
+    for i in range(0, len(keys), 1000):
+        s3_client.delete_objects(
+            Bucket=BITMAP_INDEX_BUCKET,
+            Delete={"Objects": [{"Key": key} for key in keys[i:i + 1000]], "Quiet": True}
+        )
+
+def _compact(key, prefix, index_class, apply_delta):
+    """
+    Apply the settled deltas under `prefix` to the index at `key`, oldest
+    first, save it conditionally, then delete them. Deltas at or before the
+    index's applied-through mark were already folded in (their delete failed
+    last time) and are only deleted. Returns the number of deltas applied.
+    """
+    settled_before = f"{prefix}{time.time_ns() - DELTA_SETTLE_SECONDS * 10**9:020d}"
+    for attempt in range(MAX_SAVE_ATTEMPTS):
+        keys = [k for k in _delta_keys(prefix) if k < settled_before]
+        if not keys:
+            return 0
+        index, etag, applied_through = _load(key, index_class)
+        done = [k for k in keys if k <= applied_through]
+        todo = [k for k in keys if k > applied_through]
+        for delta_key in todo:
+            try:
+                obj = s3_client.get_object(Bucket=BITMAP_INDEX_BUCKET, Key=delta_key)
+            except ClientError as e:
+                if e.response["Error"]["Code"] not in ("NoSuchKey", "404"):
+                    raise
+                # Deleted by a concurrent compaction, which then also saved the index
+                break
+            apply_delta(index, obj["Body"].read())
+        else:
+            if not todo or _save(index, etag, key=key, applied_through=todo[-1]):
+                _delete_keys(done + todo)
+                return len(todo)
+        print(f"Index {key} changed concurrently, retrying ({attempt + 1}/{MAX_SAVE_ATTEMPTS})")
+    raise RuntimeError(f"Could not compact {key} after concurrent modifications")
+
+def _update_vocabulary(names):
+    if not VOCABULARY_KEY or not names:
+        return
+    added = merge_vocabulary(s3_client, VOCABULARY_BUCKET, VOCABULARY_KEY, names)
+    if added:
+        print(f"Added {added} names to the species vocabulary")
+
+def _load(key=BITMAP_INDEX_KEY, index_class=SpeciesBitmapIndex):
+    """
+    (index, ETag, applied-through delta key) of the index at `key`;
+    an empty index if it doesn't exist yet.
+    """
+    try:
+        obj = s3_client.get_object(Bucket=BITMAP_INDEX_BUCKET, Key=key)
+        applied_through = obj.get("Metadata", {}).get(APPLIED_THROUGH, "")
+        return index_class.loads(obj["Body"].read()), obj["ETag"], applied_through
+    except ClientError as e:
+        if e.response["Error"]["Code"] not in ("NoSuchKey", "404"):
+            raise
+        return index_class(), None, ""
+
+def _save(index, etag, force=False, key=BITMAP_INDEX_KEY, applied_through=""):
+    """
+    Conditional put: only succeeds if the object still has `etag`
+    (or does not exist yet when etag is None). Returns False on a lost race.
+    `force` overwrites unconditionally (full rebuilds).
+    """
+    put_kwargs = {
+        "Bucket": BITMAP_INDEX_BUCKET,
+        "Key": key,
+        "Body": index.dumps(),
+        "ContentType": "application/octet-stream",
+        "Metadata": {APPLIED_THROUGH: applied_through}
+    }
+    if not force:
+        if etag:
+            put_kwargs["IfMatch"] = etag
+        else:
+            put_kwargs["IfNoneMatch"] = "*"
+    try:
+        s3_client.put_object(**put_kwargs)
+        return True
+    except ClientError as e:
+        if e.response["Error"]["Code"] in ("PreconditionFailed", "ConditionalRequestConflict"):
+            return False
+        raise
@@ -0,0 +1,194 @@
+import functools
+import struct
+import time
+import zlib
+from array import array
+
+HASH_BITS = 64
+# Multi-index hashing: the 64-bit hash is split into 4 chunks of 16 bits, each with its own bucket table
+MIH_CHUNKS = 4
+MIH_CHUNK_BITS = HASH_BITS // MIH_CHUNKS
+MIH_CHUNK_MASK = (1 << MIH_CHUNK_BITS) - 1
+MAGIC = b"birdtag-image-hashes-v1"
+
+_popcount = getattr(int, "bit_count", None) or (lambda v: bin(v).count("1"))
+
+def dhash(gray_image):
+    """
+    64-bit difference hash of a grayscale image (2-D uint8 array): shrink to
+    9x8, one bit per horizontally adjacent pair, set where the right pixel is
+    brighter. Survives re-encoding, resizing and small brightness changes.
+    Must stay identical to generate_thumbnail's copy.
+    """
+    import cv2
+    small = cv2.resize(gray_image, (9, 8), interpolation=cv2.INTER_AREA)
+    value = 0
+    for bit in (small[:, 1:] > small[:, :-1]).flatten():
+        value = value << 1 | int(bit)
+    return value
+
+def dhash_bytes(data):
+    """
+    dhash of an encoded image (JPEG, PNG, ...), or None if it can't be decoded.
+    Uses OpenCV where it is packaged (the in-process visual image), else
+    Pillow, which the zipped queryByFile ships. Pillow's luma and box
+    resampling can flip the odd near-tie bit against OpenCV's INTER_AREA;
+    NEAR_DUPLICATE_DISTANCE leaves room for that.
+    """
+    try:
+        import cv2
+        import numpy as np
+    except ImportError:
+        return _pil_dhash_bytes(data)
+    image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_GRAYSCALE)
+    return dhash(image) if image is not None else None
+
+def _pil_dhash_bytes(data):
+    import io
+    from PIL import Image, UnidentifiedImageError
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            small = image.convert("L").resize((9, 8), Image.BOX)
+    except (UnidentifiedImageError, OSError):
+        return None
+    pixels = list(small.getdata())
+    value = 0
+    for row in range(8):
+        for col in range(8):
+            value = value << 1 | int(pixels[row * 9 + col + 1] > pixels[row * 9 + col])
+    return value
+
+def format_hash(value):
+    return f"{value:016x}"
+
+def parse_hash(text):
+    try:
+        return int(text, 16) if text else None
+    except ValueError:
+        return None
+
+@functools.lru_cache(maxsize=None)
+def _flip_masks(radius):
+    # Every MIH_CHUNK_BITS-bit mask with at most `radius` bits set
+    masks = [0]
+    for _ in range(radius):
+        masks = sorted({m | 1 << b for m in masks for b in range(MIH_CHUNK_BITS)} | set(masks))
+    return tuple(masks)
+
+class ImageHashIndex:
+    """
+    fileId -> dHash of every stored image, searchable by Hamming distance.
+
+    Lookups use multi-index hashing: two hashes within distance d agree to
+    within d // MIH_CHUNKS bits on at least one of the MIH_CHUNKS chunks, so
+    only the buckets near the query's chunk values are verified.
+    Each chunk's buckets are stored as ordinals sorted by chunk value plus
+    2^16 + 1 offsets; loads() is a few array copies even at millions of hashes,
+    and the sorting happens in dumps() on the writer.
+    """
+
+    def __init__(self, hashes=None):
+        self.hashes     = dict(hashes or {})  # fileId -> int
+        self.updated_at = 0
+        self._file_ids  = None
+        self._values    = None
+        self._orders    = None
+        self._offsets   = None
+
+    def __len__(self):
+        return len(self.hashes) if self._file_ids is None else len(self._file_ids)
+
+    def set(self, file_id, value):
+        self._mutable()
+        if value is None:
+            self.hashes.pop(file_id, None)
+        else:
+            self.hashes[file_id] = value
+
+    def nearest(self, value, max_distance):
+        """
+        (fileId, distance) of the closest stored hash within `max_distance`,
+        ties to the smaller fileId; None if there is none.
+        """
+        self._searchable()
+        values, file_ids = self._values, self._file_ids
+        best = None
+        seen = set()
+        for chunk in range(MIH_CHUNKS):
+            shift = chunk * MIH_CHUNK_BITS
+            key = value >> shift & MIH_CHUNK_MASK
+            order, offsets = self._orders[chunk], self._offsets[chunk]
+            for mask in _flip_masks(max_distance // MIH_CHUNKS):
+                probe = key ^ mask
+                for n in order[offsets[probe]:offsets[probe + 1]]:
+                    if n in seen:
+                        continue
+                    seen.add(n)
+                    distance = _popcount(value ^ values[n])
+                    if distance <= max_distance:
+                        candidate = (distance, file_ids[n])
+                        if best is None or candidate < best:
+                            best = candidate
+        return (best[1], best[0]) if best else None
+
+    def dumps(self):
+        self._searchable()
+        n = len(self._file_ids)
+        parts = [MAGIC, b"\n", struct.pack("<QQ", int(self.updated_at or time.time()), n), self._values.tobytes()]
+        for chunk in range(MIH_CHUNKS):
+            parts.append(self._orders[chunk].tobytes())
+            parts.append(self._offsets[chunk].tobytes())
+        parts.append("\n".join(self._file_ids).encode())
+        # Only the fileIds compress; a fast level keeps the writer quick at millions of images
+        return zlib.compress(b"".join(parts), 1)
+
+    @classmethod
+    def loads(cls, data):
+        raw = zlib.decompress(data)
+        if not raw.startswith(MAGIC + b"\n"):
+            raise ValueError("Not an image hash index")
+        pos = len(MAGIC) + 1
+        updated_at, n = struct.unpack_from("<QQ", raw, pos)
+        pos += 16
+
+        def take(typecode, count):
+            nonlocal pos
+            values = array(typecode)
+            size = count * values.itemsize
+            values.frombytes(raw[pos:pos + size])
+            pos += size
+            return values
+
+        index = cls()
+        index.hashes     = None
+        index.updated_at = updated_at
+        index._values    = take("Q", n)
+        index._orders, index._offsets = [], []
+        for _ in range(MIH_CHUNKS):
+            index._orders.append(take("I", n))
+            index._offsets.append(take("I", (1 << MIH_CHUNK_BITS) + 1))
+        index._file_ids = raw[pos:].decode().split("\n") if n else []
+        return index
+
+    def _mutable(self):
+        # A loaded index is edited through its fileId -> hash dict
+        if self.hashes is None:
+            self.hashes = dict(zip(self._file_ids, self._values))
+        self._file_ids = None
+
+    def _searchable(self):
+        if self._file_ids is not None:
+            return
+        self._file_ids = sorted(self.hashes)
+        self._values = array("Q", (self.hashes[fid] for fid in self._file_ids))
+        self._orders, self._offsets = [], []
+        for chunk in range(MIH_CHUNKS):
+            shift = chunk * MIH_CHUNK_BITS
+            keys = [v >> shift & MIH_CHUNK_MASK for v in self._values]
+            counts = [0] * ((1 << MIH_CHUNK_BITS) + 1)
+            for key in keys:
+                counts[key + 1] += 1
+            for i in range(1, len(counts)):
+                counts[i] += counts[i - 1]
+            self._orders.append(array("I", sorted(range(len(keys)), key=keys.__getitem__)))
+            self._offsets.append(array("I", counts))
@@ -0,0 +1,120 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+INFERENCE_CACHE_SIZE = int(os.environ.get("INFERENCE_CACHE_SIZE", "512"))
+# DynamoDB TTL deletes expired items eventually; reads also check expiresAt themselves
+INFERENCE_CACHE_TTL  = int(os.environ.get("INFERENCE_CACHE_TTL", str(30 * 24 * 3600)))
+
+def content_key(data, model_version):
+    """
+    Cache key for a media file: the model version and the SHA-256 of its decoded bytes.
+    A new model version never sees results of an old one.
+    """
+    return digest_key(hashlib.sha256(data).hexdigest(), model_version)
+
+def digest_key(sha256_hex, model_version):
+    """
+    content_key for a file hashed incrementally (e.g. while streaming it from S3).
+    """
+    return f"{model_version}#{sha256_hex}"
+
+class InferenceCache:
+    """
+    Tagging results by content_key: an in-memory LRU in front of a DynamoDB
+    table (partition key "contentKey", TTL attribute "expiresAt").
+
+    The LRU serves repeats within the warm container without a round trip;
+    the table shares results between containers. `table_name` None keeps the
+    LRU only. Table errors are logged and count as misses, so tagging never
+    fails because of the cache.
+    """
+
+    def __init__(self, dynamodb_client, table_name, max_entries=INFERENCE_CACHE_SIZE,
+                 ttl_seconds=INFERENCE_CACHE_TTL, clock=time.time):
+        self.client      = dynamodb_client
+        self.table_name  = table_name
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.clock       = clock
+        self.hits        = 0
+        self.table_hits  = 0
+        self.misses      = 0
+        self._entries    = OrderedDict()  # content key -> (expires_at, result)
+        self._lock       = threading.Lock()
+
+    def get(self, key):
+        """
+        Cached tagging result ({"mediaType", "tags", ...}) for `key`, or None.
+        """
+        now = self.clock()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[key]
+
+        result = self._get_item(key, now)
+        with self._lock:
+            if result is None:
+                self.misses += 1
+                return None
+            self.table_hits += 1
+            self._remember(key, result[0], result[1])
+        return result[1]
+
+    def put(self, key, result):
+        expires_at = int(self.clock()) + self.ttl_seconds
+        with self._lock:
+            self._remember(key, expires_at, result)
+        if not self.table_name:
+            return
+        try:
+            self.client.put_item(
+                TableName=self.table_name,
+                Item={
+                    "contentKey": {"S": key},
+                    "result": {"S": json.dumps(result)},
+                    "expiresAt": {"N": str(expires_at)}
+                }
+            )
+        except Exception as e:
+            print(f"Could not store inference result {key}: {e}")
+
+    def _get_item(self, key, now):
+        # -> (expires_at, result) from the table, or None
+        if not self.table_name:
+            return None
+        try:
+            item = self.client.get_item(TableName=self.table_name, Key={"contentKey": {"S": key}}).get("Item")
+        except Exception as e:
+            print(f"Could not read inference result {key}: {e}")
+            return None
+        if not item:
+            return None
+        expires_at = int(item.get("expiresAt", {}).get("N", "0"))
+        if expires_at <= now:
+            return None
+        return expires_at, json.loads(item["result"]["S"])
+
+    def _remember(self, key, expires_at, result):
+        self._entries[key] = (expires_at, result)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def stats(self):
+        total = self.hits + self.table_hits + self.misses
+        return {
+            "hits": self.hits,
+            "tableHits": self.table_hits,
+            "misses": self.misses,
+            "size": len(self._entries),
+            "hitRatio": round((self.hits + self.table_hits) / total, 4) if total else 0.0
+        }
@@ -0,0 +1,96 @@
+"""
+HTTP front end for the query Lambda, for running it as a container behind the
+Lambda Web Adapter (AWS_LWA_INVOKE_MODE=RESPONSE_STREAM) or locally:
+
+    PORT=8080 python local_server.py
+
+POST /query and /find with "format": "ndjson" in the body (or an
+"Accept: application/x-ndjson" header) are written as chunked NDJSON while the
+read is still running; every other request is turned into an HTTP API event
+and passed to lambda_handler unchanged.
+"""
+import json
+import os
+import sys
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+# Run from a source checkout, the modules of lambdas/shared are not copied in yet
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "shared"))
+
+from query import lambda_handler, ndjson_lines  # noqa: E402
+
+PORT = int(os.environ.get("PORT", "8080"))
+NDJSON = "application/x-ndjson"
+STREAM_PATHS = ("/query", "/find")
+
+class QueryRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+    def do_OPTIONS(self):
+        self._dispatch("OPTIONS")
+
+    def _dispatch(self, method):
+        url = urlsplit(self.path)
+        length = int(self.headers.get("Content-Length") or 0)
+        raw_body = self.rfile.read(length).decode() if length else ""
+
+        if method == "POST" and url.path in STREAM_PATHS:
+            try:
+                body = json.loads(raw_body or "{}")
+            except ValueError:
+                body = None
+            if isinstance(body, dict) and (body.get("format") == "ndjson" or NDJSON in self.headers.get("Accept", "")):
+                self._stream(url.path, body)
+                return
+
+        event = {
+            "rawPath": url.path,
+            "rawQueryString": url.query,
+            "queryStringParameters": dict(parse_qsl(url.query)) or None,
+            "headers": {name.lower(): value for name, value in self.headers.items()},
+            "requestContext": {"http": {"method": method, "path": url.path}},
+            "body": raw_body or "{}"
+        }
+        result = lambda_handler(event, None)
+        body = result.get("body", "")
+        self._send(result.get("statusCode", 200), result.get("headers", {}), body.encode() if isinstance(body, str) else body)
+
+    def _stream(self, path, body):
+        try:
+            lines = ndjson_lines(path, body)
+        except ValueError as e:
+            self._send(400, {"Content-Type": "application/json"}, json.dumps({"message": str(e)}).encode())
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", NDJSON)
+        self.send_header("Transfer-Encoding", "chunked")
+        self.send_header("Access-Control-Allow-Origin", "*")
+        self.end_headers()
+        try:
+            for line in lines:
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(line), line))
+                self.wfile.flush()
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            # Client went away; stop reading DynamoDB
+            lines.close()
+
+    def _send(self, status, headers, payload):
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+if __name__ == "__main__":
+    print(f"Query API listening on :{PORT}")
+    ThreadingHTTPServer(("", PORT), QueryRequestHandler).serve_forever()
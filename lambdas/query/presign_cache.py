@@ -0,0 +1,65 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+PRESIGN_EXPIRES_IN    = int(os.environ.get("PRESIGN_EXPIRES_IN", "3600"))
+# Reuse a cached URL only while it has more than this many seconds of validity left
+PRESIGN_MIN_REMAINING = int(os.environ.get("PRESIGN_MIN_REMAINING", "900"))
+PRESIGN_CACHE_SIZE    = int(os.environ.get("PRESIGN_CACHE_SIZE", "10000"))
+
+class PresignedUrlCache:
+    """
+    LRU cache of presigned GET URLs keyed by (bucket, key).
+
+    Lives at module scope, so it survives for as long as the warm container.
+    A URL signed at time t is valid until t + expires_in; it is handed out again
+    only while more than `min_remaining` seconds of that lifetime are left, so
+    clients always get a link that stays usable for a reasonable time.
+    """
+
+    def __init__(self, s3_client, max_entries=PRESIGN_CACHE_SIZE, expires_in=PRESIGN_EXPIRES_IN,
+                 min_remaining=PRESIGN_MIN_REMAINING, clock=time.time):
+        self.s3_client     = s3_client
+        self.max_entries   = max_entries
+        self.expires_in    = expires_in
+        self.min_remaining = min_remaining
+        self.clock         = clock
+        self.hits          = 0
+        self.misses        = 0
+        self._entries      = OrderedDict()  # (bucket, key) -> (url, expires_at)
+        self._lock         = threading.Lock()
+
+    def get_url(self, bucket, key):
+        cache_key = (bucket, key)
+        now = self.clock()
+
+        with self._lock:
+            entry = self._entries.get(cache_key)
+            if entry is not None and entry[1] - now > self.min_remaining:
+                self._entries.move_to_end(cache_key)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+
+        url = self.s3_client.generate_presigned_url(
+            ClientMethod="get_object",
+            Params={"Bucket": bucket, "Key": key},
+            ExpiresIn=self.expires_in
+        )
+
+        with self._lock:
+            self._entries[cache_key] = (url, now + self.expires_in)
+            self._entries.move_to_end(cache_key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return url
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "size": len(self._entries),
+            "hitRatio": round(self.hits / total, 4) if total else 0.0
+        }
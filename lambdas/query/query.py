@@ -1,18 +1,86 @@
+import base64
+import heapq
 import json
 import os
 import boto3
 import urllib.parse
+from datetime import datetime, timezone
+from boto3.dynamodb.conditions import Key
 from botocore.exceptions import ClientError
+from media_records import MediaRecord, decode_item, decode_page
+from parallel_scan import choose_segment_count, parallel_scan, table_size_bytes
+from presign_cache import PresignedUrlCache
+from result_cache import QueryResultCache
+from scan_planner import plan_scan
+from s3_object_loader import S3ObjectLoader, S3PrefixLoader
+from species_bitmap import SpeciesBitmapIndex, loads_changes
+from species_stats import SpeciesCardinality
+from species_vocabulary import SpeciesTrie
+from tag_stats import TAG_STATS_KEY, format_stats
+from tagging_records import TAG_GENERATION_KEY
+from top_k import SORT_COUNT_PREFIX, TopK, sort_key_fn
 
 # DynamoDB and S3 configuration from environment variables
 TABLE_NAME  = os.environ.get("TABLE_NAME", "BirdMediaTags")
 BUCKET_NAME = os.environ.get("BUCKET_NAME", "birdtagbucket-assfdas")
 REGION      = os.environ.get("REGION", "us-east-1")
+# species -> fileId index table; set to "" to fall back to full table scans
+SPECIES_INDEX_TABLE = os.environ.get("SPECIES_INDEX_TABLE", "BirdSpeciesIndex")
+MAX_PAGE_LIMIT      = int(os.environ.get("MAX_PAGE_LIMIT", "500"))
+# GSI on (type, uploadedAt) used by time-window requests ("from" / "to" / "type" / "order")
+UPLOADED_AT_INDEX   = os.environ.get("UPLOADED_AT_INDEX", "TypeUploadedAtIndex")
+MEDIA_TYPES         = ("image", "video", "audio")
+LINK_MODES          = ("all", "thumb", "none")
+# Species bitmap index maintained by bitmap_refresh.py, off unless BITMAP_INDEX_KEY
+# is set (e.g. "indexes/species_bitmap.bin"). It trails tag writes by the stream
+# delay: a newly tagged file shows up once its delta is written and listed here.
+BITMAP_INDEX_BUCKET = os.environ.get("BITMAP_INDEX_BUCKET", BUCKET_NAME)
+BITMAP_INDEX_KEY    = os.environ.get("BITMAP_INDEX_KEY", "")
+BITMAP_DELTA_PREFIX = os.environ.get("BITMAP_DELTA_PREFIX", "indexes/species_bitmap.deltas/")
+BITMAP_REFRESH_SECONDS = int(os.environ.get("BITMAP_REFRESH_SECONDS", "60"))
+BITMAP_DELTA_REFRESH_SECONDS = int(os.environ.get("BITMAP_DELTA_REFRESH_SECONDS", "5"))
+# Species name vocabulary for /species/suggest, maintained by the tagging and bitmap refresh Lambdas
+VOCABULARY_BUCKET   = os.environ.get("VOCABULARY_BUCKET", BUCKET_NAME)
+VOCABULARY_KEY      = os.environ.get("VOCABULARY_KEY", "indexes/species_vocabulary.txt.z")
+MAX_SUGGESTIONS     = 50
+# Small table holding the tag-write generation; set to "" to disable the result cache
+QUERY_META_TABLE    = os.environ.get("QUERY_META_TABLE", "BirdQueryMeta")
+# Aggregate counters behind /stats, kept up to date by every tag writer
+TAG_STATS_TABLE     = os.environ.get("TAG_STATS_TABLE", "BirdTagStats")
+MAX_BATCH_QUERIES   = int(os.environ.get("MAX_BATCH_QUERIES", "50"))
+# Set to "1" to log presign/result cache hit rates after every request (off: one line per request adds up)
+LOG_CACHE_STATS     = os.environ.get("LOG_CACHE_STATS", "") == "1"
+# Above this many candidates, a species with no cardinality estimate is read from
+# the index (and learned) rather than probed item by item
+MAX_PROBE_CANDIDATES = int(os.environ.get("MAX_PROBE_CANDIDATES", "1000"))
 
 # Initialize boto3 resources/clients
-dynamodb   = boto3.resource("dynamodb", region_name=REGION)
-table      = dynamodb.Table(TABLE_NAME)
-s3_client  = boto3.client("s3", region_name=REGION)
+# Media records are read with the low-level client and decoded by media_records;
+# the resource is only used for the small index/meta tables.
+dynamodb_client = boto3.client("dynamodb", region_name=REGION)
+dynamodb    = boto3.resource("dynamodb", region_name=REGION)
+index_table = dynamodb.Table(SPECIES_INDEX_TABLE) if SPECIES_INDEX_TABLE else None
+meta_table  = dynamodb.Table(QUERY_META_TABLE) if QUERY_META_TABLE else None
+s3_client   = boto3.client("s3", region_name=REGION)
+# Presigned URLs are reused across invocations of the warm container
+url_cache   = PresignedUrlCache(s3_client)
+bitmap_loader = (
+    S3ObjectLoader(s3_client, BITMAP_INDEX_BUCKET, BITMAP_INDEX_KEY, SpeciesBitmapIndex.loads, BITMAP_REFRESH_SECONDS)
+    if BITMAP_INDEX_KEY else None
+)
+# Tag changes not yet compacted into the bitmap index, overlaid on its results
+bitmap_delta_loader = (
+    S3PrefixLoader(s3_client, BITMAP_INDEX_BUCKET, BITMAP_DELTA_PREFIX, loads_changes, BITMAP_DELTA_REFRESH_SECONDS)
+    if BITMAP_INDEX_KEY and BITMAP_DELTA_PREFIX else None
+)
+vocabulary_loader = (
+    S3ObjectLoader(s3_client, VOCABULARY_BUCKET, VOCABULARY_KEY, SpeciesTrie.loads, refresh_seconds=300)
+    if VOCABULARY_KEY else None
+)
+# Query results are reused until the next tag write or their TTL
+result_cache = QueryResultCache()
+# Per-species cardinalities learned from species index lookups, used to order them
+cardinality = SpeciesCardinality()
 
 def lambda_handler(event, context):
     path   = event.get("rawPath") or event.get("path", "")
@@ -24,6 +92,14 @@ def lambda_handler(event, context):
         return handle_find(event)
     elif path == "/find-full-image" and method == "POST":
         return handle_find_full_image(event)
+    elif path == "/sign" and method == "POST":
+        return handle_sign(event)
+    elif path == "/query-batch" and method == "POST":
+        return handle_query_batch(event)
+    elif path == "/species/suggest" and method == "GET":
+        return handle_species_suggest(event)
+    elif path == "/stats" and method == "GET":
+        return handle_stats(event)
     else:
         return {
             "statusCode": 404,
@@ -35,50 +111,66 @@ def handle_query(event):
     """
     Handle POST /query
     Expects JSON body:
-      { "species": [ { "name": "...", "count": ... }, ... ] }
+      { "species": [ { "name": "...", "count": ... }, ... ], "limit": 50, "cursor": "...", "links": "all" }
     Returns items where each specified species appears at least that many times.
+    "links" ("all" | "thumb" | "none") limits which presigned URLs are generated.
+    "limit" and "cursor" are optional; when "limit" is given the response carries
+    "nextCursor" (null on the last page) to pass back for the next page.
+    "from" / "to" (ISO 8601, "to" exclusive), "type" ("image" | "video" | "audio")
+    and "order" ("desc" newest first, default, or "asc") restrict results to an
+    upload-time window and return them in time order; "species" may then be empty.
+    "sort" ("count:<species>" | "detections" | "uploadedAt") with "k" returns only
+    the k highest-ranked matches, best first, instead of pages.
+    "format": "ndjson" returns NDJSON instead (see ndjson_lines).
     """
     try:
         body = json.loads(event.get("body", "{}"))
-        filters = body.get("species", [])
-        if not isinstance(filters, list) or len(filters) == 0:
-            return _response(400, {"message": "species must be a non-empty list"})
-
-        # Scan entire table
-        scan_kwargs = {}
-        items = []
-        done = False
-        last_evaluated_key = None
-
-        while not done:
-            if last_evaluated_key:
-                scan_kwargs["ExclusiveStartKey"] = last_evaluated_key
-            resp = table.scan(**scan_kwargs)
-            items.extend(resp.get("Items", []))
-            last_evaluated_key = resp.get("LastEvaluatedKey")
-            done = last_evaluated_key is None
-
-        # For each item, build a dict: { tagName: tagCount, ... }
-        def match_item(item):
-            item_tags = { t["name"].lower(): int(t["count"]) for t in item.get("tags", []) }
-            for f in filters:
-                name = f.get("name").lower()
-                cnt  = int(f.get("count", 0))
-                if name not in item_tags or item_tags[name] < cnt:
-                    return False
-            return True
-
-        matched_raw = [item for item in items if match_item(item)]
-
-        # Transform each item to include presigned URLs
-        matched = [ transform_item(item) for item in matched_raw ]
-
-        return _response(200, {"results": matched})
+        if body.get("format") == "ndjson":
+            return _ndjson_response(ndjson_lines("/query", body))
+        return _response(200, run_query(body))
 
+    except ValueError as e:
+        return _response(400, {"message": str(e)})
     except Exception as e:
         print("handle_query error:", e)
         return _response(500, {"message": "Internal Server Error", "error": str(e)})
 
+def run_query(body):
+    """
+    The /query matching itself: takes the parsed request body (see handle_query)
+    and returns the response body ({ "results": [...], "nextCursor": ... }).
+    Raises ValueError for an invalid request.
+    Importable, so callers such as queryByFile can match in process.
+    """
+    species_filters, window, limit, cursor, links = _parse_query_body(body)
+    sort, k = _parse_top_k(body)
+
+    if sort is not None:
+        # Top k over every match; only the k winners are held and presigned
+        resolve = lambda: (
+            TopK(k, sort_key_fn(sort)).extend(_iter_query(species_filters, window)).results(),
+            None
+        )
+        paging = ("top", sort, k)
+    elif window is not None:
+        resolve = lambda: _page_from_time_index(
+            _match_all_fn(species_filters), plan_scan(species_filters, "all"), window, limit, cursor
+        )
+        paging = limit
+    else:
+        resolve = lambda: _resolve_query(species_filters, limit, cursor)
+        paging = limit
+    matched_raw, next_cursor = _cached(
+        ("query", species_filters, paging, body.get("cursor"), _window_key(window)),
+        resolve
+    )
+
+    # Transform each item of the page to include presigned URLs
+    matched = [ transform_item(item, links) for item in matched_raw ]
+    _log_cache_stats()
+
+    return _results_body(matched, limit, next_cursor)
+
 def handle_find(event):
     """
     Handle POST /find
@@ -87,167 +179,1122 @@ def handle_find(event):
         "species": [
           { "name": "crow" },
           { "name": "pigeon" }
-        ]
+        ],
+        "limit": 50,      # optional
+        "cursor": "...",  # optional, "nextCursor" of the previous page
+        "links": "thumb", # optional, "all" (default) | "thumb" | "none"
+        "from": "2025-05-01", "to": "2025-05-08", "type": "video", "order": "desc",  # optional, as for /query
+        "format": "ndjson"  # optional, NDJSON (see ndjson_lines)
       }
     Returns all items where at least one tag.name matches any requested species.
+    With a time window and no species, every upload in the window is returned.
     """
     try:
         body = json.loads(event.get("body", "{}"))
-        requested = body.get("species", [])
-        if not isinstance(requested, list) or len(requested) == 0:
-            return _response(400, {"message": "species must be a non-empty list of {name} objects"})
-
-        # Build a set of lowercase species names from requested list of dicts
-        requested_set = set([
-            entry.get("name", "").lower()
-            for entry in requested
-            if isinstance(entry, dict) and entry.get("name", "").strip() != ""
-        ])
-        if not requested_set:
-            return _response(400, {"message": "Each element in species must be a dict with a non-empty 'name'"})
-
-        # Scan entire table
-        items = []
-        scan_kwargs = {}
-        done = False
-        last_evaluated_key = None
-
-        while not done:
-            if last_evaluated_key:
-                scan_kwargs["ExclusiveStartKey"] = last_evaluated_key
-            resp = table.scan(**scan_kwargs)
-            items.extend(resp.get("Items", []))
-            last_evaluated_key = resp.get("LastEvaluatedKey")
-            done = last_evaluated_key is None
-
-        # Filter items: include an item if any of its tags matches requested_set
-        def has_any_species(item):
-            for t in item.get("tags", []):
-                name = t.get("name", "").lower()
-                if name in requested_set:
-                    return True
-            return False
-
-        matched_raw = [item for item in items if has_any_species(item)]
-        matched = [ transform_item(item) for item in matched_raw ]
-
-        return _response(200, {"results": matched})
+        if body.get("format") == "ndjson":
+            return _ndjson_response(ndjson_lines("/find", body))
+        requested_names, window, limit, cursor, links = _parse_find_body(body)
 
+        if window is not None:
+            match_fn, scan_kwargs = _find_window_filter(requested_names)
+            resolve = lambda: _page_from_time_index(match_fn, scan_kwargs, window, limit, cursor)
+        else:
+            resolve = lambda: _resolve_find(requested_names, limit, cursor)
+        matched_raw, next_cursor = _cached(
+            ("find", requested_names, limit, body.get("cursor"), _window_key(window)),
+            resolve
+        )
+        matched = [ transform_item(item, links) for item in matched_raw ]
+        _log_cache_stats()
+
+        return _response(200, _results_body(matched, limit, next_cursor))
+
+    except ValueError as e:
+        return _response(400, {"message": str(e)})
     except Exception as e:
         print("handle_find error:", e)
         return _response(500, {"message": "Internal Server Error", "error": str(e)})
 
+def ndjson_lines(path, body):
+    """
+    NDJSON for "/query" or "/find": takes the same body as the JSON routes
+    and returns a generator of lines (bytes), one transformed item per line,
+    produced as soon as the item matches, so a caller that writes them out
+    (local_server.py) sends the first result before the scan or index walk is
+    finished and the full result set is never held in memory. The last line is { "done": true, "count": n }, or { "error": "..." }
+    if reading fails midway. "limit" caps the number of items; "cursor" is not
+    supported. Invalid requests raise ValueError before any line is produced.
+    """
+    if path == "/query":
+        species_filters, window, limit, cursor, links = _parse_query_body(body)
+        records = _iter_query(species_filters, window)
+    elif path == "/find":
+        requested_names, window, limit, cursor, links = _parse_find_body(body)
+        records = _iter_find(requested_names, window)
+    else:
+        raise ValueError(f"NDJSON is not supported for {path}")
+    if cursor:
+        raise ValueError("cursor is not supported with format ndjson")
+    if "sort" in body or "k" in body:
+        raise ValueError("sort and k are not supported with format ndjson")
+
+    def lines():
+        count = 0
+        try:
+            for record in records:
+                yield (json.dumps(transform_item(record, links), default=str) + "\n").encode()
+                count += 1
+                if limit is not None and count >= limit:
+                    break
+            yield (json.dumps({"done": True, "count": count}) + "\n").encode()
+        except Exception as e:
+            print(f"ndjson_lines {path} error:", e)
+            yield (json.dumps({"error": str(e), "count": count}) + "\n").encode()
+    return lines()
+
+def _parse_query_body(body):
+    """
+    Validate a /query body.
+    Returns (species_filters, window, limit, cursor, links); raises ValueError.
+    """
+    window, error = _parse_time_window(body)
+    if error:
+        raise ValueError(error)
+    filters = body.get("species", [])
+    if not isinstance(filters, list) or (len(filters) == 0 and window is None):
+        raise ValueError("species must be a non-empty list")
+    species_filters = _canonical_filters(filters)
+    if species_filters is None:
+        raise ValueError("Each element in species must be a dict with a non-empty 'name'")
+    limit, cursor, links = _parse_output_options(body)
+    return species_filters, window, limit, cursor, links
+
+def _parse_find_body(body):
+    """
+    Validate a /find body.
+    Returns (requested_names, window, limit, cursor, links); raises ValueError.
+    """
+    window, error = _parse_time_window(body)
+    if error:
+        raise ValueError(error)
+    requested = body.get("species", [])
+    if not isinstance(requested, list) or (len(requested) == 0 and window is None):
+        raise ValueError("species must be a non-empty list of {name} objects")
+
+    # Build a sorted tuple of normalized species names from requested list of dicts
+    requested_names = tuple(sorted(set([
+        _normalize_species(entry.get("name"))
+        for entry in requested
+        if isinstance(entry, dict) and _normalize_species(entry.get("name")) != ""
+    ])))
+    if not requested_names and requested:
+        raise ValueError("Each element in species must be a dict with a non-empty 'name'")
+    limit, cursor, links = _parse_output_options(body)
+    return requested_names, window, limit, cursor, links
+
+def _parse_top_k(body):
+    """
+    Validate optional "sort" / "k" of a /query body.
+    Returns (sort or None, k); a "count:<species>" sort is normalized.
+    """
+    if "sort" not in body and "k" not in body:
+        return None, None
+    sort, k = body.get("sort"), body.get("k")
+    if not isinstance(sort, str) or sort_key_fn(sort) is None:
+        raise ValueError("sort must be \"count:<species>\", \"detections\" or \"uploadedAt\"")
+    if sort.startswith(SORT_COUNT_PREFIX):
+        species = _normalize_species(sort[len(SORT_COUNT_PREFIX):])
+        if not species:
+            raise ValueError("sort must name a species after \"count:\"")
+        sort = SORT_COUNT_PREFIX + species
+    try:
+        k = int(k)
+    except (TypeError, ValueError):
+        raise ValueError("sort requires an integer k")
+    if k < 1 or k > MAX_PAGE_LIMIT:
+        raise ValueError(f"k must be between 1 and {MAX_PAGE_LIMIT}")
+    if "limit" in body or body.get("cursor"):
+        raise ValueError("k can't be combined with limit or cursor")
+    return sort, k
+
+def _parse_output_options(body):
+    limit, cursor, error = _parse_paging(body)
+    if error:
+        raise ValueError(error)
+    links = body.get("links", "all")
+    if links not in LINK_MODES:
+        raise ValueError("links must be one of " + ", ".join(LINK_MODES))
+    return limit, cursor, links
+
+def _find_window_filter(requested_names):
+    # No species: everything in the window
+    if not requested_names:
+        return _match_all_fn(()), plan_scan([], "all")
+    return _match_any_fn(requested_names), plan_scan([(name, 0) for name in requested_names], "any")
+
+def _resolve_query(species_filters, limit, cursor):
+    """
+    Items having every (species, min_count) of species_filters, one page at a time.
+    Uses the bitmap index if BITMAP_INDEX_KEY is set, otherwise the species index
+    table (the default), then a table scan if neither is configured.
+    """
+    bitmap_index = _bitmap_index()
+    if bitmap_index is not None:
+        # AND of the per-species "count >= N" bitmaps; the index lags tag
+        # writes, so its ids are only candidates and each record is re-checked
+        match_fn = _match_all_fn(species_filters)
+        file_ids = _bitmap_candidates(bitmap_index, bitmap_index.match_all(species_filters), match_fn)
+        return _page_from_candidates(file_ids, match_fn, limit, cursor)
+
+    if index_table is not None:
+        # Every filter is re-checked, not just the probed ones: an index entry
+        # left behind by a failed sync must not be returned as a match
+        file_ids, _ = _plan_index_query(species_filters)
+        return _page_from_candidates(file_ids, _match_all_fn(species_filters), limit, cursor)
+
+    return _page_from_scan(_match_all_fn(species_filters), limit, cursor, plan_scan(species_filters, "all"))
+
+def _resolve_find(species_names, limit, cursor):
+    """
+    Items tagged with at least one of species_names, one page at a time.
+    """
+    bitmap_index = _bitmap_index()
+    if bitmap_index is not None:
+        match_fn = _match_any_fn(species_names)
+        file_ids = _bitmap_candidates(bitmap_index, bitmap_index.match_any(species_names), match_fn)
+        return _page_from_candidates(file_ids, match_fn, limit, cursor)
+
+    if index_table is not None:
+        return _page_from_candidates(_find_index_ids(species_names), _match_any_fn(species_names), limit, cursor)
+
+    scan_kwargs = plan_scan([(name, 0) for name in species_names], "any")
+    return _page_from_scan(_match_any_fn(species_names), limit, cursor, scan_kwargs)
+
+def _iter_query(species_filters, window=None):
+    """
+    Records matching a /query, yielded as they are found (same read paths as _resolve_query).
+    """
+    if window is not None:
+        yield from _iter_time_index(_match_all_fn(species_filters), plan_scan(species_filters, "all"), window)
+        return
+
+    bitmap_index = _bitmap_index()
+    if bitmap_index is not None:
+        match_fn = _match_all_fn(species_filters)
+        file_ids = _bitmap_candidates(bitmap_index, bitmap_index.match_all(species_filters), match_fn)
+        yield from _iter_candidates(file_ids, match_fn)
+    elif index_table is not None:
+        file_ids, _ = _plan_index_query(species_filters)
+        yield from _iter_candidates(file_ids, _match_all_fn(species_filters))
+    else:
+        yield from _iter_scan(_match_all_fn(species_filters), plan_scan(species_filters, "all"))
+
+def _iter_find(species_names, window=None):
+    """
+    Records matching a /find, yielded as they are found (same read paths as _resolve_find).
+    """
+    if window is not None:
+        match_fn, scan_kwargs = _find_window_filter(species_names)
+        yield from _iter_time_index(match_fn, scan_kwargs, window)
+        return
+
+    bitmap_index = _bitmap_index()
+    if bitmap_index is not None:
+        match_fn = _match_any_fn(species_names)
+        file_ids = _bitmap_candidates(bitmap_index, bitmap_index.match_any(species_names), match_fn)
+        yield from _iter_candidates(file_ids, match_fn)
+    elif index_table is not None:
+        yield from _iter_candidates(_find_index_ids(species_names), _match_any_fn(species_names))
+    else:
+        scan_kwargs = plan_scan([(name, 0) for name in species_names], "any")
+        yield from _iter_scan(_match_any_fn(species_names), scan_kwargs)
+
+def _bitmap_index():
+    """
+    The species bitmap index, or None when it is off (the default) or has not
+    loaded: the resolvers then fall back to the species index table, with
+    _plan_index_query ordering multi-species reads by learned cardinality.
+    """
+    if bitmap_loader is None:
+        return None
+    bitmap_index = bitmap_loader.get()
+    if bitmap_index is None:
+        print("Species bitmap index unavailable, using the species index table")
+    return bitmap_index
+
+def _bitmap_candidates(bitmap_index, bitmap, match_fn):
+    """
+    fileIds of `bitmap`, with the tag changes not yet compacted into the index
+    applied on top: a file whose latest tags match is added, any other changed
+    file is dropped.
+    """
+    file_ids = bitmap_index.to_file_ids(bitmap)
+    if bitmap_delta_loader is None:
+        return file_ids
+    latest = {}
+    applied_through = bitmap_loader.metadata.get("applied-through", "")
+    for _, changes in bitmap_delta_loader.get(retain_after=applied_through):
+        for file_id, _, new_tags in changes:
+            latest[file_id] = new_tags
+    for file_id, new_tags in latest.items():
+        if match_fn(MediaRecord(file_id, tags=tuple(new_tags.items()))):
+            file_ids.add(file_id)
+        else:
+            file_ids.discard(file_id)
+    return file_ids
+
+def _plan_index_query(species_filters):
+    """
+    Read the most selective species first, then keep intersecting while
+    another index read is smaller than the candidate set; the remaining
+    filters are checked on the fetched candidate records instead.
+    Returns (candidate fileIds, filters left to probe).
+    """
+    plan = cardinality.order(species_filters)
+    (name, cnt), _ = plan[0]
+    file_ids = _index_lookup(name, cnt)
+    probe = []
+    for (name, cnt), estimate in plan[1:]:
+        if not file_ids:
+            break
+        if estimate is None:
+            read_index = len(file_ids) > MAX_PROBE_CANDIDATES
+        else:
+            read_index = estimate <= len(file_ids)
+        if read_index:
+            file_ids &= _index_lookup(name, cnt)
+        else:
+            probe.append((name, cnt))
+    return file_ids, probe
+
+def _find_index_ids(species_names):
+    # Union of the fileId sets of every requested species
+    file_ids = set()
+    for name in species_names:
+        file_ids |= _index_lookup(name)
+    return file_ids
+
+def _match_all_fn(species_filters):
+    # record.counts is { species: count }, decoded once per item
+    def match_item(record):
+        item_tags = record.counts
+        for name, cnt in species_filters:
+            if name not in item_tags or item_tags[name] < cnt:
+                return False
+        return True
+    return match_item
+
+def _match_any_fn(species_names):
+    # Include an item if any of its tags matches the requested species
+    requested_set = set(species_names)
+    def has_any_species(record):
+        for name in record.counts:
+            if name in requested_set:
+                return True
+        return False
+    return has_any_species
+
+def handle_query_batch(event):
+    """
+    Handle POST /query-batch
+    Answers many filter sets with one pass over the data instead of one /query each.
+    Expects JSON body:
+      {
+        "queries": [
+          { "name": "crows", "species": [ { "name": "crow", "count": 2 } ] },                      # /query semantics
+          { "name": "garden", "mode": "any", "species": [ { "name": "robin" }, { "name": "wren" } ] }  # /find semantics
+        ],
+        "links": "thumb"  # optional, as for /query
+      }
+    Returns:
+      {
+        "results": { "crows": { "count": 3, "ids": ["...", ...] }, "garden": { ... } },
+        "items":   { "<fileId>": { "id": ..., "mediaType": ..., "tags": [...], "s3Link": ..., ... } }
+      }
+    Each matching file is fetched and presigned once, however many sets it appears in.
+    """
+    try:
+        body = json.loads(event.get("body", "{}"))
+        queries = body.get("queries", [])
+        if not isinstance(queries, list) or len(queries) == 0:
+            return _response(400, {"message": "queries must be a non-empty list"})
+        if len(queries) > MAX_BATCH_QUERIES:
+            return _response(400, {"message": f"At most {MAX_BATCH_QUERIES} queries per request"})
+        links = body.get("links", "all")
+        if links not in LINK_MODES:
+            return _response(400, {"message": "links must be one of " + ", ".join(LINK_MODES)})
+
+        filter_sets = []
+        for q in queries:
+            if not isinstance(q, dict) or not isinstance(q.get("name"), str) or not q["name"]:
+                return _response(400, {"message": "Each query requires a non-empty string 'name'"})
+            mode = q.get("mode", "all")
+            if mode not in ("all", "any"):
+                return _response(400, {"message": "mode must be \"all\" or \"any\""})
+            filters = q.get("species", [])
+            if not isinstance(filters, list) or len(filters) == 0:
+                return _response(400, {"message": f"species of query '{q['name']}' must be a non-empty list"})
+            species_filters = _canonical_filters(filters)
+            if species_filters is None:
+                return _response(400, {"message": "Each element in species must be a dict with a non-empty 'name'"})
+            if mode == "any":
+                species_filters = tuple((name, 0) for name, _ in species_filters)
+            filter_sets.append((q["name"], mode, species_filters))
+        if len({name for name, _, _ in filter_sets}) != len(filter_sets):
+            return _response(400, {"message": "query names must be unique"})
+        filter_sets = tuple(filter_sets)
+
+        records, ids_by_name = _cached(("batch", filter_sets), lambda: _resolve_batch(filter_sets))
+
+        items = {record.file_id: transform_item(record, links) for record in records}
+        results = {
+            name: {"count": len(ids), "ids": ids}
+            for name, ids in ids_by_name.items()
+        }
+        _log_cache_stats()
+
+        return _response(200, {"results": results, "items": items})
+
+    except ValueError as e:
+        return _response(400, {"message": str(e)})
+    except Exception as e:
+        print("handle_query_batch error:", e)
+        return _response(500, {"message": "Internal Server Error", "error": str(e)})
+
+def _resolve_batch(filter_sets):
+    """
+    Evaluate every (name, mode, species_filters) of filter_sets in one pass.
+    Returns (records of the union of all matches in fileId order, { name: sorted fileIds }).
+    """
+    ids_by_name = {}
+    # { name: match_fn }; index ids are only candidates, re-checked against the fetched records
+    matchers = {}
+
+    bitmap_index = _bitmap_index()
+    if bitmap_index is not None:
+        for name, mode, species_filters in filter_sets:
+            if mode == "all":
+                bitmap = bitmap_index.match_all(species_filters)
+                matchers[name] = _match_all_fn(species_filters)
+            else:
+                species_names = [species for species, _ in species_filters]
+                bitmap = bitmap_index.match_any(species_names)
+                matchers[name] = _match_any_fn(species_names)
+            ids_by_name[name] = sorted(_bitmap_candidates(bitmap_index, bitmap, matchers[name]))
+
+    elif index_table is not None:
+        # Sets usually share species; look each (species, count) up once
+        lookups = {}
+        def lookup(species, cnt):
+            if (species, cnt) not in lookups:
+                lookups[(species, cnt)] = _index_lookup(species, cnt)
+            return lookups[(species, cnt)]
+
+        for name, mode, species_filters in filter_sets:
+            if mode == "all":
+                file_ids = None
+                for species, cnt in species_filters:
+                    ids = lookup(species, cnt)
+                    file_ids = ids if file_ids is None else file_ids & ids
+                    if not file_ids:
+                        break
+            else:
+                file_ids = set()
+                for species, _ in species_filters:
+                    file_ids |= lookup(species, 0)
+            ids_by_name[name] = sorted(file_ids or [])
+            matchers[name] = (
+                _match_all_fn(species_filters) if mode == "all"
+                else _match_any_fn([species for species, _ in species_filters])
+            )
+
+    else:
+        matchers = [
+            (name, _match_all_fn(species_filters) if mode == "all" else _match_any_fn([s for s, _ in species_filters]))
+            for name, mode, species_filters in filter_sets
+        ]
+        # Every set needs at least one of its species present, so "any of all
+        # species mentioned" is a safe pushed-down filter for the combined scan
+        all_species = sorted({species for _, _, species_filters in filter_sets for species, _ in species_filters})
+        scan_kwargs = plan_scan([(species, 0) for species in all_species], "any")
+
+        by_id = {}
+        matched_ids = {name: [] for name, _ in matchers}
+        for page in parallel_scan(dynamodb_client, TABLE_NAME, **scan_kwargs):
+            for record in decode_page(page):
+                for name, match_fn in matchers:
+                    if match_fn(record):
+                        matched_ids[name].append(record.file_id)
+                        by_id[record.file_id] = record
+        ids_by_name = {name: sorted(ids) for name, ids in matched_ids.items()}
+        return [by_id[fid] for fid in sorted(by_id)], ids_by_name
+
+    union = sorted({fid for ids in ids_by_name.values() for fid in ids})
+    by_id = {record.file_id: record for record in _batch_get_items(union)}
+    # Drop ids whose record vanished between the index read and the fetch,
+    # or whose tags no longer match what the (lagging) index said
+    ids_by_name = {
+        name: [
+            fid for fid in ids
+            if fid in by_id and matchers[name](by_id[fid])
+        ]
+        for name, ids in ids_by_name.items()
+    }
+    matched = {fid for ids in ids_by_name.values() for fid in ids}
+    return [by_id[fid] for fid in union if fid in matched], ids_by_name
+
+def _log_cache_stats():
+    if LOG_CACHE_STATS:
+        print("presign cache:", url_cache.stats(), "result cache:", result_cache.stats())
+
+def _canonical_filters(filters):
+    """
+    [{"name": " Crow", "count": 2}, {"name": "crow", "count": 1}] -> (("crow", 2),)
+    Names are normalized, duplicates keep the highest count and the result is
+    sorted, so equivalent requests share one result-cache entry.
+    Returns None if any entry has no name.
+    """
+    counts = {}
+    for f in filters:
+        if not isinstance(f, dict):
+            return None
+        name = _normalize_species(f.get("name"))
+        if not name:
+            return None
+        counts[name] = max(counts.get(name, 0), int(f.get("count", 0)))
+    return tuple(sorted(counts.items()))
+
+def _cached(cache_key, compute):
+    """
+    Serve (matched_raw, next_cursor) from result_cache while the tag generation
+    is unchanged, otherwise compute and store it.
+    """
+    generation = _tag_generation()
+    cached = result_cache.get(cache_key, generation)
+    if cached is not None:
+        return cached
+    value = compute()
+    result_cache.put(cache_key, generation, value, item_count=len(value[0]))
+    return value
+
+def _tag_generation():
+    """
+    Current tag-write generation, bumped by every writer of tags.
+    None (cache bypassed) if it can't be read.
+    """
+    if meta_table is None:
+        return None
+    try:
+        item = meta_table.get_item(Key={"name": TAG_GENERATION_KEY}).get("Item")
+        generation = int(item.get("generation", 0)) if item else 0
+        # The bitmap index lags tag writes; a newly loaded copy or delta also invalidates results
+        if bitmap_loader is None:
+            return (generation, None, None)
+        latest_delta = bitmap_delta_loader.latest_key if bitmap_delta_loader else None
+        return (generation, bitmap_loader.etag, latest_delta)
+    except Exception as e:
+        print(f"Could not read tag generation: {e}")
+        return None
+
 def handle_find_full_image(event):
     """
     Handle POST /find-full-image
-    Get presigned full-size image URL given a presigned thumbnail URL.
+    Get presigned full-size image URL given a presigned thumbnail URL:
+      { "thumbnailUrl": "..." }  ->  { "imageUrl": "..." }
+    or for many thumbnails at once:
+      { "thumbnailUrls": ["...", ...] }  ->  { "results": [ { "thumbnailUrl": "...", "imageUrl": "..." | null }, ... ] }
+    Thumbnails are named "thumbnails/<fileId>_thumb.jpeg", so the record is a
+    single GetItem (BatchGetItem for many) on fileId; no S3 listing is needed.
     """
     try:
         body = json.loads(event.get("body", "{}"))
+
+        thumbnail_urls = body.get("thumbnailUrls")
+        if thumbnail_urls is not None:
+            if not isinstance(thumbnail_urls, list) or len(thumbnail_urls) == 0:
+                return _response(400, {"message": "thumbnailUrls must be a non-empty list"})
+            if len(thumbnail_urls) > MAX_PAGE_LIMIT:
+                return _response(400, {"message": f"At most {MAX_PAGE_LIMIT} thumbnailUrls per request"})
+
+            parsed = [(url, _parse_thumbnail_url(url)) for url in thumbnail_urls]
+            records = _batch_get_items({ref[1] for _, ref in parsed if ref}, projection=["fileId", "key", "thumbnailKey"])
+            by_id = {record.file_id: record for record in records}
+
+            results = []
+            for url, ref in parsed:
+                image_url = None
+                if ref and ref[1] in by_id:
+                    image_url = _full_image_url(by_id[ref[1]], ref[0])
+                results.append({"thumbnailUrl": url, "imageUrl": image_url})
+            return _response(200, {"results": results})
+
         thumbnail_url = body.get("thumbnailUrl")
         if not thumbnail_url:
             return _response(400, {"message": "thumbnailUrl is required"})
 
-        parsed = urllib.parse.urlparse(thumbnail_url)
-        thumb_key = parsed.path.lstrip("/")  # e.g. "thumbnails/abcd_thumb.jpeg"
-
-        if not thumb_key.startswith("thumbnails/") or not (thumb_key.endswith("_thumb.jpeg") or thumb_key.endswith("_thumb.jpg")):
+        ref = _parse_thumbnail_url(thumbnail_url)
+        if not ref:
             return _response(400, {"message": "Invalid thumbnail key or format"})
+        thumb_key, file_id = ref
 
-        base_name = thumb_key[len("thumbnails/"): thumb_key.rfind("_thumb")]
-
-        prefix = f"images/{base_name}"
-        resp = s3_client.list_objects_v2(Bucket=BUCKET_NAME, Prefix=prefix)
-        contents = resp.get("Contents", [])
-        if not contents:
+        raw = dynamodb_client.get_item(
+            TableName=TABLE_NAME,
+            Key={"fileId": {"S": file_id}},
+            ProjectionExpression="fileId, #k, thumbnailKey",
+            ExpressionAttributeNames={"#k": "key"}
+        ).get("Item")
+        presigned_url = _full_image_url(decode_item(raw), thumb_key) if raw else None
+        if not presigned_url:
             return _response(404, {"message": "Full-size image not found"})
 
-        full_key = contents[0]["Key"]
-        presigned_url = s3_client.generate_presigned_url(
-            ClientMethod="get_object",
-            Params={"Bucket": BUCKET_NAME, "Key": full_key},
-            ExpiresIn=3600
-        )
         return _response(200, {"imageUrl": presigned_url})
 
     except ClientError as e:
-        return _response(500, {"message": "S3 ClientError", "error": str(e)})
+        return _response(500, {"message": "DynamoDB/S3 ClientError", "error": str(e)})
+    except Exception as e:
+        return _response(500, {"message": "Internal error", "error": str(e)})
+
+def handle_sign(event):
+    """
+    Handle POST /sign
+    Presign links for items found earlier with "links": "none" or "thumb".
+    Expects JSON body:
+      { "fileIds": ["...", ...], "links": "all" }   # links: "all" (default) | "thumb"
+    Returns:
+      { "results": [ { "id": "...", "s3Link": "...", "thumbnailLink": "..." }, ... ], "missing": ["..."] }
+    """
+    try:
+        body = json.loads(event.get("body", "{}"))
+        file_ids = body.get("fileIds", [])
+        if not isinstance(file_ids, list) or len(file_ids) == 0:
+            return _response(400, {"message": "fileIds must be a non-empty list"})
+        if len(file_ids) > MAX_PAGE_LIMIT:
+            return _response(400, {"message": f"At most {MAX_PAGE_LIMIT} fileIds per request"})
+        if not all(isinstance(fid, str) and fid for fid in file_ids):
+            return _response(400, {"message": "fileIds must be non-empty strings"})
+        links = body.get("links", "all")
+        if links not in ("all", "thumb"):
+            return _response(400, {"message": "links must be \"all\" or \"thumb\""})
+
+        file_ids = list(dict.fromkeys(file_ids))
+        records = _batch_get_items(file_ids, projection=["fileId", "type", "key", "thumbnailKey"])
+        results = []
+        for record in records:
+            signed = transform_item(record, links)
+            del signed["tags"]
+            results.append(signed)
+
+        found = {record.file_id for record in records}
+        return _response(200, {
+            "results": results,
+            "missing": [fid for fid in file_ids if fid not in found]
+        })
+
+    except ClientError as e:
+        return _response(500, {"message": "DynamoDB/S3 ClientError", "error": str(e)})
     except Exception as e:
         return _response(500, {"message": "Internal error", "error": str(e)})
 
-def transform_item(item):
+def handle_species_suggest(event):
+    """
+    Handle GET /species/suggest?prefix=cro&limit=10
+    Autocomplete species names from the vocabulary of every tag name written so far.
+    Names starting with the prefix come back alphabetically; if there are none,
+    names within one typo (edit distance 1) of the prefix are suggested instead
+    and "fuzzy" is true.
+    Returns:
+      { "prefix": "cro", "suggestions": ["crow", ...], "fuzzy": false }
+    """
+    try:
+        params = event.get("queryStringParameters") or {}
+        prefix = _normalize_species(params.get("prefix"))
+        if not prefix:
+            return _response(400, {"message": "prefix is required"})
+        try:
+            limit = int(params.get("limit", 10))
+        except (TypeError, ValueError):
+            return _response(400, {"message": "limit must be an integer"})
+        if limit < 1 or limit > MAX_SUGGESTIONS:
+            return _response(400, {"message": f"limit must be between 1 and {MAX_SUGGESTIONS}"})
+
+        trie = vocabulary_loader.get() if vocabulary_loader else None
+        if trie is None:
+            return _response(503, {"message": "Species vocabulary is not available"})
+
+        suggestions = trie.complete(prefix, limit)
+        fuzzy = not suggestions
+        if fuzzy:
+            suggestions = trie.fuzzy_complete(prefix, limit)
+
+        return _response(200, {"prefix": prefix, "suggestions": suggestions, "fuzzy": fuzzy})
+
+    except Exception as e:
+        print("handle_species_suggest error:", e)
+        return _response(500, {"message": "Internal Server Error", "error": str(e)})
+
+def handle_stats(event):
     """
-    Convert a DynamoDB record into the response format, generating presigned URLs.
-    Input `item` example (via boto3.resource):
+    Handle GET /stats
+    Dashboard totals from the aggregate counter item; one GetItem, no scan.
+    Returns:
       {
-        "fileId": "84330c77-6964-420b-b461-a18777fceebf",
-        "bucket": "birdtagbucket-assfdas",
-        "format": "jpg",
-        "key": "images/84330c77-...jpg",
-        "size": Decimal('82209'),
-        "tags": [
-          { "name": "crow",   "count": Decimal('2') },
-          { "name": "pigeon", "count": Decimal('1') }
-        ],
-        "thumbnailKey": "thumbnails/84330c77-..._thumb.jpeg",
-        "type": "image"
+        "files": { "total": 120, "byType": { "image": 80, "video": 20, "audio": 20 } },
+        "detections": { "total": 310, "byType": { "image": 200, ... } },
+        "species": [ { "name": "crow", "files": 40, "detections": 95 }, ... ],  # most files first
+        "lastUpload": { "fileId": "...", "type": "image", "taggedAt": "2025-05-01T10:00:00Z" }
       }
+    """
+    if not TAG_STATS_TABLE:
+        return _response(503, {"message": "Tag statistics are not enabled"})
+    try:
+        raw = dynamodb_client.get_item(
+            TableName=TAG_STATS_TABLE,
+            Key={"stat": {"S": TAG_STATS_KEY}}
+        ).get("Item")
+        return _response(200, format_stats(raw))
+
+    except ClientError as e:
+        return _response(500, {"message": "DynamoDB ClientError", "error": str(e)})
+    except Exception as e:
+        return _response(500, {"message": "Internal error", "error": str(e)})
+
+def _parse_thumbnail_url(thumbnail_url):
+    """
+    "https://.../thumbnails/<fileId>_thumb.jpeg?X-Amz-..." -> ("thumbnails/<fileId>_thumb.jpeg", "<fileId>"),
+    or None if the URL doesn't point at a thumbnail.
+    """
+    if not isinstance(thumbnail_url, str):
+        return None
+    parsed = urllib.parse.urlparse(thumbnail_url)
+    thumb_key = urllib.parse.unquote(parsed.path.lstrip("/"))  # e.g. "thumbnails/abcd_thumb.jpeg"
+
+    if not thumb_key.startswith("thumbnails/") or not (thumb_key.endswith("_thumb.jpeg") or thumb_key.endswith("_thumb.jpg")):
+        return None
+
+    file_id = thumb_key[len("thumbnails/"): thumb_key.rfind("_thumb")]
+    return (thumb_key, file_id) if file_id else None
+
+def _full_image_url(record, thumb_key):
+    # The record must really own this thumbnail; guards against guessed or stale ids
+    if record.thumbnail_key != thumb_key or not record.key:
+        return None
+    return url_cache.get_url(BUCKET_NAME, record.key)
+
+def _parse_paging(body):
+    """
+    Validate optional "limit" / "cursor" of a request body.
+    Returns (limit or None, decoded cursor dict or None, error message or None).
+    """
+    limit = body.get("limit")
+    if limit is not None:
+        try:
+            limit = int(limit)
+        except (TypeError, ValueError):
+            return None, None, "limit must be an integer"
+        if limit < 1 or limit > MAX_PAGE_LIMIT:
+            return None, None, f"limit must be between 1 and {MAX_PAGE_LIMIT}"
+
+    cursor = body.get("cursor")
+    if cursor:
+        if limit is None:
+            return None, None, "cursor requires limit"
+        try:
+            cursor = json.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+        except Exception:
+            return None, None, "Invalid cursor"
+        if not isinstance(cursor, dict) or cursor.get("mode") not in ("index", "scan", "time"):
+            return None, None, "Invalid cursor"
+    else:
+        cursor = None
+
+    return limit, cursor, None
+
+def _parse_time_window(body):
+    """
+    Validate optional "from" / "to" / "type" / "order" of a request body.
+    Returns (window dict or None when none of them is given, error message or None).
+    Timestamps are normalized to the stored uploadedAt format so they compare as strings.
+    """
+    if not any(field in body for field in ("from", "to", "type", "order")):
+        return None, None
+
+    window = {"order": body.get("order", "desc")}
+    if window["order"] not in ("asc", "desc"):
+        return None, "order must be \"asc\" or \"desc\""
+    for field in ("from", "to"):
+        value = body.get(field)
+        window[field] = _parse_timestamp(value) if value is not None else None
+        if value is not None and window[field] is None:
+            return None, f"{field} must be an ISO 8601 date or timestamp"
+    if window["from"] and window["to"] and window["from"] >= window["to"]:
+        return None, "from must be earlier than to"
+
+    media_type = body.get("type")
+    if media_type is None:
+        window["types"] = MEDIA_TYPES
+    elif media_type in MEDIA_TYPES:
+        window["types"] = (media_type,)
+    else:
+        return None, "type must be one of " + ", ".join(MEDIA_TYPES)
+    return window, None
+
+def _parse_timestamp(value):
+    """
+    "2025-05-01" / "2025-05-01T10:00:00+10:00" -> "2025-05-01T00:00:00.000Z" (UTC), or None.
+    Naive values are taken as UTC.
+    """
+    try:
+        ts = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if ts.tzinfo is None:
+        ts = ts.replace(tzinfo=timezone.utc)
+    ts = ts.astimezone(timezone.utc)
+    return ts.strftime("%Y-%m-%dT%H:%M:%S.") + f"{ts.microsecond // 1000:03d}Z"
+
+def _window_key(window):
+    return tuple(sorted(window.items())) if window else None
+
+def _encode_cursor(position):
+    return base64.urlsafe_b64encode(json.dumps(position, separators=(",", ":")).encode()).decode()
+
+def _results_body(matched, limit, next_cursor):
+    body = {"results": matched}
+    if limit is not None:
+        body["nextCursor"] = next_cursor
+    return body
+
+def _page_from_candidates(file_ids, match_fn, limit, cursor):
+    """
+    Page through candidate fileIds (from the bitmap or species index) in
+    fileId order. `file_ids` may be a superset: candidates are fetched 100
+    at a time and kept if `match_fn` accepts them, stopping once the page is full.
+    """
+    ids = sorted(file_ids or [])
+    if cursor:
+        if cursor["mode"] != "index":
+            raise ValueError("cursor does not belong to an index query")
+        ids = [fid for fid in ids if fid > cursor["after"]]
+
+    matched = []
+    for i in range(0, len(ids), 100):
+        for record in _batch_get_items(ids[i:i + 100]):
+            if not match_fn(record):
+                continue
+            matched.append(record)
+            if limit is not None and len(matched) == limit:
+                next_cursor = None
+                if record.file_id != ids[-1]:
+                    next_cursor = _encode_cursor({"mode": "index", "after": record.file_id})
+                return matched, next_cursor
+    return matched, None
+
+def _page_from_time_index(match_fn, query_kwargs, window, limit, cursor):
+    """
+    Items of window["types"] uploaded in [from, to) and accepted by `match_fn`,
+    in upload-time order ("desc": newest first), read with Query on the
+    (type, uploadedAt) GSI. `query_kwargs` (from plan_scan) pushes the projection
+    and any expressible species filter down.
+    Reading stops as soon as the page is full. The cursor is the
+    (uploadedAt, fileId) of the last returned item.
+    """
+    after = None
+    if cursor:
+        if cursor["mode"] != "time":
+            raise ValueError("cursor does not belong to a time-window query")
+        after = (cursor["at"], cursor["after"])
+
+    matched = []
+    for record in _iter_time_index(match_fn, query_kwargs, window, after, limit):
+        matched.append(record)
+        if limit is not None and len(matched) == limit:
+            return matched, _encode_cursor({"mode": "time", "at": record.uploaded_at, "after": record.file_id})
+    return matched, None
+
+def _iter_time_index(match_fn, query_kwargs, window, after=None, page_size=None):
+    """
+    Matching records of every type partition in time order. Each partition
+    already comes back from the GSI in time order, so they are merged lazily.
+    """
+    descending = window["order"] == "desc"
+    streams = [
+        _time_index_records(media_type, window, descending, query_kwargs, after, page_size)
+        for media_type in window["types"]
+    ]
+    for record in heapq.merge(*streams, key=lambda r: (r.uploaded_at, r.file_id), reverse=descending):
+        if match_fn(record):
+            yield record
+
+def _time_index_records(media_type, window, descending, query_kwargs, after, limit):
+    """
+    Lazily yield the records of one type partition of the uploadedAt GSI in time
+    order, starting strictly after the `after` (uploadedAt, fileId) position.
+    """
+    low, high = window["from"], window["to"]
+    if after:
+        # Resume at the cursor's timestamp; ties on it are skipped below by fileId
+        if descending:
+            high = after[0] if high is None else min(high, after[0])
+        else:
+            low = after[0] if low is None else max(low, after[0])
+
+    names  = dict(query_kwargs.get("ExpressionAttributeNames", {}), **{"#qt": "type", "#qu": "uploadedAt"})
+    values = dict(query_kwargs.get("ExpressionAttributeValues", {}), **{":qt": {"S": media_type}})
+    condition = "#qt = :qt"
+    if low and high:
+        condition += " AND #qu BETWEEN :lo AND :hi"
+    elif low:
+        condition += " AND #qu >= :lo"
+    elif high:
+        condition += " AND #qu <= :hi"
+    if low:
+        values[":lo"] = {"S": low}
+    if high:
+        values[":hi"] = {"S": high}
+
+    request = dict(
+        query_kwargs,
+        TableName=TABLE_NAME,
+        IndexName=UPLOADED_AT_INDEX,
+        KeyConditionExpression=condition,
+        ExpressionAttributeNames=names,
+        ExpressionAttributeValues=values,
+        ScanIndexForward=not descending
+    )
+    if limit is not None:
+        request["Limit"] = max(limit, 25)
+
+    # The GSI leaves items with the same uploadedAt in no particular order, so each
+    # run of equal timestamps is held back and yielded sorted by fileId: the merge
+    # key and the cursor both rely on (uploadedAt, fileId) order
+    ties = []
+    while True:
+        resp = dynamodb_client.query(**request)
+        for record in decode_page(resp.get("Items", [])):
+            if window["to"] and record.uploaded_at >= window["to"]:
+                continue
+            if after:
+                position = (record.uploaded_at, record.file_id)
+                if (position >= after) if descending else (position <= after):
+                    continue
+            if ties and ties[0].uploaded_at != record.uploaded_at:
+                yield from sorted(ties, key=lambda r: r.file_id, reverse=descending)
+                ties = []
+            ties.append(record)
+        if not resp.get("LastEvaluatedKey"):
+            yield from sorted(ties, key=lambda r: r.file_id, reverse=descending)
+            return
+        request["ExclusiveStartKey"] = resp["LastEvaluatedKey"]
+
+def _iter_candidates(file_ids, match_fn=None):
+    """
+    Fetch `file_ids` 100 at a time in fileId order, yielding each record
+    (that `match_fn` accepts, if given) as soon as its batch arrives.
+    """
+    ids = sorted(file_ids or [])
+    for i in range(0, len(ids), 100):
+        for record in _batch_get_items(ids[i:i + 100]):
+            if match_fn is None or match_fn(record):
+                yield record
+
+def _iter_scan(match_fn, scan_kwargs=None):
+    """
+    Parallel-scan the table, yielding matching records page by page as segments return them.
+    """
+    for page in parallel_scan(dynamodb_client, TABLE_NAME, **(scan_kwargs or {})):
+        for record in decode_page(page):
+            if match_fn(record):
+                yield record
+
+def _page_from_scan(match_fn, limit, cursor, scan_kwargs=None):
+    """
+    Scan the table and return items accepted by `match_fn`.
+    `scan_kwargs` (from plan_scan) pushes the projection and any expressible
+    filter down to DynamoDB; `match_fn` still makes the final decision.
+    Without a limit the whole table is read with a parallel scan. With a limit,
+    segments are walked in order and reading stops as soon as the page is full;
+    the cursor records the segment and the key of the last returned item, which
+    DynamoDB accepts as ExclusiveStartKey to resume right after it.
+    """
+    client = dynamodb_client
+    scan_kwargs = scan_kwargs or {}
+    if limit is None:
+        matched = []
+        for page in parallel_scan(client, TABLE_NAME, **scan_kwargs):
+            matched.extend(record for record in decode_page(page) if match_fn(record))
+        return matched, None
+
+    if cursor:
+        if cursor["mode"] != "scan":
+            raise ValueError("cursor does not belong to a table scan")
+        total_segments = int(cursor["totalSegments"])
+        segment        = int(cursor["segment"])
+        start_key      = cursor.get("key")
+    else:
+        total_segments = choose_segment_count(table_size_bytes(client, TABLE_NAME))
+        segment        = 0
+        start_key      = None
+
+    matched = []
+    while segment < total_segments:
+        segment_kwargs = dict(scan_kwargs, TableName=TABLE_NAME, Segment=segment, TotalSegments=total_segments)
+        if start_key:
+            segment_kwargs["ExclusiveStartKey"] = start_key
+        resp = client.scan(**segment_kwargs)
+
+        for record in decode_page(resp.get("Items", [])):
+            if match_fn(record):
+                matched.append(record)
+                if len(matched) == limit:
+                    return matched, _encode_cursor({
+                        "mode": "scan",
+                        "segment": segment,
+                        "totalSegments": total_segments,
+                        "key": {"fileId": {"S": record.file_id}}
+                    })
+
+        start_key = resp.get("LastEvaluatedKey")
+        if not start_key:
+            segment += 1
+
+    return matched, None
+
+def _index_lookup(name, min_count=0):
+    """
+    Return the set of fileIds tagged with `name` at least `min_count` times.
+    Index items look like:
+      { "species": "crow", "countKey": "000002#<fileId>", "fileId": "<fileId>", "count": 2 }
+    so "count >= N" is a range condition on the sort key.
+    """
+    species = _normalize_species(name)
+    query_kwargs = {
+        "KeyConditionExpression": Key("species").eq(species) & Key("countKey").gte(_count_key_prefix(min_count)),
+        "ProjectionExpression": "fileId",
+    }
+    file_ids = set()
+    done = False
+    last_evaluated_key = None
+
+    while not done:
+        if last_evaluated_key:
+            query_kwargs["ExclusiveStartKey"] = last_evaluated_key
+        resp = index_table.query(**query_kwargs)
+        file_ids.update(it["fileId"] for it in resp.get("Items", []))
+        last_evaluated_key = resp.get("LastEvaluatedKey")
+        done = last_evaluated_key is None
+
+    cardinality.observe(species, int(min_count), len(file_ids))
+    return file_ids
+
+def _batch_get_items(file_ids, projection=None):
+    """
+    Fetch MediaRecords for the given fileIds with BatchGetItem (100 keys per call),
+    optionally reading only the `projection` attributes.
+    Ids that no longer exist in the table are skipped.
+    """
+    file_ids = list(file_ids or [])
+    key_spec = {}
+    if projection:
+        key_spec["ProjectionExpression"] = ", ".join(f"#a{i}" for i in range(len(projection)))
+        key_spec["ExpressionAttributeNames"] = {f"#a{i}": attr for i, attr in enumerate(projection)}
+    by_id = {}
+    for i in range(0, len(file_ids), 100):
+        request = {TABLE_NAME: dict(key_spec, Keys=[{"fileId": {"S": fid}} for fid in file_ids[i:i + 100]])}
+        while request:
+            resp = dynamodb_client.batch_get_item(RequestItems=request)
+            for record in decode_page(resp.get("Responses", {}).get(TABLE_NAME, [])):
+                by_id[record.file_id] = record
+            request = resp.get("UnprocessedKeys") or None
+    # BatchGetItem returns items in no particular order; keep the order of file_ids
+    return [by_id[fid] for fid in file_ids if fid in by_id]
+
+def _normalize_species(name):
+    return str(name or "").strip().lower()
+
+def _count_key_prefix(count):
+    # Zero-padded so lexicographic order of countKey matches numeric order of count
+    return f"{max(int(count), 0):06d}"
+
+def transform_item(record, links="all"):
+    """
+    Convert a MediaRecord into the response format, generating presigned URLs
+    (served from url_cache while a previously signed URL is still fresh enough).
+    `links` selects which URLs are signed: "all" (default), "thumb" (thumbnailLink
+    only) or "none" (ids and tags only; sign later through /sign).
+    Input `record` example (decoded by media_records from the wire format):
+      MediaRecord(
+        file_id="84330c77-6964-420b-b461-a18777fceebf",
+        media_type="image",
+        key="images/84330c77-...jpg",
+        thumbnail_key="thumbnails/84330c77-..._thumb.jpeg",
+        tags=(("crow", 2), ("pigeon", 1))
+      )
 
     Output should be:
       {
         "id": "<same id>",
         "mediaType": "<type>",
         "tags": [ { "name": "...", "count": <int> }, ... ],
-        "s3Link": "<presigned URL for key>",
-        "thumbnailLink": "<presigned URL for thumbnailKey>"  # only if type == "image"
+        "uploadedAt": "2025-05-01T10:00:00.123Z",            # if recorded
+        "s3Link": "<presigned URL for key>",                  # only if links == "all"
+        "thumbnailLink": "<presigned URL for thumbnailKey>"   # only if type == "image" and links != "none"
       }
     """
-    item_id    = item.get("fileId")
-    media_type = item.get("type", "").lower()
-    raw_tags   = item.get("tags", [])
-    key        = item.get("key")
-    thumb_key  = item.get("thumbnailKey", "")
+    item_id    = record.file_id
+    media_type = record.media_type
+    key        = record.key
+    thumb_key  = record.thumbnail_key
 
-    # Convert tags from Decimal to int
-    tags_list = []
-    for t in raw_tags:
-        name = t.get("name")
-        cnt  = int(t.get("count", 0))
-        tags_list.append({"name": name, "count": cnt})
-
-    # Generate presigned URL for the main object
-    s3_link = ""
-    try:
-        s3_link = s3_client.generate_presigned_url(
-            ClientMethod="get_object",
-            Params={"Bucket": BUCKET_NAME, "Key": key},
-            ExpiresIn=3600
-        )
-    except Exception as e:
-        print(f"Error generating presigned for key={key}: {e}")
+    # Counts are already plain ints
+    tags_list = [{"name": name, "count": cnt} for name, cnt in record.tags]
 
     result = {
         "id": item_id,
         "mediaType": media_type,
-        "tags": tags_list,
-        "s3Link": s3_link
+        "tags": tags_list
     }
+    if record.uploaded_at:
+        result["uploadedAt"] = record.uploaded_at
+
+    # Generate presigned URL for the main object
+    if links == "all":
+        s3_link = ""
+        try:
+            s3_link = url_cache.get_url(BUCKET_NAME, key)
+        except Exception as e:
+            print(f"Error generating presigned for key={key}: {e}")
+        result["s3Link"] = s3_link
 
     # If this item is an image, provide thumbnailLink as well
-    if media_type == "image" and thumb_key:
+    if links != "none" and media_type == "image" and thumb_key:
         thumb_url = ""
         try:
-            thumb_url = s3_client.generate_presigned_url(
-                ClientMethod="get_object",
-                Params={"Bucket": BUCKET_NAME, "Key": thumb_key},
-                ExpiresIn=3600
-            )
+            thumb_url = url_cache.get_url(BUCKET_NAME, thumb_key)
         except Exception as e:
             print(f"Error generating presigned for thumbnailKey={thumb_key}: {e}")
         result["thumbnailLink"] = thumb_url
 
     return result
 
+def _ndjson_response(lines):
+    """
+    The whole NDJSON body of a Lambda invocation: this handler is not deployed
+    with response streaming, so the lines are joined before returning. Items
+    are serialized one at a time, so only the encoded lines are held, never
+    the record list plus its transformed copy. Incremental delivery goes
+    through local_server.py.
+    """
+    return {
+        "statusCode": 200,
+        "headers": {
+            "Content-Type": "application/x-ndjson",
+            "Access-Control-Allow-Origin": "*",
+            "Access-Control-Allow-Headers": "Content-Type,Authorization",
+            "Access-Control-Allow-Methods": "OPTIONS,GET,PUT,POST,DELETE"
+        },
+        "body": b"".join(lines).decode()
+    }
+
 def _response(status_code, body_dict):
     return {
         "statusCode": status_code,
@@ -1,27 +1,101 @@
 import os
 import json
 import base64
+import hashlib
+import importlib
+import mimetypes
+import tempfile
+import time
+import uuid
 import boto3
 from botocore.exceptions import ClientError
+from image_hash import ImageHashIndex, dhash_bytes
+from inference_cache import InferenceCache, content_key, digest_key
+from media_records import decode_item
+from s3_object_loader import S3ObjectLoader
 
 AUDIO_TAG_FUNCTION   = os.environ.get("AUDIO_TAG_FUNCTION", "audioFileQuery")
 VISUAL_TAG_FUNCTION  = os.environ.get("VISUAL_TAG_FUNCTION", "visualFileQuery")
 QUERY_FUNCTION       = os.environ.get("QUERY_FUNCTION", "birdtagquery")
 REGION               = os.environ.get("REGION", "us-east-1")
+# "invoke": tag and match through the tagging and query Lambdas (default).
+# "inprocess": match with query.run_query, and tag with the tagger module when
+# it is packaged alongside (see Dockerfile.query-by-file); media without a local
+# tagger still goes to its tagging Lambda.
+QUERY_BY_FILE_MODE   = os.environ.get("QUERY_BY_FILE_MODE", "invoke")
+AUDIO_TAGGER_MODULE  = os.environ.get("AUDIO_TAGGER_MODULE", "audio_query_tagging")
+VISUAL_TAGGER_MODULE = os.environ.get("VISUAL_TAGGER_MODULE", "visual_query_tagging")
+
+# Tagging results by file content; bump a model version to stop reusing its results.
+# The table is BirdInferenceCache in infra/dynamodb_metadata.yaml; "" keeps the in-memory LRU only
+INFERENCE_CACHE_TABLE = os.environ.get("INFERENCE_CACHE_TABLE", "BirdInferenceCache")
+AUDIO_MODEL_VERSION   = os.environ.get("AUDIO_MODEL_VERSION", "birdnet-global-6k-v2.4")
+VISUAL_MODEL_VERSION  = os.environ.get("VISUAL_MODEL_VERSION", "yolo-visual/model.pt")
+
+# Images within this many dHash bits of a stored image reuse its tags instead of running YOLO
+TABLE_NAME              = os.environ.get("TABLE_NAME", "BirdMediaTags")
+IMAGE_HASH_BUCKET       = os.environ.get("IMAGE_HASH_BUCKET", "")
+IMAGE_HASH_KEY          = os.environ.get("IMAGE_HASH_KEY", "indexes/image_hashes.bin")
+NEAR_DUPLICATE_DISTANCE = int(os.environ.get("NEAR_DUPLICATE_DISTANCE", "6"))
+
+# Large media is uploaded straight to S3 with a presigned PUT and only its key is posted
+QUERY_UPLOAD_BUCKET  = os.environ.get("QUERY_UPLOAD_BUCKET", "")
+QUERY_UPLOAD_PREFIX  = os.environ.get("QUERY_UPLOAD_PREFIX", "query-uploads/")
+UPLOAD_URL_EXPIRES   = int(os.environ.get("UPLOAD_URL_EXPIRES", "900"))
+DOWNLOAD_CHUNK_BYTES = 1024 * 1024
+
+# Asynchronous jobs ("async": true): tagged by this function invoked again with
+# InvocationType="Event"; progress, tags and errors are kept in QUERY_JOBS_TABLE
+QUERY_JOBS_TABLE      = os.environ.get("QUERY_JOBS_TABLE", "")
+QUERY_JOB_TTL         = int(os.environ.get("QUERY_JOB_TTL", str(24 * 3600)))
+JOB_PROGRESS_INTERVAL = float(os.environ.get("JOB_PROGRESS_INTERVAL", "2"))
+# A "tagging" job not updated for this long was cut off by the Lambda timeout
+# (15 min at most) and is reported as failed; keep it above the function timeout
+JOB_STALE_SECONDS     = int(os.environ.get("JOB_STALE_SECONDS", "960"))
+QUERY_BY_FILE_FUNCTION = os.environ.get("QUERY_BY_FILE_FUNCTION") or os.environ.get("AWS_LAMBDA_FUNCTION_NAME", "queryByFile")
 
 lambda_client = boto3.client("lambda", region_name=REGION)
+dynamodb_client = boto3.client("dynamodb", region_name=REGION)
+s3_client = boto3.client("s3", region_name=REGION)
+inference_cache = InferenceCache(dynamodb_client, INFERENCE_CACHE_TABLE or None)
+image_hash_loader = (
+    S3ObjectLoader(s3_client, IMAGE_HASH_BUCKET, IMAGE_HASH_KEY, ImageHashIndex.loads)
+    if IMAGE_HASH_BUCKET else None
+)
+# module name -> imported tagger module, or None if it isn't packaged here
+_local_taggers = {}
+
+class TaggingFailed(Exception):
+    """
+    The tagging Lambda returned an error; `payload` is its response.
+    """
+    def __init__(self, payload):
+        super().__init__("Tagging failed")
+        self.payload = payload
 
 def lambda_handler(event, context):
     """
-    1) POST /query-by-file API
-    2) Based on Content-Type, call audio or visual tagging Lambda
-    3) Then Call /query Lambda，return query result
+    1) POST /query-by-file API, with the file as the body or as an S3 key
+       (POST /query-by-file/upload-url hands out the presigned upload)
+    2) Based on Content-Type, tag with the audio or visual tagger
+       (tagging Lambda, or in process when QUERY_BY_FILE_MODE=inprocess)
+    3) Then match the tags like /query and return the query result
+    With "async": true, step 2 runs as a job and GET /query-by-file/{jobId}
+    reports its progress and, once tagged, step 3.
     """
+    if "jobId" in event and "requestContext" not in event:
+        # Event invoke of a job submitted by handle_query_by_file
+        return run_job(event["jobId"])
+
     path   = event.get("rawPath") or event.get("path","")
     method = event["requestContext"]["http"]["method"]
 
     if path == "/query-by-file" and method == "POST":
         return handle_query_by_file(event)
+    elif path == "/query-by-file/upload-url" and method == "POST":
+        return handle_upload_url(event)
+    elif path.startswith("/query-by-file/") and method == "GET":
+        return handle_job_status(path[len("/query-by-file/"):])
     else:
         return {
             "statusCode": 404,
@@ -30,73 +104,540 @@ def lambda_handler(event, context):
         }
 
 def handle_query_by_file(event):
+    """
+    Body: the file itself (Content-Type: image/*, video/* or audio/*), or,
+    for large media, JSON { "s3Key": "<key from /query-by-file/upload-url>",
+    "contentType": "video/mp4" } after uploading it there.
+    "async": true in the JSON body (or ?async=true with a raw body) returns
+    202 { "jobId", "status" } at once instead of waiting for the tagger.
+    """
+    local_path = None
     try:
         headers = {k.lower(): v for k,v in event.get("headers",{}).items()}
         content_type = headers.get("content-type","")
-        if not event.get("isBase64Encoded") or "body" not in event:
+        s3_key = None
+        if content_type.startswith("application/json"):
+            try:
+                s3_key, content_type, run_async = _parse_handoff(event)
+            except ValueError as e:
+                return _response(400, {"error": str(e)})
+        elif "body" not in event or not (event.get("isBase64Encoded") or _base64_text(headers)):
             return _response(400, {"error":"Expected base64-encoded body"})
+        else:
+            params = event.get("queryStringParameters") or {}
+            run_async = str(params.get("async", "")).lower() == "true"
 
         # choose tagging function based on file type
-        if content_type.startswith("audio/"):
-            tag_fn = AUDIO_TAG_FUNCTION
-        elif content_type.startswith("image/") or content_type.startswith("video/"):
-            tag_fn = VISUAL_TAG_FUNCTION
-        else:
+        tagger = _tagger_config(content_type)
+        if tagger is None:
             return _response(415, {"error":f"Unsupported media type {content_type}"})
+        tag_fn, tagger_module, model_version = tagger
 
-        # construct tagging event
-        tag_event = {
-            "isBase64Encoded": True,
-            "body": event["body"],
-            "headers": {"Content-Type": content_type},
-            "requestContext": {"http":{"method":"POST","path":"/tag"}}
-        }
-        tag_resp = lambda_client.invoke(
-            FunctionName=tag_fn,
-            InvocationType="RequestResponse",
-            Payload=json.dumps(tag_event).encode()
-        )
-        tag_payload = json.loads(tag_resp["Payload"].read())
-        if tag_payload.get("statusCode", 500)!=200:
-            return _response(502, {"error":"Tagging failed","requestId":tag_payload.get("requestId")})
+        if run_async:
+            return _submit_job(event, headers, content_type, s3_key)
 
-        tags = json.loads(tag_payload["body"]).get("tags",[])
+        # construct tagging event; a handed-off file is read from S3 by the tagger
+        if s3_key is None:
+            tag_headers = {"Content-Type": content_type}
+            if _base64_text(headers):
+                tag_headers["Content-Transfer-Encoding"] = "base64"
+            tag_event = {
+                "isBase64Encoded": bool(event.get("isBase64Encoded")),
+                "body": event["body"],
+                "headers": tag_headers,
+                "requestContext": {"http":{"method":"POST","path":"/tag"}}
+            }
+            try:
+                data = _decode_file(event, headers)
+            except ValueError:
+                return _response(400, {"error":"Invalid base64 body"})
+            cache_key = content_key(data, model_version)
+        else:
+            tag_event = _s3_tag_event(s3_key, content_type)
+            try:
+                local_path, sha256_hex = _download_upload(s3_key)
+            except ClientError as e:
+                if e.response["Error"]["Code"] in ("NoSuchKey", "404"):
+                    return _response(404, {"error":f"No uploaded file {s3_key}"})
+                raise
+            data = None
+            cache_key = digest_key(sha256_hex, model_version)
+
+        try:
+            result = _tag_media(content_type, tag_fn, tagger_module, tag_event, cache_key, data, local_path)
+        except ValueError as e:
+            return _response(400, {"error": str(e)})
+        except TaggingFailed as e:
+            return _response(502, {"error":"Tagging failed","requestId":e.payload.get("requestId")})
+
+        tags = result.get("tags", [])
         if not tags:
             return _response(500, {"error":"No tags returned"})
+        return _match(tags)
 
-        # 5. Prepare payload for /query Lambda, include rawPath so routing works:
-        query_event = {
-            "rawPath": "/query",
-            "path": "/query",
-            "rawQueryString": "",
-            "headers": {"Content-Type": "application/json"},
-            "isBase64Encoded": False,
-            "body": json.dumps({"species": tags}),
-            "requestContext": {
-                "http": {"method": "POST", "path": "/query"}
-            }
-        }
+    except ClientError as e:
+        return _response(500, {"error":"AWS ClientError","detail":str(e)})
+    except Exception as e:
+        return _response(500, {"error":"Internal error","detail":str(e)})
+    finally:
+        if local_path and os.path.exists(local_path):
+            os.remove(local_path)
 
-        # Invoke /query Lambda
-        q_resp = lambda_client.invoke(
-            FunctionName=QUERY_FUNCTION,
-            InvocationType="RequestResponse",
-            Payload=json.dumps(query_event).encode('utf-8')
-        )
-        q_pay = json.loads(q_resp['Payload'].read())
+def handle_job_status(job_id):
+    """
+    Handle GET /query-by-file/{jobId}
+    Returns { "jobId", "status": queued|tagging|done|failed, "progress" (0-1),
+    "tags" (partial while a video is tagged), "error" }, plus, once done,
+    "results": the /query matches for the final tags, stored by run_job when
+    the job finished (their links are valid for the query Lambda's
+    PRESIGN_EXPIRES_IN from then).
+    A job left in "tagging" for JOB_STALE_SECONDS (its run timed out) is
+    marked failed here.
+    """
+    if not QUERY_JOBS_TABLE:
+        return _response(503, {"error":"Asynchronous query-by-file is not configured"})
+    try:
+        item = dynamodb_client.get_item(
+            TableName=QUERY_JOBS_TABLE,
+            Key={"jobId": {"S": job_id}},
+            ConsistentRead=True
+        ).get("Item")
+        if not item:
+            return _response(404, {"error":f"No job {job_id}"})
 
-        # return /query result
-        return {
-            "statusCode": q_pay.get("statusCode", 500),
-            "headers": {"Content-Type": "application/json"},
-            "body": q_pay.get("body", "{}")
-        }
+        job = _decode_job(item)
+        if job["status"] == "tagging" and time.time() - job["updatedAt"] > JOB_STALE_SECONDS:
+            # Only if the run has not written anything since this read
+            error = "Tagging timed out"
+            if _update_job(job_id, status="failed", error=error, expect=("tagging", job["updatedAt"])):
+                job.update(status="failed", error=error)
+        results_key = job.pop("resultsKey", None)
+        if job["status"] == "done" and results_key:
+            obj = s3_client.get_object(Bucket=QUERY_UPLOAD_BUCKET, Key=results_key)
+            job["results"] = json.loads(obj["Body"].read()).get("results", [])
+        return _response(200, job)
 
     except ClientError as e:
         return _response(500, {"error":"AWS ClientError","detail":str(e)})
     except Exception as e:
         return _response(500, {"error":"Internal error","detail":str(e)})
 
+def run_job(job_id):
+    """
+    Tag the file of a submitted job, recording progress in QUERY_JOBS_TABLE.
+    Errors end the job as "failed" instead of raising, so Lambda does not retry
+    the Event invoke and run the tagger again.
+    """
+    local_path = None
+    try:
+        # Claim the job in one conditional write, so a duplicate Event
+        # delivery can't tag the same file twice
+        try:
+            item = dynamodb_client.update_item(
+                TableName=QUERY_JOBS_TABLE,
+                Key={"jobId": {"S": job_id}},
+                UpdateExpression="SET #s = :tagging, updatedAt = :now",
+                ConditionExpression="#s = :queued",
+                ExpressionAttributeNames={"#s": "status"},
+                ExpressionAttributeValues={
+                    ":tagging": {"S": "tagging"},
+                    ":queued": {"S": "queued"},
+                    ":now": {"N": str(int(time.time()))}
+                },
+                ReturnValues="ALL_NEW"
+            )["Attributes"]
+        except ClientError as e:
+            if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+                raise
+            print(f"Job {job_id} is not queued, skipping")
+            return
+        content_type = item["contentType"]["S"]
+        s3_key = item["s3Key"]["S"]
+
+        tag_fn, tagger_module, model_version = _tagger_config(content_type)
+        local_path, sha256_hex = _download_upload(s3_key)
+        result = _tag_media(
+            content_type, tag_fn, tagger_module, _s3_tag_event(s3_key, content_type),
+            digest_key(sha256_hex, model_version), local_path=local_path,
+            on_progress=_job_progress(job_id)
+        )
+        tags = result.get("tags", [])
+        if not tags:
+            _update_job(job_id, status="failed", error="No tags returned", expect=("tagging",))
+            return
+        # Match once, here; polls of the finished job only read the stored body
+        matched = _match(tags)
+        if matched["statusCode"] != 200:
+            _update_job(job_id, status="failed", error=f"Matching failed: {matched['body']}", expect=("tagging",))
+            return
+        results_key = f"{QUERY_UPLOAD_PREFIX}{job_id}.results.json"
+        s3_client.put_object(
+            Bucket=QUERY_UPLOAD_BUCKET, Key=results_key, Body=matched["body"].encode(),
+            ContentType="application/json"
+        )
+        _update_job(job_id, status="done", progress=1.0, tags=tags, results_key=results_key, expect=("tagging",))
+
+    except TaggingFailed as e:
+        _update_job(
+            job_id, status="failed", error=f"Tagging failed (request {e.payload.get('requestId')})",
+            expect=("tagging",)
+        )
+    except Exception as e:
+        print(f"Job {job_id} failed: {e}")
+        _update_job(job_id, status="failed", error=str(e), expect=("tagging",))
+    finally:
+        if local_path and os.path.exists(local_path):
+            os.remove(local_path)
+
+def handle_upload_url(event):
+    """
+    Handle POST /query-by-file/upload-url
+    Body: { "contentType": "video/mp4" }
+    Returns { "key", "uploadUrl", "expiresIn" }: PUT the file to uploadUrl with
+    that Content-Type, then POST { "s3Key": key, "contentType": ... } to /query-by-file.
+    Uploads expire through the bucket's lifecycle rule on QUERY_UPLOAD_PREFIX.
+    """
+    if not QUERY_UPLOAD_BUCKET:
+        return _response(503, {"error":"Uploads for query-by-file are not configured"})
+    try:
+        body = json.loads(event.get("body") or "{}")
+    except ValueError:
+        return _response(400, {"error":"Invalid JSON body"})
+    content_type = str(body.get("contentType", "")).lower()
+    if not content_type.startswith(("audio/", "image/", "video/")):
+        return _response(415, {"error":f"Unsupported media type {content_type}"})
+
+    key = f"{QUERY_UPLOAD_PREFIX}{uuid.uuid4()}{mimetypes.guess_extension(content_type) or ''}"
+    upload_url = s3_client.generate_presigned_url(
+        ClientMethod="put_object",
+        Params={"Bucket": QUERY_UPLOAD_BUCKET, "Key": key, "ContentType": content_type},
+        ExpiresIn=UPLOAD_URL_EXPIRES
+    )
+    return _response(200, {"key": key, "uploadUrl": upload_url, "expiresIn": UPLOAD_URL_EXPIRES})
+
+def _parse_handoff(event):
+    # -> (s3 key, content type, async) of a JSON /query-by-file body; raises ValueError
+    if not QUERY_UPLOAD_BUCKET:
+        raise ValueError("Uploads for query-by-file are not configured")
+    raw = event.get("body") or "{}"
+    if event.get("isBase64Encoded"):
+        raw = base64.b64decode(raw)
+    body = json.loads(raw)
+    s3_key = body.get("s3Key")
+    content_type = str(body.get("contentType", "")).lower()
+    # Only objects handed out by /query-by-file/upload-url may be read
+    if not isinstance(s3_key, str) or not s3_key.startswith(QUERY_UPLOAD_PREFIX) or ".." in s3_key:
+        raise ValueError("s3Key must be a key returned by /query-by-file/upload-url")
+    if not content_type:
+        raise ValueError("contentType is required with s3Key")
+    run_async = body.get("async", False)
+    if not isinstance(run_async, bool):
+        raise ValueError("async must be true or false")
+    return s3_key, content_type, run_async
+
+def _tagger_config(content_type):
+    # -> (tagging Lambda, tagger module, model version) for a Content-Type, or None
+    if content_type.startswith("audio/"):
+        return AUDIO_TAG_FUNCTION, AUDIO_TAGGER_MODULE, AUDIO_MODEL_VERSION
+    if content_type.startswith("image/") or content_type.startswith("video/"):
+        return VISUAL_TAG_FUNCTION, VISUAL_TAGGER_MODULE, VISUAL_MODEL_VERSION
+    return None
+
+def _s3_tag_event(s3_key, content_type):
+    return {
+        "s3": {"bucket": QUERY_UPLOAD_BUCKET, "key": s3_key},
+        "headers": {"Content-Type": content_type},
+        "requestContext": {"http":{"method":"POST","path":"/tag"}}
+    }
+
+def _tag_media(content_type, tag_fn, tagger_module, tag_event, cache_key,
+               data=None, local_path=None, on_progress=None):
+    """
+    Tagging result ({"mediaType", "tags", ...}) of the file given as `data` or
+    at `local_path`: from the inference cache, a near-duplicate stored image,
+    the in-process tagger or the tagging Lambda, in that order.
+    Raises ValueError for a file the tagger rejects, TaggingFailed if the
+    tagging Lambda fails. on_progress only reaches an in-process tagger.
+    """
+    # The same clip or photo is often queried again; reuse its tags
+    result = inference_cache.get(cache_key)
+    if result is None and content_type.startswith("image/"):
+        # Re-encoded or resized copy of a stored photo: its tags are already known
+        result = _near_duplicate_result(data if data is not None else _read_file(local_path))
+    if result is None:
+        tagger = _local_tagger(tagger_module) if QUERY_BY_FILE_MODE == "inprocess" else None
+        if tagger is not None:
+            if data is not None:
+                result = tagger.tag_bytes(data, content_type)
+            else:
+                result = tagger.tag_file(local_path, content_type, on_progress)
+        else:
+            result, failed = _invoke_tagger(tag_fn, tag_event)
+            if failed is not None:
+                raise TaggingFailed(failed)
+        inference_cache.put(cache_key, result)
+    print("inference cache:", inference_cache.stats())
+    return result
+
+def _submit_job(event, headers, content_type, s3_key):
+    """
+    Record a queued job and start it with an Event invoke of this function.
+    A raw body is stored under QUERY_UPLOAD_PREFIX first: Event payloads are
+    limited to 256 KB. Returns the 202 response with the job id.
+    """
+    if not QUERY_JOBS_TABLE or not QUERY_UPLOAD_BUCKET:
+        return _response(503, {"error":"Asynchronous query-by-file is not configured"})
+    job_id = str(uuid.uuid4())
+    if s3_key is None:
+        try:
+            data = _decode_file(event, headers)
+        except ValueError:
+            return _response(400, {"error":"Invalid base64 body"})
+        s3_key = f"{QUERY_UPLOAD_PREFIX}{job_id}{mimetypes.guess_extension(content_type) or ''}"
+        s3_client.put_object(Bucket=QUERY_UPLOAD_BUCKET, Key=s3_key, Body=data, ContentType=content_type)
+
+    now = int(time.time())
+    dynamodb_client.put_item(
+        TableName=QUERY_JOBS_TABLE,
+        Item={
+            "jobId": {"S": job_id},
+            "status": {"S": "queued"},
+            "contentType": {"S": content_type},
+            "s3Key": {"S": s3_key},
+            "progress": {"N": "0"},
+            "createdAt": {"N": str(now)},
+            "updatedAt": {"N": str(now)},
+            "expiresAt": {"N": str(now + QUERY_JOB_TTL)}
+        }
+    )
+    lambda_client.invoke(
+        FunctionName=QUERY_BY_FILE_FUNCTION,
+        InvocationType="Event",
+        Payload=json.dumps({"jobId": job_id}).encode()
+    )
+    return _response(202, {"jobId": job_id, "status": "queued", "statusPath": f"/query-by-file/{job_id}"})
+
+def _update_job(job_id, status=None, progress=None, tags=None, error=None, results_key=None, expect=None):
+    """
+    SET the given job fields. `expect` is (status,) or (status, updatedAt):
+    the write only happens if the job is still in that state.
+    Returns False if it was not written.
+    """
+    names, values, sets = {}, {":now": {"N": str(int(time.time()))}}, ["updatedAt = :now"]
+    kwargs = {}
+    if status is not None or expect:
+        names["#s"] = "status"
+    if status is not None:
+        values[":s"] = {"S": status}
+        sets.append("#s = :s")
+    if expect:
+        values[":expect"] = {"S": expect[0]}
+        conditions = ["#s = :expect"]
+        if len(expect) > 1:
+            values[":seen"] = {"N": str(expect[1])}
+            conditions.append("updatedAt = :seen")
+        kwargs["ConditionExpression"] = " AND ".join(conditions)
+    if progress is not None:
+        values[":p"] = {"N": str(round(progress, 4))}
+        sets.append("progress = :p")
+    if tags is not None:
+        values[":t"] = {"S": json.dumps(tags)}
+        sets.append("tags = :t")
+    if results_key is not None:
+        values[":r"] = {"S": results_key}
+        sets.append("resultsKey = :r")
+    if error is not None:
+        values[":e"] = {"S": error}
+        sets.append("#err = :e")
+        names["#err"] = "error"
+    if names:
+        kwargs["ExpressionAttributeNames"] = names
+    try:
+        dynamodb_client.update_item(
+            TableName=QUERY_JOBS_TABLE,
+            Key={"jobId": {"S": job_id}},
+            UpdateExpression="SET " + ", ".join(sets),
+            ExpressionAttributeValues=values,
+            **kwargs
+        )
+        return True
+    except ClientError as e:
+        if e.response["Error"]["Code"] == "ConditionalCheckFailedException":
+            print(f"Job {job_id} is no longer {expect[0]}, not updated")
+        else:
+            print(f"Could not update job {job_id}: {e}")
+        return False
+
+def _job_progress(job_id):
+    """
+    on_progress callback for the in-process tagger: stores the tags seen so
+    far at most every JOB_PROGRESS_INTERVAL seconds.
+    """
+    last = [0.0]
+    def on_progress(done, total, tags):
+        now = time.monotonic()
+        if now - last[0] < JOB_PROGRESS_INTERVAL:
+            return
+        last[0] = now
+        _update_job(job_id, progress=min(done / total, 0.99) if total else None, tags=tags, expect=("tagging",))
+    return on_progress
+
+def _decode_job(item):
+    job = {
+        "jobId": item["jobId"]["S"],
+        "status": item["status"]["S"],
+        "progress": float(item.get("progress", {}).get("N", "0")),
+        "tags": json.loads(item["tags"]["S"]) if "tags" in item else [],
+        "createdAt": int(item["createdAt"]["N"]),
+        "updatedAt": int(item["updatedAt"]["N"])
+    }
+    if "error" in item:
+        job["error"] = item["error"]["S"]
+    if "resultsKey" in item:
+        job["resultsKey"] = item["resultsKey"]["S"]
+    return job
+
+def _download_upload(s3_key):
+    """
+    Stream an uploaded file to local disk, hashing it on the way.
+    Returns (local path, sha256 hex); the file is never held in memory whole.
+    """
+    obj = s3_client.get_object(Bucket=QUERY_UPLOAD_BUCKET, Key=s3_key)
+    digest = hashlib.sha256()
+    with tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(s3_key)[1]) as f:
+        for chunk in obj["Body"].iter_chunks(DOWNLOAD_CHUNK_BYTES):
+            digest.update(chunk)
+            f.write(chunk)
+    return f.name, digest.hexdigest()
+
+def _read_file(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+def _invoke_tagger(tag_fn, tag_event):
+    """
+    Tag through the tagging Lambda.
+    Returns (tagging result, None), or (None, the Lambda's payload) if tagging failed.
+    """
+    tag_resp = lambda_client.invoke(
+        FunctionName=tag_fn,
+        InvocationType="RequestResponse",
+        Payload=json.dumps(tag_event).encode()
+    )
+    tag_payload = json.loads(tag_resp["Payload"].read())
+    if tag_payload.get("statusCode", 500)!=200:
+        return None, tag_payload
+    return json.loads(tag_payload["body"]), None
+
+def _near_duplicate_result(data):
+    """
+    Tagging result of the stored image closest to `data` by dHash, if one is
+    within NEAR_DUPLICATE_DISTANCE bits; None otherwise or when the hash index
+    or an image library (OpenCV or Pillow) isn't available here.
+    """
+    index = image_hash_loader.get() if image_hash_loader else None
+    if not index:
+        return None
+    try:
+        value = dhash_bytes(data)
+    except ImportError as e:
+        print(f"No perceptual hashing in this package: {e}")
+        return None
+    if value is None:
+        return None
+    match = index.nearest(value, NEAR_DUPLICATE_DISTANCE)
+    if match is None:
+        return None
+
+    file_id, distance = match
+    item = dynamodb_client.get_item(
+        TableName=TABLE_NAME,
+        Key={"fileId": {"S": file_id}},
+        ProjectionExpression="fileId, tags"
+    ).get("Item")
+    if not item:
+        return None
+    print(f"Near-duplicate of {file_id} (distance {distance}), reusing its tags")
+    return {
+        "mediaType": "image",
+        "tags": [{"name": name, "count": count} for name, count in decode_item(item).tags],
+        "nearDuplicate": {"fileId": file_id, "distance": distance}
+    }
+
+def _decode_file(event, headers):
+    """
+    File bytes of the request body, decoded as the request declares them:
+    once if API Gateway base64-encoded it (isBase64Encoded), once more if the
+    client sent base64 text ("Content-Transfer-Encoding: base64"). Raises ValueError.
+    """
+    data = event["body"]
+    if event.get("isBase64Encoded"):
+        data = base64.b64decode(data)
+    if _base64_text(headers):
+        data = base64.b64decode(data)
+    if isinstance(data, str):
+        raise ValueError("Body is not base64 encoded")
+    return data
+
+def _base64_text(headers):
+    # headers: lower-cased names
+    return headers.get("content-transfer-encoding", "").lower() == "base64"
+
+def _invoke_query(tags):
+    # Prepare payload for /query Lambda, include rawPath so routing works:
+    query_event = {
+        "rawPath": "/query",
+        "path": "/query",
+        "rawQueryString": "",
+        "headers": {"Content-Type": "application/json"},
+        "isBase64Encoded": False,
+        "body": json.dumps({"species": tags}),
+        "requestContext": {
+            "http": {"method": "POST", "path": "/query"}
+        }
+    }
+
+    # Invoke /query Lambda
+    q_resp = lambda_client.invoke(
+        FunctionName=QUERY_FUNCTION,
+        InvocationType="RequestResponse",
+        Payload=json.dumps(query_event).encode('utf-8')
+    )
+    q_pay = json.loads(q_resp['Payload'].read())
+
+    # return /query result
+    return {
+        "statusCode": q_pay.get("statusCode", 500),
+        "headers": {"Content-Type": "application/json"},
+        "body": q_pay.get("body", "{}")
+    }
+
+def _match(tags):
+    if QUERY_BY_FILE_MODE == "inprocess":
+        return _match_in_process(tags)
+    return _invoke_query(tags)
+
+def _match_in_process(tags):
+    # query.py ships in this package; imported on first use so "invoke" mode never pays for it
+    import query
+    try:
+        return _response(200, query.run_query({"species": tags}))
+    except ValueError as e:
+        return _response(400, {"message": str(e)})
+
+def _local_tagger(module_name):
+    """
+    The tagger module (tag_bytes / tag_file) if it is packaged with this
+    function, else None. Imported once per container; the model loads with it.
+    """
+    if module_name not in _local_taggers:
+        try:
+            _local_taggers[module_name] = importlib.import_module(module_name)
+        except ImportError as e:
+            print(f"No in-process tagger {module_name}: {e}")
+            _local_taggers[module_name] = None
+    return _local_taggers[module_name]
+
 def _response(status, body):
     return {
         "statusCode": status,
@@ -0,0 +1,68 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+RESULT_CACHE_SIZE        = int(os.environ.get("RESULT_CACHE_SIZE", "256"))
+RESULT_CACHE_TTL         = int(os.environ.get("RESULT_CACHE_TTL", "300"))
+# Results larger than this are not worth holding in the container's memory
+RESULT_CACHE_MAX_ITEMS   = int(os.environ.get("RESULT_CACHE_MAX_ITEMS", "5000"))
+
+class QueryResultCache:
+    """
+    Size-bounded LRU of query results with a TTL, invalidated by a tag generation.
+
+    Every tag write bumps a counter in DynamoDB. Callers pass the generation
+    they just read; if it differs from the one the cache was filled under,
+    every entry is stale and the whole cache is dropped in one step.
+    """
+
+    def __init__(self, max_entries=RESULT_CACHE_SIZE, ttl_seconds=RESULT_CACHE_TTL,
+                 max_items=RESULT_CACHE_MAX_ITEMS, clock=time.time):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_items   = max_items
+        self.clock       = clock
+        self.generation  = None
+        self.hits        = 0
+        self.misses      = 0
+        self._entries    = OrderedDict()  # key -> (stored_at, value)
+        self._lock       = threading.Lock()
+
+    def get(self, key, generation):
+        with self._lock:
+            self._observe(generation)
+            entry = self._entries.get(key)
+            if entry is not None and self.clock() - entry[0] < self.ttl_seconds:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, generation, value, item_count=0):
+        if generation is None or item_count > self.max_items:
+            return
+        with self._lock:
+            self._observe(generation)
+            self._entries[key] = (self.clock(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _observe(self, generation):
+        if generation != self.generation:
+            self._entries.clear()
+            self.generation = generation
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "size": len(self._entries),
+            "generation": self.generation,
+            "hitRatio": round(self.hits / total, 4) if total else 0.0
+        }
@@ -0,0 +1,94 @@
+import time
+
+class S3ObjectLoader:
+    """
+    Keeps an S3-persisted object (bitmap index, species vocabulary, image
+    hash index) decoded in the warm container. It is re-downloaded only when
+    its ETag changes, checking at most every `refresh_seconds`.
+    `decode` turns the object's bytes into the value get() returns.
+    """
+
+    def __init__(self, s3_client, bucket, key, decode, refresh_seconds=60):
+        self.s3_client       = s3_client
+        self.bucket          = bucket
+        self.key             = key
+        self.decode          = decode
+        self.refresh_seconds = refresh_seconds
+        self.value           = None
+        self.etag            = None
+        self.metadata        = {}
+        self.checked_at      = 0
+
+    def get(self):
+        now = time.time()
+        if now - self.checked_at < self.refresh_seconds:
+            return self.value
+        self.checked_at = now
+        try:
+            head = self.s3_client.head_object(Bucket=self.bucket, Key=self.key)
+            if head["ETag"] != self.etag:
+                obj = self.s3_client.get_object(Bucket=self.bucket, Key=self.key)
+                start = time.perf_counter()
+                data = obj["Body"].read()
+                self.value = self.decode(data)
+                self.etag  = obj["ETag"]
+                self.metadata = obj.get("Metadata", {})
+                print(f"Loaded s3://{self.bucket}/{self.key} "
+                      f"({len(data)} bytes, {(time.perf_counter() - start) * 1000:.1f} ms)")
+        except Exception as e:
+            # Keep serving the copy we have; without one the caller falls back
+            print(f"Refreshing s3://{self.bucket}/{self.key} failed: {e}")
+        return self.value
+
+class S3PrefixLoader:
+    """
+    Keeps every object under an S3 prefix (bitmap deltas awaiting compaction)
+    decoded in the warm container, listing the prefix at most every
+    `refresh_seconds`. Objects are immutable, so each key is downloaded once.
+    get(retain_after) returns (key, decoded object) pairs in key order.
+    """
+
+    def __init__(self, s3_client, bucket, prefix, decode, refresh_seconds=5):
+        self.s3_client       = s3_client
+        self.bucket          = bucket
+        self.prefix          = prefix
+        self.decode          = decode
+        self.refresh_seconds = refresh_seconds
+        self.values          = {}
+        self.checked_at      = 0
+
+    @property
+    def latest_key(self):
+        return max(self.values, default=None)
+
+    def get(self, retain_after=""):
+        """
+        Keys gone from the listing are dropped only once they sort at or
+        before `retain_after`: a delta deleted by compaction stays until the
+        caller holds an index it was applied to.
+        """
+        now = time.time()
+        if now - self.checked_at >= self.refresh_seconds:
+            self.checked_at = now
+            try:
+                self._refresh(retain_after)
+            except Exception as e:
+                print(f"Listing s3://{self.bucket}/{self.prefix} failed: {e}")
+        return [(key, self.values[key]) for key in sorted(self.values) if key > retain_after]
+
+    def _refresh(self, retain_after):
+        listed = []
+        paginator = self.s3_client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self.prefix):
+            listed.extend(obj["Key"] for obj in page.get("Contents", []))
+        values = {key: value for key, value in self.values.items() if key > retain_after}
+        for key in listed:
+            if key in values or key <= retain_after:
+                continue
+            try:
+                obj = self.s3_client.get_object(Bucket=self.bucket, Key=key)
+                values[key] = self.decode(obj["Body"].read())
+            except Exception as e:
+                # Compacted (deleted) between the listing and the GET
+                print(f"Loading s3://{self.bucket}/{key} failed: {e}")
+        self.values = values
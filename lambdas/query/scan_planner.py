@@ -0,0 +1,56 @@
+import os
+
+# Shape of the "tags" attribute: "list" ([{name, count}, ...]) or "map" ({species: count}).
+# The "list" prefilter is also correct for maps, so switch to "map" only once
+# tag_migration has converted every item.
+TAG_SCHEMA = os.environ.get("TAG_SCHEMA", "list")
+
+# Attributes transform_item and the paging cursor need; everything else stays in DynamoDB
+PROJECTED_ATTRIBUTES = ["fileId", "type", "tags", "key", "thumbnailKey", "uploadedAt"]
+
+def plan_scan(species_filters, mode, tag_schema=TAG_SCHEMA):
+    """
+    Turn species filters into low-level client Scan (or Query) keyword
+    arguments (values in DynamoDB wire format).
+
+    species_filters: list of (normalized species, min_count)
+    mode: "all" (/query, every filter must hold) or "any" (/find, at least one species)
+
+    The ProjectionExpression is always pushed down. The FilterExpression is
+    exact when tags are stored as a map. A list of {name, count} maps can't be
+    searched by element field in a DynamoDB expression, so for that schema only
+    a size(tags) prefilter is pushed and the exact match stays in Python.
+    Callers must keep applying their Python matcher either way; pushed filters
+    never reject an item the matcher would accept.
+    """
+    names = {}
+    for i, attr in enumerate(PROJECTED_ATTRIBUTES):
+        names[f"#p{i}"] = attr
+    scan_kwargs = {"ProjectionExpression": ", ".join(names)}
+    tags_ref = "#p" + str(PROJECTED_ATTRIBUTES.index("tags"))
+    values = {}
+
+    if tag_schema == "map":
+        clauses = []
+        for i, (species, count) in enumerate(species_filters):
+            names[f"#s{i}"] = species
+            if count > 0:
+                values[f":c{i}"] = {"N": str(count)}
+                clauses.append(f"{tags_ref}.#s{i} >= :c{i}")
+            else:
+                clauses.append(f"attribute_exists({tags_ref}.#s{i})")
+        if clauses:
+            joiner = " AND " if mode == "all" else " OR "
+            scan_kwargs["FilterExpression"] = joiner.join(clauses)
+    elif species_filters:
+        # An item can only satisfy k distinct "all" filters if it has at least k tags.
+        # No filters pushes nothing, as for maps: size() of a missing tags
+        # attribute is false, and such an item still matches "no species"
+        distinct = len({species for species, _ in species_filters}) if mode == "all" else 1
+        values[":ntags"] = {"N": str(distinct)}
+        scan_kwargs["FilterExpression"] = f"size({tags_ref}) >= :ntags"
+
+    scan_kwargs["ExpressionAttributeNames"] = names
+    if values:
+        scan_kwargs["ExpressionAttributeValues"] = values
+    return scan_kwargs
@@ -0,0 +1,191 @@
+import base64
+import json
+import struct
+import time
+import zlib
+
+CHUNK_BITS = 16
+CHUNK_MASK = (1 << CHUNK_BITS) - 1
+CHUNK_BYTES = (1 << CHUNK_BITS) // 8
+
+# Bit positions set in every byte value, for iterating a chunk byte by byte
+_BYTE_BITS = [tuple(bit for bit in range(8) if value >> bit & 1) for value in range(256)]
+
+class Bitmap:
+    """
+    Roaring-style compressed bitset over integer ordinals.
+
+    Ordinals are split into 2^16-wide chunks; only non-empty chunks are kept,
+    each as a Python int used as a fixed-width bitset. AND/OR work chunk by
+    chunk, so sparse species cost a few bytes and dense ones 8 KB per chunk.
+    """
+    __slots__ = ("chunks",)
+
+    def __init__(self, chunks=None):
+        self.chunks = chunks if chunks is not None else {}
+
+    def add(self, n):
+        hi, lo = n >> CHUNK_BITS, n & CHUNK_MASK
+        self.chunks[hi] = self.chunks.get(hi, 0) | (1 << lo)
+
+    def discard(self, n):
+        hi, lo = n >> CHUNK_BITS, n & CHUNK_MASK
+        if hi in self.chunks:
+            v = self.chunks[hi] & ~(1 << lo)
+            if v:
+                self.chunks[hi] = v
+            else:
+                del self.chunks[hi]
+
+    def __contains__(self, n):
+        return bool(self.chunks.get(n >> CHUNK_BITS, 0) >> (n & CHUNK_MASK) & 1)
+
+    def __and__(self, other):
+        small, large = (self, other) if len(self.chunks) <= len(other.chunks) else (other, self)
+        out = {}
+        for hi, v in small.chunks.items():
+            w = v & large.chunks.get(hi, 0)
+            if w:
+                out[hi] = w
+        return Bitmap(out)
+
+    def __or__(self, other):
+        out = dict(self.chunks)
+        for hi, v in other.chunks.items():
+            out[hi] = out.get(hi, 0) | v
+        return Bitmap(out)
+
+    def __len__(self):
+        return sum(bin(v).count("1") for v in self.chunks.values())
+
+    def __bool__(self):
+        return bool(self.chunks)
+
+    def __iter__(self):
+        for hi in sorted(self.chunks):
+            base = hi << CHUNK_BITS
+            raw = self.chunks[hi].to_bytes(CHUNK_BYTES, "little")
+            for byte_index, value in enumerate(raw):
+                if value:
+                    offset = base | (byte_index << 3)
+                    for bit in _BYTE_BITS[value]:
+                        yield offset | bit
+
+    def to_bytes(self):
+        parts = []
+        for hi in sorted(self.chunks):
+            v = self.chunks[hi]
+            raw = v.to_bytes((v.bit_length() + 7) // 8, "little")
+            parts.append(struct.pack("<IH", hi, len(raw)) + raw)
+        return b"".join(parts)
+
+    @classmethod
+    def from_bytes(cls, data):
+        chunks = {}
+        offset = 0
+        while offset < len(data):
+            hi, size = struct.unpack_from("<IH", data, offset)
+            offset += 6
+            chunks[hi] = int.from_bytes(data[offset:offset + size], "little")
+            offset += size
+        return cls(chunks)
+
+class SpeciesBitmapIndex:
+    """
+    Per-species, per-count-threshold bitmaps over dense file ordinals.
+
+    thresholds[species][n] has the bit of every file tagged with `species`
+    at least n times (n = 0 is "tagged at all"), so "crow >= 3" is a single
+    bitmap lookup and multi-species AND/OR are bitwise ops.
+    """
+
+    def __init__(self):
+        self.file_ids   = []   # ordinal -> fileId
+        self.ordinals   = {}   # fileId -> ordinal
+        self.thresholds = {}   # species -> [Bitmap, ...]
+        self.updated_at = 0
+
+    def ordinal(self, file_id):
+        if file_id not in self.ordinals:
+            self.ordinals[file_id] = len(self.file_ids)
+            self.file_ids.append(file_id)
+        return self.ordinals[file_id]
+
+    def set_tags(self, file_id, old_tags, new_tags):
+        """
+        Move a file from its old { species: count } map to the new one.
+        Ordinals are never reused; a deleted file simply has no bits set.
+        """
+        n = self.ordinal(file_id)
+        for species, count in old_tags.items():
+            for bitmap in self.thresholds.get(species, [])[:count + 1]:
+                bitmap.discard(n)
+        for species, count in new_tags.items():
+            levels = self.thresholds.setdefault(species, [])
+            while len(levels) <= count:
+                levels.append(Bitmap())
+            for bitmap in levels[:count + 1]:
+                bitmap.add(n)
+        self.updated_at = int(time.time())
+
+    def at_least(self, species, count):
+        levels = self.thresholds.get(species, [])
+        count = max(int(count), 0)
+        return levels[count] if count < len(levels) else Bitmap()
+
+    def match_all(self, filters):
+        """
+        filters: iterable of (species, min_count). Returns the AND of all of them.
+        """
+        result = None
+        for species, count in filters:
+            bitmap = self.at_least(species, count)
+            result = bitmap if result is None else result & bitmap
+            if not result:
+                return Bitmap()
+        return result or Bitmap()
+
+    def match_any(self, species_list):
+        result = Bitmap()
+        for species in species_list:
+            result = result | self.at_least(species, 0)
+        return result
+
+    def to_file_ids(self, bitmap):
+        return {self.file_ids[n] for n in bitmap}
+
+    def dumps(self):
+        payload = {
+            "version": 1,
+            "updatedAt": self.updated_at,
+            "fileIds": self.file_ids,
+            "species": {
+                species: [base64.b64encode(b.to_bytes()).decode() for b in levels]
+                for species, levels in self.thresholds.items()
+            }
+        }
+        return zlib.compress(json.dumps(payload, separators=(",", ":")).encode(), 6)
+
+    @classmethod
+    def loads(cls, data):
+        payload = json.loads(zlib.decompress(data))
+        index = cls()
+        index.file_ids   = payload["fileIds"]
+        index.ordinals   = {fid: n for n, fid in enumerate(index.file_ids)}
+        index.updated_at = payload.get("updatedAt", 0)
+        index.thresholds = {
+            species: [Bitmap.from_bytes(base64.b64decode(b)) for b in levels]
+            for species, levels in payload["species"].items()
+        }
+        return index
+
+def dumps_changes(changes):
+    """
+    A bitmap delta: (fileId, old { species: count }, new { species: count })
+    triples in stream order, as written by the refresh Lambda between compactions.
+    """
+    payload = [[file_id, old_tags, new_tags] for file_id, old_tags, new_tags in changes]
+    return zlib.compress(json.dumps(payload, separators=(",", ":")).encode(), 6)
+
+def loads_changes(data):
+    return [(file_id, old_tags, new_tags) for file_id, old_tags, new_tags in json.loads(zlib.decompress(data))]
@@ -0,0 +1,54 @@
+import os
+import threading
+import time
+
+# Observed cardinalities older than this are re-learned on the next full lookup
+CARDINALITY_TTL = int(os.environ.get("CARDINALITY_TTL", "3600"))
+
+class SpeciesCardinality:
+    """
+    Per-species "how many files have count >= N" statistics, learned by the
+    query planner from its own complete species index lookups.
+
+    Stored as { species: { min_count: (observed_at, files) } }. Since the
+    number of files only shrinks as min_count grows, the observation with the
+    largest min_count <= N is an upper bound for N.
+    """
+
+    def __init__(self, ttl_seconds=CARDINALITY_TTL, clock=time.time):
+        self.ttl_seconds = ttl_seconds
+        self.clock       = clock
+        self._counts     = {}
+        self._lock       = threading.Lock()
+
+    def observe(self, species, min_count, files):
+        with self._lock:
+            self._counts.setdefault(species, {})[min_count] = (self.clock(), files)
+
+    def estimate(self, species, min_count=0):
+        """
+        Upper bound on the files tagged with `species` at least `min_count` times,
+        or None if nothing fresh is known.
+        """
+        now = self.clock()
+        best = None
+        with self._lock:
+            for observed_min, (observed_at, files) in self._counts.get(species, {}).items():
+                if observed_min > min_count or now - observed_at >= self.ttl_seconds:
+                    continue
+                if best is None or observed_min > best[0]:
+                    best = (observed_min, files)
+        return best[1] if best else None
+
+    def order(self, species_filters):
+        """
+        species_filters sorted most selective first; species with no
+        estimate go last, in their original order.
+        """
+        estimates = [(self.estimate(name, cnt), i) for i, (name, cnt) in enumerate(species_filters)]
+        ranked = sorted(estimates, key=lambda e: (e[0] is None, e[0] or 0, e[1]))
+        return [(species_filters[i], estimate) for estimate, i in ranked]
+
+    def stats(self):
+        with self._lock:
+            return {name: {n: files for n, (_, files) in counts.items()} for name, counts in self._counts.items()}
@@ -0,0 +1,73 @@
+import os
+import boto3
+from media_records import decode_item
+from parallel_scan import parallel_scan
+from tag_stats import TAG_STATS_KEY, apply_stats_delta, decode_counters, stats_delta
+
+TABLE_NAME      = os.environ.get("TABLE_NAME", "BirdMediaTags")
+TAG_STATS_TABLE = os.environ.get("TAG_STATS_TABLE", "BirdTagStats")
+REGION          = os.environ.get("REGION", "us-east-1")
+
+dynamodb_client = boto3.client("dynamodb", region_name=REGION)
+
+def lambda_handler(event, context):
+    """
+    Rebuilds the /stats counters from a parallel scan of BirdMediaTags.
+    Runs on a schedule (or by hand) to repair drift, e.g. after a writer
+    failed between its tag write and its counter update.
+
+    Every item in the table counts as a file, tagged or not, matching the
+    writers: lambda_upload ADDs the file counters when it creates the record,
+    the tagging Lambdas only when no upload-time record existed, and
+    /delete-resource subtracts them.
+
+    The stored counters are read before and after the scan. A counter that
+    moved in between had writes racing the scan, which may or may not have
+    seen them, so its drift is unknown: it is left alone and reported as
+    "busy" for a later run to fix. The others get (scanned - stored) ADDed,
+    never overwritten, so writes after the scan are kept. A counter whose
+    racing writes cancelled out (e.g. a tag added and removed mid-scan) can
+    still be off by those writes until the next run.
+    With { "dryRun": true } the drift is only reported.
+    """
+    before = _read_counters()
+    expected = {}
+    files = 0
+    for page in parallel_scan(
+        dynamodb_client,
+        TABLE_NAME,
+        ProjectionExpression="fileId, #t, tags",
+        ExpressionAttributeNames={"#t": "type"}
+    ):
+        for raw in page:
+            record = decode_item(raw)
+            for attr, n in stats_delta(record.media_type, {}, record.counts, file_added=True).items():
+                expected[attr] = expected.get(attr, 0) + n
+            files += 1
+
+    after = _read_counters()
+
+    drift, busy = {}, []
+    for attr in set(expected) | set(before) | set(after):
+        if before.get(attr, 0) != after.get(attr, 0):
+            busy.append(attr)
+            continue
+        diff = expected.get(attr, 0) - before.get(attr, 0)
+        if diff:
+            drift[attr] = diff
+
+    if drift and not event.get("dryRun"):
+        apply_stats_delta(dynamodb_client, TAG_STATS_TABLE, drift)
+
+    print(f"Scanned {files} files; {len(drift)} counters drifted: {drift}; {len(busy)} busy: {sorted(busy)}")
+    return {
+        "statusCode": 200,
+        "body": f"Scanned {files} files, corrected {len(drift)} counters, skipped {len(busy)} busy counters"
+    }
+
+def _read_counters():
+    return decode_counters(dynamodb_client.get_item(
+        TableName=TAG_STATS_TABLE,
+        Key={"stat": {"S": TAG_STATS_KEY}},
+        ConsistentRead=True
+    ).get("Item"))
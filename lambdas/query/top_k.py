@@ -0,0 +1,69 @@
+import heapq
+
+SORT_DETECTIONS = "detections"
+SORT_UPLOADED_AT = "uploadedAt"
+# "count:<species>" sorts by that species' count
+SORT_COUNT_PREFIX = "count:"
+
+class _Entry:
+    """
+    Heap entry ordered by score, ties broken so that the larger fileId is
+    evicted first; the result doesn't depend on the order records arrive in.
+    """
+    __slots__ = ("score", "record")
+
+    def __init__(self, score, record):
+        self.score  = score
+        self.record = record
+
+    def __lt__(self, other):
+        if self.score != other.score:
+            return self.score < other.score
+        return self.record.file_id > other.record.file_id
+
+class TopK:
+    """
+    The k highest-scoring records seen so far, kept in a min-heap of size k:
+    memory is O(k) however many records are pushed, and each push is O(log k).
+    """
+
+    def __init__(self, k, score_fn):
+        self.k        = k
+        self.score_fn = score_fn
+        self.seen     = 0
+        self._heap    = []
+
+    def push(self, record):
+        self.seen += 1
+        entry = _Entry(self.score_fn(record), record)
+        if len(self._heap) < self.k:
+            heapq.heappush(self._heap, entry)
+        elif self._heap[0] < entry:
+            heapq.heapreplace(self._heap, entry)
+
+    def extend(self, records):
+        for record in records:
+            self.push(record)
+        return self
+
+    def results(self):
+        """
+        Kept records, best first.
+        """
+        return [entry.record for entry in sorted(self._heap, reverse=True)]
+
+def sort_key_fn(sort):
+    """
+    Score function for a "sort" request value, or None if it isn't one:
+      "detections"     - total count over all species
+      "uploadedAt"     - newest first (records without a timestamp last)
+      "count:<name>"   - count of species <name> (name already normalized)
+    """
+    if sort == SORT_DETECTIONS:
+        return lambda record: sum(record.counts.values())
+    if sort == SORT_UPLOADED_AT:
+        return lambda record: record.uploaded_at or ""
+    if sort.startswith(SORT_COUNT_PREFIX) and sort[len(SORT_COUNT_PREFIX):]:
+        species = sort[len(SORT_COUNT_PREFIX):]
+        return lambda record: record.counts.get(species, 0)
+    return None
@@ -0,0 +1,79 @@
+import sys
+
+_intern = sys.intern
+# Raw tag name -> interned normalized species; the vocabulary is small, so this stays tiny
+_normalized_names = {}
+
+class MediaRecord:
+    """
+    Compact BirdMediaTags item decoded straight from DynamoDB wire format.
+
+    tags   - tuple of (name, count) as stored, names interned
+    counts - { normalized species: count }, what the query matchers look at
+    Counts are plain ints; nothing goes through TypeDeserializer or Decimal.
+    """
+    __slots__ = ("file_id", "media_type", "key", "thumbnail_key", "tags", "counts", "uploaded_at")
+
+    def __init__(self, file_id, media_type="", key=None, thumbnail_key="", tags=(), uploaded_at=""):
+        self.file_id       = file_id
+        self.media_type    = media_type
+        self.key           = key
+        self.thumbnail_key = thumbnail_key
+        self.tags          = tags
+        self.uploaded_at   = uploaded_at
+        self.counts        = {normalize_species(name): count for name, count in tags}
+
+    def __repr__(self):
+        return f"MediaRecord({self.file_id!r}, {self.media_type!r}, tags={self.tags!r})"
+
+def normalize_species(name):
+    species = _normalized_names.get(name)
+    if species is None:
+        species = _normalized_names[name] = _intern(name.strip().lower())
+    return species
+
+def decode_tags(attr):
+    """
+    Wire-format "tags" attribute -> tuple of (name, count). Either shape is read:
+    a map of species to count ({"M": {"crow": {"N": "2"}}}), written since the
+    tag migration, or the older list ({"L": [{"M": {"name": {"S"}, "count": {"N"}}}, ...]}).
+    """
+    if not attr:
+        return ()
+    m = attr.get("M")
+    if m is not None:
+        return tuple((_intern(name), int(count["N"]) if "N" in count else 0) for name, count in m.items())
+    tags = []
+    for elt in attr.get("L", ()):
+        m = elt.get("M")
+        if not m:
+            continue
+        name = m.get("name", {}).get("S")
+        if not name:
+            continue
+        count = m.get("count")
+        tags.append((_intern(name), int(count["N"]) if count and "N" in count else 0))
+    return tuple(tags)
+
+def decode_item(raw):
+    """
+    One wire-format item (Scan/GetItem/BatchGetItem/stream image) -> MediaRecord.
+    """
+    get = raw.get
+    return MediaRecord(
+        raw["fileId"]["S"],
+        _intern(get("type", {}).get("S", "").lower()),
+        get("key", {}).get("S"),
+        get("thumbnailKey", {}).get("S", ""),
+        decode_tags(get("tags")),
+        get("uploadedAt", {}).get("S", "")
+    )
+
+def decode_page(raw_items):
+    return [decode_item(raw) for raw in raw_items]
+
+def decode_tag_counts(raw):
+    """
+    { normalized species: count } of a wire-format item, without building a record.
+    """
+    return {normalize_species(name): count for name, count in decode_tags(raw.get("tags"))}
@@ -0,0 +1,105 @@
+import math
+import os
+import queue
+import threading
+
+# Each segment should cover roughly this many bytes of the table (a few 1 MB scan pages)
+SEGMENT_TARGET_BYTES = int(os.environ.get("SCAN_SEGMENT_TARGET_BYTES", str(8 * 1024 * 1024)))
+MAX_SEGMENTS         = int(os.environ.get("SCAN_MAX_SEGMENTS", "16"))
+
+# describe_table results are cached for the lifetime of the warm container
+_table_size_cache = {}
+
+def choose_segment_count(table_size_bytes):
+    """
+    Pick TotalSegments from the table size: one segment per SEGMENT_TARGET_BYTES,
+    clamped to [1, MAX_SEGMENTS].
+    """
+    if not table_size_bytes or table_size_bytes <= 0:
+        return 1
+    return max(1, min(MAX_SEGMENTS, math.ceil(table_size_bytes / SEGMENT_TARGET_BYTES)))
+
+def table_size_bytes(client, table_name):
+    """
+    Approximate table size from DescribeTable (DynamoDB refreshes it about every 6 hours).
+    """
+    if table_name not in _table_size_cache:
+        try:
+            desc = client.describe_table(TableName=table_name)
+            _table_size_cache[table_name] = int(desc["Table"].get("TableSizeBytes", 0))
+        except Exception as e:
+            print(f"describe_table failed for {table_name}, using a single segment: {e}")
+            _table_size_cache[table_name] = 0
+    return _table_size_cache[table_name]
+
+def parallel_scan(client, table_name, total_segments=None, **scan_kwargs):
+    """
+    Generator over scan pages (lists of items) using DynamoDB parallel scan.
+
+    `client` is a boto3 DynamoDB client (clients are thread-safe; resources are not).
+    Every segment runs in its own thread and pages are yielded as soon as any
+    segment returns them, so callers can match items while other segments are
+    still being read. Extra keyword arguments (FilterExpression, ProjectionExpression,
+    ...) are passed through to every scan call.
+    """
+    if total_segments is None:
+        total_segments = choose_segment_count(table_size_bytes(client, table_name))
+
+    if total_segments <= 1:
+        yield from _scan_segment_pages(client, table_name, None, None, scan_kwargs)
+        return
+
+    pages = queue.Queue(maxsize=total_segments * 2)
+    stop = threading.Event()
+    done_marker = object()
+
+    def worker(segment):
+        try:
+            for page in _scan_segment_pages(client, table_name, segment, total_segments, scan_kwargs):
+                if stop.is_set():
+                    return
+                pages.put(page)
+        except Exception as e:
+            pages.put(e)
+        finally:
+            pages.put(done_marker)
+
+    threads = [
+        threading.Thread(target=worker, args=(segment,), daemon=True)
+        for segment in range(total_segments)
+    ]
+    for t in threads:
+        t.start()
+
+    try:
+        remaining = total_segments
+        while remaining:
+            page = pages.get()
+            if page is done_marker:
+                remaining -= 1
+            elif isinstance(page, Exception):
+                raise page
+            else:
+                yield page
+    finally:
+        # Consumer stopped early or failed: let workers drain out
+        stop.set()
+        while any(t.is_alive() for t in threads):
+            try:
+                pages.get(timeout=0.05)
+            except queue.Empty:
+                pass
+
+def _scan_segment_pages(client, table_name, segment, total_segments, scan_kwargs):
+    kwargs = dict(scan_kwargs, TableName=table_name)
+    if total_segments is not None:
+        kwargs["Segment"] = segment
+        kwargs["TotalSegments"] = total_segments
+
+    while True:
+        resp = client.scan(**kwargs)
+        yield resp.get("Items", [])
+        last_evaluated_key = resp.get("LastEvaluatedKey")
+        if not last_evaluated_key:
+            return
+        kwargs["ExclusiveStartKey"] = last_evaluated_key
@@ -0,0 +1,172 @@
+import zlib
+from bisect import bisect_left
+from botocore.exceptions import ClientError
+
+VOCABULARY_MAGIC  = b"birdtag-vocabulary-v1"
+MAX_SAVE_ATTEMPTS = 5
+
+class _Node:
+    """
+    Trie node over words[lo:hi], the sorted names sharing its `depth`-character
+    prefix. Children are materialized on first visit, so loading a vocabulary
+    costs no more than splitting it into a list.
+    """
+    __slots__ = ("lo", "hi", "depth", "word", "_children")
+
+    def __init__(self, words, lo, hi, depth):
+        self.lo        = lo
+        self.hi        = hi
+        self.depth     = depth
+        self.word      = words[lo] if len(words[lo]) == depth else None
+        self._children = None
+
+    def children(self, words):
+        if self._children is None:
+            children = {}
+            i = self.lo + (self.word is not None)
+            while i < self.hi:
+                prefix = words[i][:self.depth + 1]
+                # First name past every name starting with `prefix`
+                end = bisect_left(words, prefix[:-1] + chr(ord(prefix[-1]) + 1), i, self.hi)
+                children[prefix[-1]] = _Node(words, i, end, self.depth + 1)
+                i = end
+            self._children = children
+        return self._children
+
+class SpeciesTrie:
+    """
+    Every species name ever written as a tag, for prefix and typo-tolerant
+    (edit distance 1) autocomplete. Names are stored normalized (strip + lower)
+    like everywhere else in the query path.
+    """
+
+    def __init__(self, names=(), normalized=False):
+        # `normalized`: names are already unique, normalized and sorted (a loaded artifact)
+        if not normalized:
+            names = sorted({str(n).strip().lower() for n in names if str(n or "").strip()})
+        self.words = list(names)
+        self.size  = len(self.words)
+        self.root  = _Node(self.words, 0, self.size, 0) if self.words else None
+
+    def __contains__(self, name):
+        name = str(name or "").strip().lower()
+        i = bisect_left(self.words, name)
+        return i < self.size and self.words[i] == name
+
+    def complete(self, prefix, limit=10):
+        """
+        Names starting with `prefix`, alphabetically.
+        """
+        node = self._find(prefix)
+        return self.words[node.lo:min(node.hi, node.lo + limit)] if node is not None else []
+
+    def fuzzy_complete(self, prefix, limit=10):
+        """
+        Names starting with something within one edit (substitution, insertion,
+        deletion or adjacent transposition) of `prefix`, alphabetically.
+        """
+        if self.root is None:
+            return []
+        nodes = {}
+        self._fuzzy(self.root, prefix, 0, 1, nodes)
+        words = set()
+        for node in nodes.values():
+            words.update(self.words[node.lo:min(node.hi, node.lo + limit)])
+        return sorted(words)[:limit]
+
+    def _find(self, prefix):
+        node = self.root
+        for ch in prefix:
+            if node is None:
+                return None
+            node = node.children(self.words).get(ch)
+        return node
+
+    def _fuzzy(self, node, prefix, i, edits, out):
+        # Collects every node whose path matches prefix with at most `edits` edits
+        if i == len(prefix):
+            out[node.lo, node.depth] = node
+            return
+        children = node.children(self.words)
+        ch = prefix[i]
+        child = children.get(ch)
+        if child is not None:
+            self._fuzzy(child, prefix, i + 1, edits, out)
+        if not edits:
+            return
+        # Deletion: the user typed an extra character
+        self._fuzzy(node, prefix, i + 1, edits - 1, out)
+        for c, other in children.items():
+            # Insertion: the user skipped `c`
+            self._fuzzy(other, prefix, i, edits - 1, out)
+            if c != ch:
+                # Substitution
+                self._fuzzy(other, prefix, i + 1, edits - 1, out)
+        # Transposition of prefix[i] and prefix[i + 1]
+        if i + 1 < len(prefix) and prefix[i + 1] != ch:
+            swapped = children.get(prefix[i + 1])
+            if swapped is not None:
+                twice = swapped.children(self.words).get(ch)
+                if twice is not None:
+                    self._fuzzy(twice, prefix, i + 2, edits - 1, out)
+
+    def dumps(self):
+        return dumps_vocabulary(self.words)
+
+    @classmethod
+    def loads(cls, blob):
+        return cls(loads_vocabulary(blob), normalized=True)
+
+def dumps_vocabulary(names):
+    """
+    Compact persisted form: zlib-compressed, newline-separated, sorted names.
+    Sorted names share long prefixes, which zlib folds away.
+    """
+    body = "\n".join(sorted({str(n).strip().lower() for n in names if str(n).strip()}))
+    return zlib.compress(VOCABULARY_MAGIC + b"\n" + body.encode("utf-8"), 9)
+
+def loads_vocabulary(blob):
+    raw = zlib.decompress(blob)
+    magic, _, body = raw.partition(b"\n")
+    if magic != VOCABULARY_MAGIC:
+        raise ValueError("Not a species vocabulary")
+    return body.decode("utf-8").split("\n") if body else []
+
+def merge_vocabulary(s3_client, bucket, key, names):
+    """
+    Add `names` to the vocabulary object in S3. Nothing is written when every
+    name is already known; concurrent writers are handled with conditional puts.
+    Returns the number of names added.
+    """
+    for attempt in range(MAX_SAVE_ATTEMPTS):
+        try:
+            obj = s3_client.get_object(Bucket=bucket, Key=key)
+            known, etag = set(loads_vocabulary(obj["Body"].read())), obj["ETag"]
+        except ClientError as e:
+            if e.response["Error"]["Code"] not in ("NoSuchKey", "404"):
+                raise
+            known, etag = set(), None
+
+        added = {str(n).strip().lower() for n in names if str(n or "").strip()} - known
+        if not added:
+            return 0
+
+        put_kwargs = {
+            "Bucket": bucket,
+            "Key": key,
+            "Body": dumps_vocabulary(known | added),
+            "ContentType": "application/octet-stream"
+        }
+        if etag:
+            put_kwargs["IfMatch"] = etag
+        else:
+            put_kwargs["IfNoneMatch"] = "*"
+        try:
+            s3_client.put_object(**put_kwargs)
+            return len(added)
+        except ClientError as e:
+            if e.response["Error"]["Code"] not in ("PreconditionFailed", "ConditionalRequestConflict"):
+                raise
+        print(f"Species vocabulary changed concurrently, retrying ({attempt + 1}/{MAX_SAVE_ATTEMPTS})")
+
+    raise RuntimeError("Could not update species vocabulary after concurrent modifications")
@@ -0,0 +1,90 @@
+# The aggregate counters live in one item, so /stats is a single GetItem
+TAG_STATS_KEY = "totals"
+# Clauses per UpdateExpression; keeps expressions well under DynamoDB's 4KB limit
+MAX_CLAUSES = 100
+
+def stats_delta(media_type, old_tags, new_tags, file_added=False, file_removed=False):
+    """
+    Counter changes caused by one file's tag write.
+    old_tags / new_tags: { normalized species: count } before and after.
+
+    Counters are top-level number attributes (ADD can't target nested paths):
+      files, files#<type>                  - tagged files
+      speciesFiles#<species>               - files tagged with the species
+      detections#<species>                 - sum of the species' counts
+      typeDetections#<type>                - sum of all counts per media type
+    """
+    delta = {}
+
+    def add(attr, n):
+        if n:
+            delta[attr] = delta.get(attr, 0) + n
+
+    media_type = (media_type or "unknown").lower()
+    files = int(file_added) - int(file_removed)
+    add("files", files)
+    add(f"files#{media_type}", files)
+    for species in set(old_tags) | set(new_tags):
+        add(f"speciesFiles#{species}", int(species in new_tags) - int(species in old_tags))
+        add(f"detections#{species}", new_tags.get(species, 0) - old_tags.get(species, 0))
+    add(f"typeDetections#{media_type}", sum(new_tags.values()) - sum(old_tags.values()))
+    return delta
+
+def apply_stats_delta(client, table_name, delta):
+    """
+    ADD `delta` to the counter item with the low-level client.
+    Each UpdateItem is atomic; large deltas (reconciliation) are split.
+    """
+    attrs = sorted(delta)
+    for i in range(0, len(attrs), MAX_CLAUSES):
+        chunk = attrs[i:i + MAX_CLAUSES]
+        client.update_item(
+            TableName=table_name,
+            Key={"stat": {"S": TAG_STATS_KEY}},
+            UpdateExpression="ADD " + ", ".join(f"#a{j} :v{j}" for j in range(len(chunk))),
+            ExpressionAttributeNames={f"#a{j}": attr for j, attr in enumerate(chunk)},
+            ExpressionAttributeValues={f":v{j}": {"N": str(delta[attr])} for j, attr in enumerate(chunk)}
+        )
+
+def decode_counters(raw):
+    """
+    Wire-format counter item -> { attribute: int } (key and non-counters dropped).
+    """
+    return {attr: int(value["N"]) for attr, value in (raw or {}).items() if "N" in value}
+
+def format_stats(raw):
+    """
+    Wire-format counter item -> /stats response body.
+    """
+    counters = decode_counters(raw)
+    files_by_type, detections_by_type, species = {}, {}, {}
+    for attr, value in counters.items():
+        kind, _, name = attr.partition("#")
+        if not name or value <= 0:
+            continue
+        if kind == "files":
+            files_by_type[name] = value
+        elif kind == "typeDetections":
+            detections_by_type[name] = value
+        elif kind == "speciesFiles":
+            species.setdefault(name, {"name": name, "files": 0, "detections": 0})["files"] = value
+        elif kind == "detections":
+            species.setdefault(name, {"name": name, "files": 0, "detections": 0})["detections"] = value
+
+    raw = raw or {}
+    last_upload = None
+    if "lastFileId" in raw:
+        last_upload = {
+            "fileId": raw["lastFileId"].get("S"),
+            "type": raw.get("lastType", {}).get("S"),
+            "taggedAt": raw.get("lastTaggedAt", {}).get("S")
+        }
+    return {
+        "files": {"total": counters.get("files", 0), "byType": files_by_type},
+        "detections": {"total": sum(detections_by_type.values()), "byType": detections_by_type},
+        "species": sorted(
+            (s for s in species.values() if s["files"] > 0),
+            key=lambda s: (-s["files"], s["name"])
+        ),
+        "lastUpload": last_upload
+    }
@@ -0,0 +1,167 @@
+from datetime import datetime, timezone
+from botocore.exceptions import ClientError
+from tag_stats import TAG_STATS_KEY, stats_delta
+
+# Item of the query meta table whose "generation" every tag writer bumps
+TAG_GENERATION_KEY = "tagGeneration"
+
+def generate_dynamodb_record(bucket, file_id, key, size, media_type, extension, tags, thumbnail_key=None, uploaded_at=None, image_hash=None):
+    item = {
+        "fileId": file_id,
+        "key": key,
+        "bucket": bucket,
+        "size": size,
+        "type": media_type,
+        "format": extension,
+        # species -> count, so /update-tags can SET / REMOVE one species at a time
+        "tags": tag_counts(tags)
+    }
+
+    if thumbnail_key:
+        item["thumbnailKey"] = thumbnail_key
+    # Perceptual hash written by generate_thumbnail, for query-by-file near-duplicates
+    if image_hash:
+        item["dHash"] = image_hash
+
+    # put_item replaces the upload-time record, so carry its timestamp over
+    # (older payloads don't have one; fall back to the tagging time)
+    if not uploaded_at:
+        now = datetime.now(timezone.utc)
+        uploaded_at = now.strftime("%Y-%m-%dT%H:%M:%S.") + f"{now.microsecond // 1000:03d}Z"
+    item["uploadedAt"] = uploaded_at
+
+    return item
+
+def normalize_species(name):
+    return str(name or "").strip().lower()
+
+def tag_counts(tags):
+    """
+    { normalized species: count } of tagger output ([{name, count}, ...]) or of a
+    stored "tags" attribute, which is a map since the tag migration and a list before.
+    """
+    if isinstance(tags, dict):
+        pairs = tags.items()
+    else:
+        pairs = ((t["name"], t["count"]) for t in tags or [])
+    counts = {}
+    for name, count in pairs:
+        name = normalize_species(name)
+        if name:
+            counts[name] = int(count)
+    return counts
+
+def write_tagging_record(table, record):
+    """
+    Store a generate_dynamodb_record item. Returns (the item before, or None;
+    the tags map now stored).
+
+    The detected species are SET into the existing tags map one by one, so
+    tags added through /update-tags while the model ran are kept. Items that
+    don't have a map yet (no upload-time record, or tags still list-shaped)
+    are written whole with put_item.
+    """
+    names = {"#tg": "tags"}
+    values = {":map": "M"}
+    sets = []
+    for i, (attr, value) in enumerate((a, v) for a, v in record.items() if a not in ("fileId", "tags")):
+        names[f"#a{i}"] = attr
+        values[f":a{i}"] = value
+        # The upload-time timestamp wins over the tagging-time fallback
+        sets.append(f"#a{i} = if_not_exists(#a{i}, :a{i})" if attr == "uploadedAt" else f"#a{i} = :a{i}")
+    for i, (species, count) in enumerate(record["tags"].items()):
+        names[f"#s{i}"] = species
+        values[f":s{i}"] = count
+        sets.append(f"#tg.#s{i} = :s{i}")
+
+    try:
+        response = table.update_item(
+            Key={"fileId": record["fileId"]},
+            UpdateExpression="SET " + ", ".join(sets),
+            ConditionExpression="attribute_type(#tg, :map)",
+            ExpressionAttributeNames=names,
+            ExpressionAttributeValues=values,
+            ReturnValues="ALL_OLD"
+        )
+        old_item = response.get("Attributes")
+        return old_item, {**tag_counts((old_item or {}).get("tags")), **record["tags"]}
+    except ClientError as e:
+        if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+            raise
+    response = table.put_item(Item=record, ReturnValues="ALL_OLD")
+    return response.get("Attributes"), record["tags"]
+
+def species_count_key(count, file_id):
+    # Zero-padded so lexicographic order of the sort key matches numeric order of count
+    return f"{int(count):06d}#{file_id}"
+
+def species_index_changes(file_id, old_map, new_map):
+    """
+    Species index items to delete (their keys) and to put for a change from
+    one { normalized species: count } map to another. Only the (species,
+    count) pairs that actually changed are touched.
+    """
+    deletes = [
+        {"species": name, "countKey": species_count_key(count, file_id)}
+        for name, count in old_map.items()
+        if name and new_map.get(name) != count
+    ]
+    puts = [
+        {"species": name, "countKey": species_count_key(count, file_id), "fileId": file_id, "count": count}
+        for name, count in new_map.items()
+        if name and old_map.get(name) != count
+    ]
+    return deletes, puts
+
+def sync_species_index(index_table, file_id, old_tags, new_tags):
+    """
+    Keep the species -> fileId index table in step with a tag write.
+    old_tags / new_tags: any shape tag_counts reads.
+    """
+    deletes, puts = species_index_changes(file_id, tag_counts(old_tags), tag_counts(new_tags))
+    with index_table.batch_writer() as batch:
+        for key in deletes:
+            batch.delete_item(Key=key)
+        for item in puts:
+            batch.put_item(Item=item)
+
+def bump_tag_generation(meta_table):
+    """
+    Increment the tag-write generation so warm query containers drop cached results.
+    """
+    meta_table.update_item(
+        Key={"name": TAG_GENERATION_KEY},
+        UpdateExpression="ADD #g :one",
+        ExpressionAttributeNames={"#g": "generation"},
+        ExpressionAttributeValues={":one": 1}
+    )
+
+def update_tag_stats(stats_table, file_id, media_type, old_tags, new_tags, file_added=False):
+    """
+    ADD one file's tag change to the aggregate counters behind the query Lambda's
+    /stats, and record it as the latest upload, in a single atomic UpdateItem.
+    """
+    media_type = (media_type or "unknown").lower()
+    delta = stats_delta(media_type, tag_counts(old_tags), tag_counts(new_tags), file_added=file_added)
+
+    names = {"#lf": "lastFileId", "#lt": "lastType", "#la": "lastTaggedAt"}
+    values = {
+        ":lf": file_id,
+        ":lt": media_type,
+        ":la": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+    }
+    adds = []
+    for i, (attr, n) in enumerate(sorted(delta.items())):
+        names[f"#a{i}"] = attr
+        values[f":v{i}"] = n
+        adds.append(f"#a{i} :v{i}")
+
+    expression = "SET #lf = :lf, #lt = :lt, #la = :la"
+    if adds:
+        expression += " ADD " + ", ".join(adds)
+    stats_table.update_item(
+        Key={"stat": TAG_STATS_KEY},
+        UpdateExpression=expression,
+        ExpressionAttributeNames=names,
+        ExpressionAttributeValues=values
+    )
@@ -3,10 +3,18 @@ import boto3
 import os
 import soundfile as sf
 import tempfile
-from detect_audio_wrapper import run_audio_tagging
-from utils import generate_dynamodb_record
+from detect_audio_wrapper import audio_label_names, run_audio_tagging
+from species_vocabulary import merge_vocabulary
+from tagging_records import bump_tag_generation, generate_dynamodb_record, sync_species_index, update_tag_stats, write_tagging_record
 
 TABLE_NAME = os.environ.get("TABLE_NAME", "FileMetadata")
+SPECIES_INDEX_TABLE = os.environ.get("SPECIES_INDEX_TABLE", "BirdSpeciesIndex")
+QUERY_META_TABLE = os.environ.get("QUERY_META_TABLE", "BirdQueryMeta")
+TAG_STATS_TABLE = os.environ.get("TAG_STATS_TABLE", "BirdTagStats")
+# Species vocabulary artifact for /species/suggest; the bucket defaults to the uploaded file's bucket
+VOCABULARY_BUCKET = os.environ.get("VOCABULARY_BUCKET", "")
+VOCABULARY_KEY = os.environ.get("VOCABULARY_KEY", "indexes/species_vocabulary.txt.z")
+_vocabulary_published = False
 REGION = os.environ.get("REGION", "ap-southeast-2")
 print(f"Using DynamoDB table: {TABLE_NAME} in region: {REGION}")
 dynamodb = boto3.resource("dynamodb", region_name=REGION)
@@ -60,14 +68,39 @@ def lambda_handler(event, context):
             size=size,
             media_type=media_type,
             extension=extension,
-            tags=tags
+            tags=tags,
+            uploaded_at=event.get("uploadedAt")
         )
         print("DynamoDB record to insert:", json.dumps(record, indent=2))
 
-        # dynamodb.put_item(TableName=TABLE_NAME, Item=record)
         table = dynamodb.Table(TABLE_NAME)
-        response = table.put_item(Item=record)
-        print(f"Record successfully inserted into DynamoDB. Response: {response}")
+        old_item, stored_tags = write_tagging_record(table, record)
+        print(f"Record successfully written to DynamoDB. Tags now: {stored_tags}")
+        old_tags = (old_item or {}).get("tags")
+
+        # Update species index with the tag changes
+        if SPECIES_INDEX_TABLE:
+            sync_species_index(dynamodb.Table(SPECIES_INDEX_TABLE), file_id, old_tags, stored_tags)
+            print(f"Species index {SPECIES_INDEX_TABLE} updated for {file_id}")
+
+        # Count the change towards the /stats totals. lambda_upload counts the file
+        # when it creates the record; only a record created here is a new file.
+        if TAG_STATS_TABLE:
+            update_tag_stats(
+                dynamodb.Table(TAG_STATS_TABLE),
+                file_id,
+                media_type,
+                old_tags,
+                stored_tags,
+                file_added=old_item is None
+            )
+
+        # Invalidate cached query results
+        if QUERY_META_TABLE:
+            bump_tag_generation(dynamodb.Table(QUERY_META_TABLE))
+
+        # Make every name this model can emit searchable by /species/suggest
+        publish_species_vocabulary(s3, VOCABULARY_BUCKET or bucket)
 
         print("Publishing SNS message ... ")
         # Publish to SNS
@@ -94,7 +127,7 @@ def lambda_handler(event, context):
             "size": size,
             "media_type": media_type,
             "format": extension,
-            "tags": tags
+            "tags": stored_tags
         }
 
         sns_client.publish(
@@ -121,3 +154,17 @@ def lambda_handler(event, context):
             os.remove(local_path)
             print(f"file removed: {local_path}")
 
+def publish_species_vocabulary(s3, bucket):
+    """
+    Merge the model's label names into the species vocabulary, once per container.
+    Failures are logged only; tagging results don't depend on the vocabulary.
+    """
+    global _vocabulary_published
+    if _vocabulary_published or not VOCABULARY_KEY:
+        return
+    try:
+        added = merge_vocabulary(s3, bucket, VOCABULARY_KEY, audio_label_names())
+        print(f"Species vocabulary s3://{bucket}/{VOCABULARY_KEY}: {added} names added")
+        _vocabulary_published = True
+    except Exception as e:
+        print(f"Could not update species vocabulary: {e}")
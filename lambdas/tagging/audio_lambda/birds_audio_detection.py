@@ -67,6 +67,15 @@ def download_audio_model_files_from_s3():
     _AUDIO_MODEL_FILES_DOWNLOADED = True
     print("[Audio] All model files downloaded successfully.")
 
+def label_names():
+    """
+    Every common name BirdNET can emit as a tag, derived from the translated
+    labels ("<Scientific name>_<Common name>") the same way analyze_file does.
+    """
+    download_audio_model_files_from_s3()
+    with open(LOCAL_TRANSLATED_LABELS_PATH, "r", encoding="utf-8") as f:
+        return [line.strip().split("_", 1)[-1].lower() for line in f if line.strip()]
+
 def run_audio_prediction(file_path: str):
 
     # Ensure model files are downloaded and loaded once
@@ -1,6 +1,6 @@
 import os
 # from birdnet_audio_wrapper import run_audio_prediction
-from birds_audio_detection import run_audio_prediction
+from birds_audio_detection import label_names, run_audio_prediction
 
 def run_audio_tagging(file_path: str, media_type: str):
     """
@@ -13,3 +13,9 @@ def run_audio_tagging(file_path: str, media_type: str):
         raise ValueError(f"Unsupported media type: {media_type}")
 
     return tags
+
+def audio_label_names():
+    """
+    Tag names the audio model can produce, for the species vocabulary.
+    """
+    return label_names()
@@ -2,11 +2,16 @@ import json
 import os
 import soundfile as sf
 import tempfile
-import tempfile
 import base64
+import binascii
 import mimetypes
+from contextlib import contextmanager
+import boto3
 from detect_audio_wrapper import run_audio_tagging
 
+REGION = os.environ.get("REGION", "ap-southeast-2")
+s3_client = boto3.client("s3", region_name=REGION)
+
 # custom setup for mimetypes
 mimetypes.add_type("audio/mp3", ".mp3")
 mimetypes.add_type("audio/wav", ".wav")
@@ -14,112 +19,150 @@ mimetypes.add_type("audio/wav", ".wav")
 
 # lambda handler for audio query tagging
 def lambda_handler(event, context):
-    media_type = None
-    temp_file_path = None
-
     try:
-        print("Event received:", json.dumps(event, indent=2))
-
-        # 1. Get Base64 encoded file data from the request body
-        if "body" not in event or not event.get("isBase64Encoded", False):
-            return {
-                "statusCode": 400,
-                "headers": {"Content-Type": "application/json"},
-                "body": json.dumps({"error": "Invalid request: Expected base64 encoded body."})
-            }
-        
-        base64_data = event["body"]
-        print("DEBUG: First 100 chars of base64_data: ", base64_data[:100])
-        first_decoded_data = base64.b64decode(base64_data)
-        print("DEBUG: First 100 chars of first_decoded_data: ", first_decoded_data[:100])
-        original_base64_string = first_decoded_data.decode('utf-8')
-        print("DEBUG: First 100 chars of original_base64_string: ", original_base64_string[:100])
-        decoded_data = base64.b64decode(original_base64_string)
-        print("DEBUG: First 20 bytes of decoded_data (hex): ", decoded_data[:100])
-        print("File decoded successfully.")
-
-        # 2. Determine media type from Content-Type header
-        content_type = event.get("headers", {}).get("Content-Type", "").lower()
-        if not content_type:
-            return {
-                "statusCode": 400,
-                "headers": {"Content-Type": "application/json"},
-                "body": json.dumps({"error": "Content-Type header is missing."})
-            }
-
-        # Get media type from content type
-        if "audio" in content_type:
-            media_type = "audio"
-        else:
-            return {
-                "statusCode": 400,
-                "headers": {"Content-Type": "application/json"},
-                "body": json.dumps({"error": f"Unsupported media type: {content_type}"})
-            }
-        
-        # Map content type to file extension
-        extension = mimetypes.guess_extension(content_type)
-        if not extension:
-            return {
-                "statusCode": 400,
-                "headers": {"Content-Type": "application/json"},
-                "body": json.dumps({"error": f"Unsupported Content-Type: {content_type}"})
-            }
-        
-        # 3. Write the decode file to a temporary file
-        temp_dir = os.path.join(tempfile.gettempdir(), "file")
-        os.makedirs(temp_dir, exist_ok=True)
-        with tempfile.NamedTemporaryFile(delete=False, suffix=extension, dir=temp_dir) as temp_file:
-            temp_file.write(decoded_data)
-            temp_file_path = temp_file.name
-        print(f"File saved to temporary path: {temp_file_path}")
+        print("Event received:", json.dumps(event, indent=2)[:2000])
+        content_type = event.get("headers", {}).get("Content-Type", "")
 
-        # --- ADD THESE LINES TO CHECK FOR FILE EXISTENCE ---
-        if os.path.exists(temp_file_path):
-            print(f"DEBUG: File '{temp_file_path}' exists on filesystem.")
+        if "s3" in event:
+            # Long recordings: uploaded to S3 first, streamed from there to local disk
+            result = tag_s3_object(event["s3"]["bucket"], event["s3"]["key"], content_type)
         else:
-            print(f"DEBUG: File '{temp_file_path}' DOES NOT exist on filesystem.")
-        # --- END ADDITION ---
-    
-
-
-        # Check if audio is readable
-        try:
-            info = sf.info(temp_file_path)
-            print("Audio file info:", info)
-        except Exception as e:
-            print("soundfile could not read audio:", str(e))
-
-        # Run tagging
-        print("Running audio tagging...")
-        result = run_audio_tagging(temp_file_path, media_type)
-        tags = result.get("tags", [])
-        print(f"Tags generated: {json.dumps(tags, indent=2)}")
-
-        if result.get("mediaType") == "":
-            return {
-                "statusCode": 400,
-                "headers": {"Content-Type": "application/json"},
-                "body": json.dumps({"error": "Failed to open media file"})
-            }
-
-        # 5. Return Result
+            # 1. Get the file bytes from the request body
+            decoded_data = decode_body(event)
+            print("File decoded successfully.")
+
+            # 2. Tag them according to the Content-Type header
+            result = tag_bytes(decoded_data, content_type)
+
+        # 3. Return Result
         return {
             "statusCode": 200,
             "headers": {"Content-Type": "application/json"},
             "body": json.dumps(result)
         }
 
+    except ValueError as e:
+        return {
+            "statusCode": 400,
+            "headers": {"Content-Type": "application/json"},
+            "body": json.dumps({"error": str(e)})
+        }
     except Exception as e:
         print("Error occurred:", str(e))
         return {
             "statusCode": 500,
             "body": json.dumps({"error": str(e)})
         }
+
+
+def decode_body(event):
+    """
+    File bytes of a /tag event, decoded as the request declares them:
+    API Gateway sets isBase64Encoded when it base64-encodes a binary body, and
+    a client that sends the file as base64 text says so with
+    "Content-Transfer-Encoding: base64". Raises ValueError for a missing,
+    undecodable or plain-text body.
+    """
+    if "body" not in event:
+        raise ValueError("Invalid request: Expected base64 encoded body.")
+    headers = {k.lower(): v for k, v in (event.get("headers") or {}).items()}
+    data = event["body"]
+    try:
+        if event.get("isBase64Encoded"):
+            data = base64.b64decode(data)
+        if headers.get("content-transfer-encoding", "").lower() == "base64":
+            data = base64.b64decode(data)
+    except binascii.Error:
+        raise ValueError("Invalid request: body is not valid base64.")
+    if isinstance(data, str):
+        raise ValueError("Invalid request: Expected base64 encoded body.")
+    return data
+
+
+def tag_bytes(data, content_type):
+    """
+    Run BirdNET on an audio file given as bytes.
+    Returns the run_audio_tagging result ({"mediaType", "tags", ...});
+    raises ValueError for a missing or unsupported Content-Type or an unreadable file.
+    Used by lambda_handler and, in process, by queryByFile.
+    """
+    media_type, extension = _media_type(content_type)
+    with _temp_path(extension) as temp_file_path:
+        with open(temp_file_path, "wb") as temp_file:
+            temp_file.write(data)
+        print(f"File saved to temporary path: {temp_file_path}")
+        return _tag(temp_file_path, media_type)
+
+
+def tag_s3_object(bucket, key, content_type):
+    """
+    Like tag_bytes for an object in S3, downloaded in parts straight to local
+    disk so the recording is never held in memory.
+    """
+    media_type, extension = _media_type(content_type)
+    with _temp_path(extension) as temp_file_path:
+        s3_client.download_file(bucket, key, temp_file_path)
+        print(f"Downloaded s3://{bucket}/{key} to {temp_file_path}")
+        return _tag(temp_file_path, media_type)
+
+
+def tag_file(path, content_type, on_progress=None):
+    """
+    Like tag_bytes for a file already on local disk.
+    BirdNET returns its detections only at the end, so on_progress (accepted
+    for the same interface as the visual tagger) is never called.
+    """
+    media_type, _ = _media_type(content_type)
+    return _tag(path, media_type)
+
+
+def _media_type(content_type):
+    # (media type, file extension) of a Content-Type; raises ValueError
+    content_type = (content_type or "").lower()
+    if not content_type:
+        raise ValueError("Content-Type header is missing.")
+
+    # Get media type from content type
+    if "audio" in content_type:
+        media_type = "audio"
+    else:
+        raise ValueError(f"Unsupported media type: {content_type}")
+
+    # Map content type to file extension
+    extension = mimetypes.guess_extension(content_type)
+    if not extension:
+        raise ValueError(f"Unsupported Content-Type: {content_type}")
+    return media_type, extension
+
+
+@contextmanager
+def _temp_path(extension):
+    temp_dir = os.path.join(tempfile.gettempdir(), "file")
+    os.makedirs(temp_dir, exist_ok=True)
+    with tempfile.NamedTemporaryFile(delete=False, suffix=extension, dir=temp_dir) as temp_file:
+        temp_file_path = temp_file.name
+    try:
+        yield temp_file_path
     finally:
         # Optional cleanup
-        if temp_file_path and os.path.exists(temp_file_path):
+        if os.path.exists(temp_file_path):
             os.remove(temp_file_path)
-            print(f"{media_type} file removed: {temp_file_path}")
+            print(f"File removed: {temp_file_path}")
+
+
+def _tag(path, media_type):
+    # Check if audio is readable
+    try:
+        info = sf.info(path)
+        print("Audio file info:", info)
+    except Exception as e:
+        print("soundfile could not read audio:", str(e))
 
+    # Run tagging
+    print("Running audio tagging...")
+    result = run_audio_tagging(path, media_type)
+    print(f"Tags generated: {json.dumps(result.get('tags', []), indent=2)}")
 
+    if result.get("mediaType") == "":
+        raise ValueError("Failed to open media file")
+    return result
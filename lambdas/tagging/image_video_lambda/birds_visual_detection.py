@@ -61,6 +61,14 @@ except Exception as e:
     raise
 
 
+def label_names():
+    """
+    Every class name the loaded YOLO model can emit as a tag.
+    """
+    names = GLOBAL_MODEL.names
+    return list(names.values()) if isinstance(names, dict) else list(names)
+
+
 def image_prediction(image_path, result_filename=None, save_dir="./image_prediction_results", confidence=0.5):
     """p
     Function to display predictions of a pre-trained YOLO model on a given image.
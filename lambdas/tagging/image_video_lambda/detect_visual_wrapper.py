@@ -1,5 +1,5 @@
 import os
-from birds_visual_detection import image_prediction, video_prediction
+from birds_visual_detection import image_prediction, label_names, video_prediction
 
 def run_visual_tagging(file_path: str, media_type: str):
     """
@@ -20,3 +20,9 @@ def run_visual_tagging(file_path: str, media_type: str):
         raise ValueError(f"Unsupported media type: {media_type}")
 
     return tags
+
+def visual_label_names():
+    """
+    Tag names the visual model can produce, for the species vocabulary.
+    """
+    return label_names()
@@ -133,7 +133,8 @@ def image_prediction(image_path, result_filename=None, save_dir="./image_predict
     return result_prediction
 
 # # ## Video Detection
-def video_prediction(video_path, result_filename=None, save_dir = "./video_prediction_results", confidence=0.5, frame_skip=24):
+def video_prediction(video_path, result_filename=None, save_dir = "./video_prediction_results", confidence=0.5, frame_skip=24,
+                     on_progress=None, progress_every=10):
     """
     Function to make predictions on video frames using a trained YOLO model and display the video with annotations.
 
@@ -141,6 +142,8 @@ def video_prediction(video_path, result_filename=None, save_dir = "./video_predi
         video_path (str): Path to the video file.
         save_video (bool): If True, saves the video with annotations. Default is False.
         filename (str): The name of the output file where the video will be saved if save_video is True.
+        on_progress (callable): Optional; called every `progress_every` analysed frames with
+            (frames read, total frames, tags so far) so long videos can report partial tags.
     """
     ENV = os.getenv("ENV", "prod").lower()
     save_annotated = ENV == "dev"
@@ -184,6 +187,8 @@ def video_prediction(video_path, result_filename=None, save_dir = "./video_predi
 
     tag_max_counts = {}
     frame_count = 0
+    analysed_frames = 0
+    total_frames = int(cap.get(cv.CAP_PROP_FRAME_COUNT))
 
     while True:
         ret, frame = cap.read()
@@ -219,6 +224,10 @@ def video_prediction(video_path, result_filename=None, save_dir = "./video_predi
                 for label, count in frame_label_counter.items():
                     tag_max_counts[label] = max(tag_max_counts.get(label, 0), count)
 
+            analysed_frames += 1
+            if on_progress and analysed_frames % progress_every == 0:
+                on_progress(frame_count + 1, total_frames, [{"name": name, "count": count} for name, count in tag_max_counts.items()])
+
         elif save_annotated and out_writer:
             out_writer.write(frame)
 
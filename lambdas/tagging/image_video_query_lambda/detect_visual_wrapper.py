@@ -1,10 +1,11 @@
 import os
 from birds_visual_detection import image_prediction, video_prediction
 
-def run_visual_tagging(file_path: str, media_type: str):
+def run_visual_tagging(file_path: str, media_type: str, on_progress=None):
     """
     file_path: path to the downloaded file from S3
     media_type: one of 'image' or 'video'
+    on_progress: optional callback for partial video tags (see video_prediction)
     """
 
     base_name = os.path.basename(file_path)
@@ -15,7 +16,7 @@ def run_visual_tagging(file_path: str, media_type: str):
     if media_type == "image":
         tags = image_prediction(file_path, result_filename=f"{result_filename}{extension}")
     elif media_type == "video":
-        tags = video_prediction(file_path, result_filename=result_filename, frame_skip=24)
+        tags = video_prediction(file_path, result_filename=result_filename, frame_skip=24, on_progress=on_progress)
     else:
         raise ValueError(f"Unsupported media type: {media_type}")
 
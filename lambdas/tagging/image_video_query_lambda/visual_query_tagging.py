@@ -2,102 +2,152 @@ import json
 import os
 import tempfile
 import base64
+import binascii
 import mimetypes
+from contextlib import contextmanager
+import boto3
 from detect_visual_wrapper import run_visual_tagging
 
-# custom setup for mimetypes 
+REGION = os.environ.get("REGION", "ap-southeast-2")
+s3_client = boto3.client("s3", region_name=REGION)
+
+# custom setup for mimetypes
 mimetypes.add_type("video/x-msvideo", ".avi")
 mimetypes.add_type("video/avi", ".avi")
 mimetypes.add_type("video/msvideo", ".avi")
 
 # lambda handler for visual (image/video) query tagging
 def lambda_handler(event, context):
-    media_type = None
-    temp_file = None
-
     try:
-        print("Event received:", json.dumps(event, indent=2))
-
-        # 1. Get Base64 encoded file data from the request body
-        if "body" not in event or not event.get("isBase64Encoded", False):
-            return {
-                "statusCode": 400,
-                "headers": {"Content-Type": "application/json"},
-                "body": json.dumps({"error": "Invalid request: Expected base64 encoded body."})
-            }
-        
-        base64_data = event["body"]
-        first_decoded_data = base64.b64decode(base64_data)
-        original_base64_string = first_decoded_data.decode('utf-8')
-        decoded_data = base64.b64decode(original_base64_string)
-        print("File decoded successfully.")
-
-        # 2. Determine media type from Content-Type header
-        content_type = event.get("headers", {}).get("Content-Type", "").lower()
-        if not content_type:
-            return {
-                "statusCode": 400,
-                "headers": {"Content-Type": "application/json"},
-                "body": json.dumps({"error": "Content-Type header is missing."})
-            }
-
-        # Get media type from content type
-        if "image" in content_type:
-            media_type = "image"
-        elif "video" in content_type:
-            media_type = "video"
-        else:
-            return {
-                "statusCode": 400,
-                "headers": {"Content-Type": "application/json"},
-                "body": json.dumps({"error": f"Unsupported media type: {content_type}"})
-            }
-        
-        # Map content type to file extension
-        extension = mimetypes.guess_extension(content_type)
-        if not extension:
-            return {
-                "statusCode": 400,
-                "headers": {"Content-Type": "application/json"},
-                "body": json.dumps({"error": f"Unsupported Content-Type: {content_type}"})
-            }
-        
-        # 3. Write the decode file to a temporary file
-        temp_dir = os.path.join(tempfile.gettempdir(), "file")
-        os.makedirs(temp_dir, exist_ok=True)
-        with tempfile.NamedTemporaryFile(delete=False, suffix=extension, dir=temp_dir) as temp_file:
-            temp_file.write(decoded_data)
-            temp_file_path = temp_file.name
-        print(f"File saved to temporary path: {temp_file_path}")
+        print("Event received:", json.dumps(event, indent=2)[:2000])
+        content_type = event.get("headers", {}).get("Content-Type", "")
 
-        # 4. Run tagging
-        print("Running visual query tagging...")
-        result = run_visual_tagging(temp_file_path, media_type)
-        tags = result.get("tags", [])
-        print(f"Tags generated: {json.dumps(tags, indent=2)}")
+        if "s3" in event:
+            # Large media: uploaded to S3 first, streamed from there to local disk
+            result = tag_s3_object(event["s3"]["bucket"], event["s3"]["key"], content_type)
+        else:
+            # 1. Get the file bytes from the request body
+            decoded_data = decode_body(event)
+            print("File decoded successfully.")
 
-        if result.get("mediaType") == "":
-            return {
-                "statusCode": 400,
-                "headers": {"Content-Type": "application/json"},
-                "body": json.dumps({"error": "Failed to open media file"})
-            }
+            # 2. Tag them according to the Content-Type header
+            result = tag_bytes(decoded_data, content_type)
 
-        # 5. Return Result
+        # 3. Return Result
         return {
             "statusCode": 200,
             "headers": {"Content-Type": "application/json"},
             "body": json.dumps(result)
         }
 
+    except ValueError as e:
+        return {
+            "statusCode": 400,
+            "headers": {"Content-Type": "application/json"},
+            "body": json.dumps({"error": str(e)})
+        }
     except Exception as e:
         print("Error occurred:", str(e))
         return {
             "statusCode": 500,
             "body": json.dumps({"error": str(e)})
         }
+
+def decode_body(event):
+    """
+    File bytes of a /tag event, decoded as the request declares them:
+    API Gateway sets isBase64Encoded when it base64-encodes a binary body, and
+    a client that sends the file as base64 text says so with
+    "Content-Transfer-Encoding: base64". Raises ValueError for a missing,
+    undecodable or plain-text body.
+    """
+    if "body" not in event:
+        raise ValueError("Invalid request: Expected base64 encoded body.")
+    headers = {k.lower(): v for k, v in (event.get("headers") or {}).items()}
+    data = event["body"]
+    try:
+        if event.get("isBase64Encoded"):
+            data = base64.b64decode(data)
+        if headers.get("content-transfer-encoding", "").lower() == "base64":
+            data = base64.b64decode(data)
+    except binascii.Error:
+        raise ValueError("Invalid request: body is not valid base64.")
+    if isinstance(data, str):
+        raise ValueError("Invalid request: Expected base64 encoded body.")
+    return data
+
+def tag_bytes(data, content_type):
+    """
+    Run YOLO on an image or video given as bytes.
+    Returns the run_visual_tagging result ({"mediaType", "tags", ...});
+    raises ValueError for a missing or unsupported Content-Type or an unreadable file.
+    Used by lambda_handler and, in process, by queryByFile.
+    """
+    media_type, extension = _media_type(content_type)
+    with _temp_path(extension) as temp_file_path:
+        with open(temp_file_path, "wb") as temp_file:
+            temp_file.write(data)
+        print(f"File saved to temporary path: {temp_file_path}")
+        return _tag(temp_file_path, media_type)
+
+def tag_s3_object(bucket, key, content_type):
+    """
+    Like tag_bytes for an object in S3, downloaded in parts straight to local
+    disk so the file is never held in memory.
+    """
+    media_type, extension = _media_type(content_type)
+    with _temp_path(extension) as temp_file_path:
+        s3_client.download_file(bucket, key, temp_file_path)
+        print(f"Downloaded s3://{bucket}/{key} to {temp_file_path}")
+        return _tag(temp_file_path, media_type)
+
+def tag_file(path, content_type, on_progress=None):
+    """
+    Like tag_bytes for a file already on local disk.
+    on_progress(frames read, total frames, tags so far) is called periodically for videos.
+    """
+    media_type, _ = _media_type(content_type)
+    return _tag(path, media_type, on_progress)
+
+def _media_type(content_type):
+    # (media type, file extension) of a Content-Type; raises ValueError
+    content_type = (content_type or "").lower()
+    if not content_type:
+        raise ValueError("Content-Type header is missing.")
+
+    # Get media type from content type
+    if "image" in content_type:
+        media_type = "image"
+    elif "video" in content_type:
+        media_type = "video"
+    else:
+        raise ValueError(f"Unsupported media type: {content_type}")
+
+    # Map content type to file extension
+    extension = mimetypes.guess_extension(content_type)
+    if not extension:
+        raise ValueError(f"Unsupported Content-Type: {content_type}")
+    return media_type, extension
+
+@contextmanager
+def _temp_path(extension):
+    temp_dir = os.path.join(tempfile.gettempdir(), "file")
+    os.makedirs(temp_dir, exist_ok=True)
+    with tempfile.NamedTemporaryFile(delete=False, suffix=extension, dir=temp_dir) as temp_file:
+        temp_file_path = temp_file.name
+    try:
+        yield temp_file_path
     finally:
         # Optional cleanup
-        if temp_file_path and os.path.exists(temp_file_path):
+        if os.path.exists(temp_file_path):
             os.remove(temp_file_path)
-            print(f"{media_type} file removed: {temp_file_path}")
+            print(f"File removed: {temp_file_path}")
+
+def _tag(path, media_type, on_progress=None):
+    print("Running visual query tagging...")
+    result = run_visual_tagging(path, media_type, on_progress)
+    print(f"Tags generated: {json.dumps(result.get('tags', []), indent=2)}")
+
+    if result.get("mediaType") == "":
+        raise ValueError("Failed to open media file")
+    return result
@@ -0,0 +1,175 @@
+"""
+/query and /find must return the same matches whichever read path answers
+them: table scan, species index table (with the cardinality planner) or
+species bitmap index, and paging with limit/cursor must visit every match
+exactly once. The table is an in-memory fake, so no AWS access is needed.
+
+    python -m pytest tests
+"""
+import json
+import os
+import random
+import sys
+
+import pytest
+
+pytest.importorskip("boto3")
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [os.path.join(ROOT, "lambdas", "query"), os.path.join(ROOT, "lambdas", "shared")]
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+
+import query  # noqa: E402
+from parallel_scan import SEGMENT_TARGET_BYTES  # noqa: E402
+from species_bitmap import SpeciesBitmapIndex  # noqa: E402
+
+SPECIES = ["crow", "owl", "pigeon", "sparrow"]
+PAGE_SIZE = 4
+
+def _corpus(size=40, seed=7):
+    """
+    {fileId: {species: count}} plus the wire-format items: maps, old list-shaped
+    tags, and a few items without a tags attribute.
+    """
+    rng = random.Random(seed)
+    tags, items = {}, []
+    for i in range(size):
+        file_id = f"f{i:03d}"
+        counts = {name: rng.randint(1, 3) for name in rng.sample(SPECIES, rng.randint(0, 3))}
+        tags[file_id] = counts
+        item = {"fileId": {"S": file_id}, "type": {"S": "image"}, "key": {"S": f"images/{file_id}.jpg"}}
+        if i % 5 == 0:
+            item["tags"] = {"L": [
+                {"M": {"name": {"S": name}, "count": {"N": str(n)}}} for name, n in counts.items()
+            ]}
+        elif counts or i % 2:
+            item["tags"] = {"M": {name: {"N": str(n)} for name, n in counts.items()}}
+        items.append(item)
+    return tags, items
+
+TAGS, ITEMS = _corpus()
+
+class FakeMediaTable:
+    """
+    The DynamoDB client calls the query Lambda makes on BirdMediaTags: scans in
+    fileId order, PAGE_SIZE items per page, spread over 3 segments; pushed-down
+    filters are ignored (the Lambda's own matchers decide).
+    """
+
+    def __init__(self, items):
+        self.items = sorted(items, key=lambda item: item["fileId"]["S"])
+        self.by_id = {item["fileId"]["S"]: item for item in self.items}
+
+    def describe_table(self, TableName):
+        return {"Table": {"TableSizeBytes": 3 * SEGMENT_TARGET_BYTES}}
+
+    def scan(self, TableName, Segment=0, TotalSegments=1, ExclusiveStartKey=None, **kwargs):
+        items = self.items[Segment::TotalSegments]
+        if ExclusiveStartKey:
+            items = [item for item in items if item["fileId"]["S"] > ExclusiveStartKey["fileId"]["S"]]
+        resp = {"Items": items[:PAGE_SIZE]}
+        if len(items) > PAGE_SIZE:
+            resp["LastEvaluatedKey"] = {"fileId": items[PAGE_SIZE - 1]["fileId"]}
+        return resp
+
+    def batch_get_item(self, RequestItems):
+        (table_name, request), = RequestItems.items()
+        found = [self.by_id[key["fileId"]["S"]] for key in request["Keys"] if key["fileId"]["S"] in self.by_id]
+        return {"Responses": {table_name: found}}
+
+class FakeBitmapLoader:
+    etag = "bitmap"
+    metadata = {}
+
+    def __init__(self, index):
+        self.index = index
+
+    def get(self):
+        return self.index
+
+def _index_lookup(index):
+    # _index_lookup over an in-memory { species: { fileId: count } } index
+    def lookup(name, min_count=0):
+        return {fid for fid, n in index.get(name, {}).items() if n >= int(min_count)}
+    return lookup
+
+def _species_index(tags):
+    index = {}
+    for file_id, counts in tags.items():
+        for name, n in counts.items():
+            index.setdefault(name, {})[file_id] = n
+    return index
+
+@pytest.fixture(params=["scan", "index", "bitmap"])
+def read_path(request, monkeypatch):
+    monkeypatch.setattr(query, "dynamodb_client", FakeMediaTable(ITEMS))
+    monkeypatch.setattr(query, "meta_table", None)
+    monkeypatch.setattr(query, "index_table", None)
+    monkeypatch.setattr(query, "bitmap_loader", None)
+    monkeypatch.setattr(query, "bitmap_delta_loader", None)
+    if request.param == "index":
+        monkeypatch.setattr(query, "index_table", object())
+        monkeypatch.setattr(query, "_index_lookup", _index_lookup(_species_index(TAGS)))
+    elif request.param == "bitmap":
+        bitmap_index = SpeciesBitmapIndex()
+        for file_id, counts in TAGS.items():
+            bitmap_index.set_tags(file_id, {}, counts)
+        monkeypatch.setattr(query, "bitmap_loader", FakeBitmapLoader(bitmap_index))
+    return request.param
+
+def _call(handler, body):
+    resp = handler({"body": json.dumps(dict(body, links="none"))})
+    assert resp["statusCode"] == 200, resp["body"]
+    return json.loads(resp["body"])
+
+def _expected_query(filters):
+    return sorted(fid for fid, counts in TAGS.items() if all(counts.get(name, 0) >= n for name, n in filters))
+
+def _expected_find(names):
+    return sorted(fid for fid, counts in TAGS.items() if set(counts) & set(names))
+
+QUERIES = [[("crow", 1)], [("crow", 2), ("owl", 1)], [("pigeon", 3), ("sparrow", 1), ("owl", 1)], [("heron", 1)]]
+FINDS = [["crow"], ["owl", "sparrow"], ["heron"]]
+
+@pytest.mark.parametrize("filters", QUERIES)
+def test_query_matches_agree(read_path, filters):
+    body = _call(query.handle_query, {"species": [{"name": name, "count": n} for name, n in filters]})
+    assert sorted(result["id"] for result in body["results"]) == _expected_query(filters)
+
+@pytest.mark.parametrize("names", FINDS)
+def test_find_matches_agree(read_path, names):
+    body = _call(query.handle_find, {"species": [{"name": name} for name in names]})
+    assert sorted(result["id"] for result in body["results"]) == _expected_find(names)
+
+@pytest.mark.parametrize("limit", [1, 3, 50])
+def test_cursor_round_trip(read_path, limit):
+    filters = [("crow", 1)]
+    request = {"species": [{"name": name, "count": n} for name, n in filters], "limit": limit}
+    seen, pages = [], 0
+    while True:
+        body = _call(query.handle_query, request)
+        assert len(body["results"]) <= limit
+        seen.extend(result["id"] for result in body["results"])
+        pages += 1
+        if not body.get("nextCursor"):
+            break
+        request["cursor"] = body["nextCursor"]
+        assert pages <= len(ITEMS)
+    assert len(seen) == len(set(seen))
+    assert sorted(seen) == _expected_query(filters)
+
+def test_stale_index_entries_are_rechecked(monkeypatch):
+    # An index entry left behind by a failed sync must not come back as a match
+    stale = {fid: dict(counts) for fid, counts in TAGS.items()}
+    without_crow = next(fid for fid, counts in TAGS.items() if "crow" not in counts)
+    stale[without_crow]["crow"] = 3
+    monkeypatch.setattr(query, "dynamodb_client", FakeMediaTable(ITEMS))
+    monkeypatch.setattr(query, "meta_table", None)
+    monkeypatch.setattr(query, "bitmap_loader", None)
+    monkeypatch.setattr(query, "index_table", object())
+    monkeypatch.setattr(query, "_index_lookup", _index_lookup(_species_index(stale)))
+
+    body = _call(query.handle_query, {"species": [{"name": "crow", "count": 1}]})
+    assert sorted(result["id"] for result in body["results"]) == _expected_query([("crow", 1)])
+    body = _call(query.handle_find, {"species": [{"name": "crow"}]})
+    assert sorted(result["id"] for result in body["results"]) == _expected_find(["crow"])